@@ -1,32 +1,41 @@
-from logging import root
-import re
-import sqlite3
-import hashlib
+import startup
+import argparse
+import os
+from datetime import date, timedelta
 from tkinter import ttk 
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import simpledialog
-from PIL import Image, ImageTk
-from datetime import datetime
-
-DB_NAME = "bus_service.db"
-
-# Utility Functions
-def get_connection():
-    """Establish a connection to the database."""
-    return sqlite3.connect(DB_NAME)
-
-def hash_password(password):
-    """Hash a password for secure storage."""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def validate_user(email, password):
-    """Validate a user login."""
-    hashed_password = hash_password(password)
-    with get_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, hashed_password))
-        return cur.fetchone()
+from tkinter import filedialog
+startup.mark("import tkinter")
+from database import init_db
+from db_executor import DBExecutor
+import connection_pool
+import instrumentation
+from instrumentation import timed
+startup.mark("import database layer")
+# Login and signup need the service layer; modules only used from the menus
+# (archive, backup, bulk_io, search, seat_generator, reports and their
+# widgets) are imported by their handlers on first use.
+import booking
+import services
+startup.mark("import services")
+from live_list import LiveListbox
+
+SEARCH_DEBOUNCE_MS = 250
+MAINTENANCE_INTERVAL_MS = 60 * 60 * 1000  # archive old trips and vacuum hourly
+
+METRICS_FILE = os.environ.get("BUS_METRICS_FILE", os.path.join(".cache", "metrics.json"))
+
+# Button/menu handlers whose latency is recorded (see instrumentation.py)
+HANDLERS = (
+    "login_action", "signup_action", "view_all_details", "manage_buses",
+    "import_buses", "export_buses", "add_bus", "update_bus", "delete_bus",
+    "manage_routes", "manage_drivers", "fetch_drivers", "add_driver",
+    "update_driver", "delete_driver", "assign_driver", "auto_roster", "manage_tickets", "generate_seats",
+    "fetch_tickets", "add_ticket", "update_ticket", "delete_ticket",
+    "view_all_buses", "prebook_bus", "export_metrics", "backup_now", "reprice_seats",
+)
 
 class BusAppGUI:
     def __init__(self, root):
@@ -35,14 +44,21 @@ class BusAppGUI:
         self.root.geometry("800x500")
         self.root.resizable(False, False)
 
+        # Database work runs off the Tk thread; results come back via root.after
+        self.db = DBExecutor(self.root)
+        self.session = None
+        instrumentation.instrument(self, HANDLERS)
+        self.root.after(MAINTENANCE_INTERVAL_MS, self.run_maintenance)
+
         # Set up the background image
         self.canvas = tk.Canvas(self.root, width=800, height=500)
         self.canvas.pack()
 
-        self.bg_image = Image.open("bus_service_image.jpg")
-        self.bg_image = self.bg_image.resize((800, 500), Image.Resampling.LANCZOS)
-        self.bg_image_tk = ImageTk.PhotoImage(self.bg_image)
-        self.canvas.create_image(0, 0, anchor="nw", image=self.bg_image_tk)
+        # Pre-resized and cached on first launch, so PIL is not needed here
+        self.bg_image_tk = startup.background_image(self.root, "bus_service_image.jpg", (800, 500))
+        if self.bg_image_tk is not None:
+            self.canvas.create_image(0, 0, anchor="nw", image=self.bg_image_tk)
+        startup.mark("background loaded")
 
         # Login Frame
         self.login_frame = tk.Frame(self.root, bg='white', bd=5)
@@ -59,6 +75,15 @@ class BusAppGUI:
         tk.Button(self.login_frame, text="Login", command=self.login_action).grid(row=2, columnspan=2, pady=20)
         tk.Button(self.root, text="Sign Up", command=self.show_signup, bg='lightblue', width=10).place(x=520, y=420)
 
+    def run_maintenance(self):
+        """Move finished trips to the archive and shrink the file, off the Tk thread."""
+        import archive
+
+        self.db.submit(archive.maintain, key="maintenance", quiet=True,
+                       on_error=lambda error: messagebox.showwarning(
+                           "Maintenance", f"Scheduled maintenance failed: {error}\nIt will be retried in an hour."))
+        self.root.after(MAINTENANCE_INTERVAL_MS, self.run_maintenance)
+
     def login_action(self):
         """Handle login action."""
         email = self.email_entry.get().strip()
@@ -68,17 +93,21 @@ class BusAppGUI:
             messagebox.showerror("Error", "Please fill out both email and password.")
             return
 
-        user = validate_user(email, password)
-        if user:
-            messagebox.showinfo("Login Success", f"Welcome {user[1]}!")
-            role = user[5]
-            self.login_frame.pack_forget()
-            if role == 'admin':
-                self.admin_menu()
+        def show_result(user):
+            if user:
+                self.session = user["token"]
+                messagebox.showinfo("Login Success", f"Welcome {user['name']}!")
+                role = user["role"]
+                self.login_frame.pack_forget()
+                if role == 'admin':
+                    self.admin_menu()
+                else:
+                    self.user_menu(user["user_id"])
             else:
-                self.user_menu(user[0])
-        else:
-            messagebox.showerror("Invalid Credentials", "Incorrect email or password. Please try again.")
+                messagebox.showerror("Invalid Credentials", "Incorrect email or password. Please try again.")
+
+        # Password hashing is deliberately slow, so keep it off the Tk thread
+        self.db.submit(services.login, email, password, on_done=show_result, key="login")
 
     def show_signup(self):
         """Show the signup window."""
@@ -114,17 +143,16 @@ class BusAppGUI:
             messagebox.showerror("Error", "All fields are required.")
             return
 
-        hashed_password = hash_password(password)
-        with get_connection() as conn:
-            cur = conn.cursor()
-            try:
-                cur.execute("INSERT INTO users (name, email, phone, password) VALUES (?, ?, ?, ?)", 
-                            (name, email, phone, hashed_password))
-                conn.commit()
-                messagebox.showinfo("Signup Successful", "You have successfully signed up.")
-                self.signup_window.destroy()
-            except sqlite3.IntegrityError:
-                messagebox.showerror("Error", "Email already exists. Please choose another one.")
+        def signed_up(user_id):
+            messagebox.showinfo("Signup Successful", "You have successfully signed up.")
+            self.signup_window.destroy()
+
+        def failed(error):
+            messagebox.showerror("Error", str(error))
+
+        # Hashing the new password is slow on purpose; run it on a worker
+        self.db.submit(services.signup, name, email, phone, password,
+                       on_done=signed_up, on_error=failed, widget=self.signup_window)
 
     def admin_menu(self):
         """Admin menu."""
@@ -153,6 +181,9 @@ class BusAppGUI:
             ("Manage Routes", self.manage_routes),
             ("Manage Drivers", self.manage_drivers),
             ("Manage Tickets", self.manage_tickets),
+            ("Export Metrics", self.export_metrics),
+            ("Reprice Seats", self.reprice_seats),
+            ("Back Up Now", self.backup_now),
             ("Logout", self.logout_admin),
         ]
 
@@ -181,7 +212,7 @@ class BusAppGUI:
         button_frame.pack(pady=10)
 
         user_buttons = [
-            ("View All Buses", self.view_all_buses),
+            ("View All Buses", lambda: self.view_all_buses(user_id)),
             ("Prebook a Bus", lambda: self.prebook_bus(user_id)),
             ("Logout", self.logout_user),
         ]
@@ -197,86 +228,21 @@ class BusAppGUI:
 
     def view_all_details(self):
         """Admin function to view detailed system information."""
+        from reports import DETAILS_HEADERS, DETAILS_PAGE_SIZE
+        from virtual_grid import VirtualGrid
+
         # Create a new window to display the details
         details_window = tk.Toplevel(self.root)
         details_window.title("Bus System Details")
         details_window.geometry("1000x800")
 
-        # Create a scrollable frame
-        frame = tk.Frame(details_window)
-        frame.pack(fill=tk.BOTH, expand=True)
-
-        canvas = tk.Canvas(frame)
-        scrollbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas)
-
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
+        # Rows are paged in by bus_id as the user scrolls; only visible rows are drawn
+        grid = VirtualGrid(
+            details_window, DETAILS_HEADERS,
+            fetch_page=lambda after_bus_id: services.details_page(after_bus_id, DETAILS_PAGE_SIZE),
+            db=self.db,
         )
-
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Database Query
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT 
-                    buses.bus_id AS "Bus ID",
-                    buses.name AS "Bus Name",
-                    routes.route_name AS "Route Name",
-                    drivers1.name AS "Driver 1",
-                    drivers2.name AS "Driver 2",
-                    COUNT(tickets.ticket_id) AS "Available Tickets",
-                    schedules.departure_date || ' ' || schedules.departure_time AS "Departure Schedule",
-                    schedules.arrival_time AS "Arrival Time"
-                FROM buses
-                LEFT JOIN routes ON buses.route_id = routes.route_id
-                LEFT JOIN drivers AS drivers1 ON buses.driver_id1 = drivers1.driver_id
-                LEFT JOIN drivers AS drivers2 ON buses.driver_id2 = drivers2.driver_id
-                LEFT JOIN tickets ON buses.bus_id = tickets.bus_id AND tickets.status = 'unsold'
-                LEFT JOIN schedules ON buses.bus_id = schedules.bus_id
-                GROUP BY 
-                    buses.bus_id, 
-                    buses.name, 
-                    routes.route_name, 
-                    drivers1.name, 
-                    drivers2.name, 
-                    schedules.departure_date, 
-                    schedules.departure_time, 
-                    schedules.arrival_time
-                ORDER BY buses.bus_id;
-            """)
-            rows = cur.fetchall()
-
-        # Table Headers
-        headers = [
-            "Bus ID", "Bus Name", "Route Name", "Driver 1", "Driver 2",
-            "Available Tickets", "Departure Schedule", "Arrival Time"
-        ]
-        for col_num, header in enumerate(headers):
-            header_label = tk.Label(
-                scrollable_frame, text=header, font=('Arial', 12, 'bold'), bg='lightblue',
-                borderwidth=1, relief="solid", anchor="center"
-            )
-            header_label.grid(row=0, column=col_num, sticky="nsew", padx=1, pady=1)
-
-        # Populate the Table with Data
-        for row_num, row in enumerate(rows, start=1):
-            for col_num, cell in enumerate(row):
-                cell_label = tk.Label(
-                    scrollable_frame, text=cell if cell is not None else "N/A", font=('Arial', 10),
-                    borderwidth=1, relief="solid", anchor="center"
-                )
-                cell_label.grid(row=row_num, column=col_num, sticky="nsew", padx=1, pady=1)
-
-        # Set column widths and uniform sizing
-        for col_num in range(len(headers)):
-            scrollable_frame.grid_columnconfigure(col_num, minsize=120)
+        grid.pack(fill=tk.BOTH, expand=True)
 
         # Add Close and Export Buttons
         button_frame = tk.Frame(details_window)
@@ -290,16 +256,61 @@ class BusAppGUI:
         """Admin function to manage buses."""
         self.manage_buses_window = tk.Toplevel(self.root)
         self.manage_buses_window.title("Manage Buses")
-        self.manage_buses_window.geometry("400x300")
+        self.manage_buses_window.geometry("400x400")
         self.manage_buses_window.resizable(False, False)
 
     # Buttons for CRUD Operations
-        actions = [("Add Bus", self.add_bus), ("Update Bus", self.update_bus), ("Delete Bus", self.delete_bus)]
+        actions = [("Add Bus", self.add_bus), ("Update Bus", self.update_bus), ("Delete Bus", self.delete_bus),
+                   ("Import Buses", self.import_buses), ("Export Buses", self.export_buses)]
         for action, command in actions:
             tk.Button(
             self.manage_buses_window, text=action, command=command, width=20
         ).pack(pady=10)
 
+    def import_buses(self):
+        """Load buses, routes and schedules from a CSV or JSONL file."""
+        import bulk_io
+
+        path = filedialog.askopenfilename(
+            parent=self.manage_buses_window, title="Import Buses",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+
+        def show_result(result):
+            summary = (f"{result.buses} buses, {result.routes} routes and "
+                       f"{result.schedules} schedules imported from {result.rows} rows.")
+            if result.errors:
+                shown = "\n".join(f"Line {line}: {message}" for line, message in result.errors[:10])
+                more = f"\n...and {len(result.errors) - 10} more." if len(result.errors) > 10 else ""
+                messagebox.showwarning("Import Finished With Errors",
+                                       f"{summary}\n\nSkipped rows:\n{shown}{more}")
+            else:
+                messagebox.showinfo("Import Finished", summary)
+
+        def show_error(error):
+            messagebox.showerror("Import Failed", str(error))
+
+        self.db.submit(bulk_io.import_file, path, on_done=show_result, on_error=show_error, key="bulk_io")
+
+    def export_buses(self):
+        """Write every bus schedule to a CSV or JSONL file."""
+        import bulk_io
+
+        path = filedialog.asksaveasfilename(
+            parent=self.manage_buses_window, title="Export Buses", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")],
+        )
+        if not path:
+            return
+
+        self.db.submit(
+            bulk_io.export_file, path, key="bulk_io",
+            on_done=lambda count: messagebox.showinfo("Export Finished", f"{count} rows written to {path}."),
+            on_error=lambda error: messagebox.showerror("Export Failed", str(error)),
+        )
+
     def validate_inputs(entries, validators):
         """Validate inputs against provided validators."""
         for entry, validator in zip(entries, validators):
@@ -320,14 +331,15 @@ class BusAppGUI:
         """Admin function to add a new bus."""
         self.add_bus_window = tk.Toplevel(self.manage_buses_window)
         self.add_bus_window.title("Add Bus")
-        self.add_bus_window.geometry("400x500")
+        self.add_bus_window.geometry("450x580")
         self.add_bus_window.resizable(False, False)
 
         labels = [
             "Bus Name:", "Bus Number:", "Ticket Price:", "Capacity:",
             "Route Name:", "Stops (comma-separated):", "Driver ID:",
             "Co-Driver ID (optional):", "Departure Date (YYYY-MM-DD):",
-            "Departure Time (HH:MM):", "Arrival Time (HH:MM):"
+            "Departure Time (HH:MM):", "Arrival Time (HH:MM):",
+            "Repeats (e.g. Mon-Fri, optional):", "Repeat Until (YYYY-MM-DD, optional):"
         ]
         entries = []
        
@@ -339,53 +351,21 @@ class BusAppGUI:
             entry.grid(row=i, column=1, padx=10, pady=5)
             entries.append(entry)
 
+        @timed("save_bus")
         def save_bus():
             """Save the bus details into the database."""
 
             # Extract values from fields
-            values = [entry.get() for entry in entries]
-            bus_name, bus_number, ticket_price, capacity, route_name, stops, driver_id, co_driver_id, departure_date, departure_time, arrival_time = values
-            ticket_price, capacity = float(ticket_price), int(capacity)
-            driver_id = int(driver_id)
-            co_driver_id = int(co_driver_id) if co_driver_id else None
-
-            try:
-                with get_connection() as conn:
-                    cur = conn.cursor()
-
-                    # Insert route
-                    cur.execute("INSERT INTO routes (route_name, stops) VALUES (?, ?)", (route_name, stops))
-                    route_id = cur.lastrowid
-
-                    # Insert bus
-                    cur.execute(
-                        """
-                        INSERT INTO buses (name, number, route_id, ticket_price, capacity, driver_id1, driver_id2)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (bus_name, bus_number, route_id, ticket_price, capacity, driver_id, co_driver_id)
-                    )
-                    bus_id = cur.lastrowid
-
-                    # Insert schedule
-                    cur.execute(
-                        """
-                        INSERT INTO schedules (bus_id, route_id, departure_date, departure_time, arrival_time)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        (bus_id, route_id, departure_date, departure_time, arrival_time)
-                    )
-
-                    # Assign drivers
-                    cur.execute("INSERT INTO driver_assignments (bus_id, driver_id) VALUES (?, ?)", (bus_id, driver_id))
-                    if co_driver_id:
-                        cur.execute("INSERT INTO driver_assignments (bus_id, driver_id) VALUES (?, ?)", (bus_id, co_driver_id))
-
-                    conn.commit()
-                    messagebox.showinfo("Success", "Bus added successfully!")
-                    self.add_bus_window.destroy()
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to add bus: {str(e)}")
+            fields = dict(zip(services.BUS_FIELDS + services.REPEAT_FIELDS, (entry.get() for entry in entries)))
+
+            def added(bus_id):
+                messagebox.showinfo("Success", "Bus added successfully!")
+                self.add_bus_window.destroy()
+
+            self.db.submit(
+                services.add_bus, fields, on_done=added, widget=self.add_bus_window,
+                on_error=lambda error: messagebox.showerror("Error", f"Failed to add bus: {error}"),
+            )
 
         tk.Button(self.add_bus_window, text="Save", command=save_bus).grid(row=len(labels), columnspan=2, pady=20)
 
@@ -397,125 +377,78 @@ class BusAppGUI:
         self.update_bus_window.title("Update Bus")
         self.update_bus_window.geometry("600x600")
         self.update_bus_window.resizable(False, False)
+        window = self.update_bus_window
 
-        # Fetch buses from the database
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT bus_id, name FROM buses")
-            buses = cur.fetchall()
-
-        if not buses:
-            messagebox.showinfo("No Buses", "There are no buses available to update.")
-            self.update_bus_window.destroy()
-            return
-
-        bus_names = [bus[1] for bus in buses]
-        selected_bus = tk.StringVar(value=bus_names[0])
-
-        # Dropdown to select bus
-        tk.Label(self.update_bus_window, text="Select Bus to Update:").grid(row=0, column=0, padx=10, pady=5)
-        bus_dropdown = tk.OptionMenu(self.update_bus_window, selected_bus, *bus_names)
-        bus_dropdown.grid(row=0, column=1, padx=10, pady=5)
-
-        # Fields for updating details
-        labels = [
-            "Bus Name:", "Bus Number:", "Ticket Price:", "Capacity:",
-            "Route Name:", "Stops (comma-separated):", "Driver ID:",
-            "Co-Driver ID (optional):", "Departure Date (YYYY-MM-DD):",
-            "Departure Time (HH:MM):", "Arrival Time (HH:MM):"
-        ]
-        entries = []
-
-        for i, label_text in enumerate(labels, start=1):
-            tk.Label(self.update_bus_window, text=label_text).grid(row=i, column=0, padx=10, pady=5)
-            entry = tk.Entry(self.update_bus_window)
-            entry.grid(row=i, column=1, padx=10, pady=5)
-            entries.append(entry)
+        def show_form(buses):
+            if not buses:
+                messagebox.showinfo("No Buses", "There are no buses available to update.")
+                window.destroy()
+                return
 
-        def fetch_bus_details():
-            """Fetch and populate details for the selected bus."""
-            bus_name = selected_bus.get()
-            bus_id = next(bus[0] for bus in buses if bus[1] == bus_name)
-
-            with get_connection() as conn:
-                cur = conn.cursor()
-
-                # Fetch bus details
-                cur.execute(
-                    """
-                    SELECT b.name, b.number, b.ticket_price, b.capacity,
-                        r.route_name, r.stops, b.driver_id1, b.driver_id2,
-                        s.departure_date, s.departure_time, s.arrival_time
-                    FROM buses b
-                    JOIN routes r ON b.route_id = r.route_id
-                    JOIN schedules s ON b.bus_id = s.bus_id
-                    WHERE b.bus_id = ?
-                    """,
-                    (bus_id,)
-                )
-                details = cur.fetchone()
+            bus_names = [bus[1] for bus in buses]
+            selected_bus = tk.StringVar(value=bus_names[0])
+
+            # Dropdown to select bus
+            tk.Label(window, text="Select Bus to Update:").grid(row=0, column=0, padx=10, pady=5)
+            bus_dropdown = tk.OptionMenu(window, selected_bus, *bus_names)
+            bus_dropdown.grid(row=0, column=1, padx=10, pady=5)
+
+            # Fields for updating details
+            labels = [
+                "Bus Name:", "Bus Number:", "Ticket Price:", "Capacity:",
+                "Route Name:", "Stops (comma-separated):", "Driver ID:",
+                "Co-Driver ID (optional):", "Departure Date (YYYY-MM-DD):",
+                "Departure Time (HH:MM):", "Arrival Time (HH:MM):"
+            ]
+            entries = []
+
+            for i, label_text in enumerate(labels, start=1):
+                tk.Label(window, text=label_text).grid(row=i, column=0, padx=10, pady=5)
+                entry = tk.Entry(window)
+                entry.grid(row=i, column=1, padx=10, pady=5)
+                entries.append(entry)
+
+            def selected_bus_id():
+                bus_name = selected_bus.get()
+                return next(bus[0] for bus in buses if bus[1] == bus_name)
 
-            if details:
-                for entry, value in zip(entries, details):
+            def fill_entries(details):
+                for entry, field in zip(entries, services.BUS_FIELDS):
+                    value = details[field]
                     entry.delete(0, tk.END)
-                    entry.insert(0, str(value))
+                    entry.insert(0, "" if value is None else str(value))
 
-        def save_changes():
-            """Update bus details in the database."""
-            try:
-                bus_name = selected_bus.get()
-                bus_id = next(bus[0] for bus in buses if bus[1] == bus_name)
+            def fetch_bus_details():
+                """Fetch and populate details for the selected bus."""
+                self.db.submit(
+                    services.get_bus, selected_bus_id(), on_done=fill_entries, key="update_bus_details",
+                    widget=window, on_error=lambda error: messagebox.showerror("Error", str(error)),
+                )
 
+            @timed("save_bus_changes")
+            def save_changes():
+                """Update bus details in the database."""
                 # Collect updated details
-                updated_details = [entry.get() for entry in entries]
-                (
-                    new_name, new_number, ticket_price, capacity, route_name, stops,
-                    driver_id, co_driver_id, departure_date, departure_time, arrival_time
-                ) = updated_details
-
-                # Validate inputs
-                ticket_price, capacity = float(ticket_price), int(capacity)
-                driver_id = int(driver_id)
-                co_driver_id = int(co_driver_id) if co_driver_id else None
-
-                with get_connection() as conn:
-                    cur = conn.cursor()
-
-                    # Update bus details
-                    cur.execute(
-                        """
-                        UPDATE buses
-                        SET name = ?, number = ?, ticket_price = ?, capacity = ?,
-                            driver_id1 = ?, driver_id2 = ?
-                        WHERE bus_id = ?
-                        """,
-                        (new_name, new_number, ticket_price, capacity, driver_id, co_driver_id, bus_id)
-                    )
-
-                    # Update route
-                    cur.execute(
-                        "UPDATE routes SET route_name = ?, stops = ? WHERE route_id = (SELECT route_id FROM buses WHERE bus_id = ?)",
-                        (route_name, stops, bus_id)
-                    )
-
-                    # Update schedule
-                    cur.execute(
-                        "UPDATE schedules SET departure_date = ?, departure_time = ?, arrival_time = ? WHERE bus_id = ?",
-                        (departure_date, departure_time, arrival_time, bus_id)
-                    )
-
-                    conn.commit()
+                fields = dict(zip(services.BUS_FIELDS, (entry.get() for entry in entries)))
+
+                def updated(_):
                     messagebox.showinfo("Success", "Bus details updated successfully!")
-                    self.update_bus_window.destroy()
+                    window.destroy()
 
-            except Exception as e:
-                messagebox.showinfo("Success", f"Success", "Bus details updated successfully!")
+                self.db.submit(
+                    services.update_bus, selected_bus_id(), fields, on_done=updated, widget=window,
+                    on_error=lambda error: messagebox.showerror("Error", f"Failed to update bus: {error}"),
+                )
+
+            fetch_button = tk.Button(window, text="Fetch Details", command=fetch_bus_details)
+            fetch_button.grid(row=len(labels) + 1, columnspan=2, pady=10)
 
-        fetch_button = tk.Button(self.update_bus_window, text="Fetch Details", command=fetch_bus_details)
-        fetch_button.grid(row=len(labels) + 1, columnspan=2, pady=10)
+            save_button = tk.Button(window, text="Save Changes", command=save_changes)
+            save_button.grid(row=len(labels) + 2, columnspan=2, pady=10)
 
-        save_button = tk.Button(self.update_bus_window, text="Save Changes", command=save_changes)
-        save_button.grid(row=len(labels) + 2, columnspan=2, pady=10)
+        # Fetch buses from the database
+        self.db.submit(services.list_bus_names, on_done=show_form, widget=window,
+                       on_error=lambda error: messagebox.showerror("Error", str(error)))
 
 
 
@@ -525,47 +458,43 @@ class BusAppGUI:
         self.delete_bus_window = tk.Toplevel(self.root)
         self.delete_bus_window.title("Delete Bus")
         self.delete_bus_window.geometry("400x300")
+        window = self.delete_bus_window
 
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT bus_id, name FROM buses")
-            buses = cur.fetchall()
+        def show_form(buses):
+            bus_names = [bus[1] for bus in buses]
+            selected_bus = tk.StringVar()
+            selected_bus.set(bus_names[0] if bus_names else "No buses available")
 
-        bus_names = [bus[1] for bus in buses]
-        selected_bus = tk.StringVar()
-        selected_bus.set(bus_names[0] if bus_names else "No buses available")
+            tk.Label(window, text="Select Bus to Delete:").pack(pady=5)
+            bus_dropdown = tk.OptionMenu(window, selected_bus, *bus_names)
+            bus_dropdown.pack(pady=5)
 
-        tk.Label(self.delete_bus_window, text="Select Bus to Delete:").pack(pady=5)
-        bus_dropdown = tk.OptionMenu(self.delete_bus_window, selected_bus, *bus_names)
-        bus_dropdown.pack(pady=5)
+            def delete_selected_bus():
+                if not buses:
+                    messagebox.showerror("Error", "No buses to delete.")
+                    return
 
-        def delete_selected_bus():
-            if not buses:
-                messagebox.showerror("Error", "No buses to delete.")
-                return
+                bus_name = selected_bus.get()
+                bus_id = next((bus[0] for bus in buses if bus[1] == bus_name), None)
 
-            bus_name = selected_bus.get()
-            bus_id = next((bus[0] for bus in buses if bus[1] == bus_name), None)
+                if not bus_id:
+                    messagebox.showerror("Error", "Failed to fetch bus ID.")
+                    return
 
-            if not bus_id:
-                messagebox.showerror("Error", "Failed to fetch bus ID.")
-                return
+                def deleted(_):
+                    messagebox.showinfo("Success", f"Bus '{bus_name}' deleted successfully!")
+                    window.destroy()
 
-            try:
-                with get_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("DELETE FROM buses WHERE bus_id = ?", (bus_id,))
-                    cur.execute("DELETE FROM schedules WHERE bus_id = ?", (bus_id,))
-                    cur.execute("DELETE FROM driver_assignments WHERE bus_id = ?", (bus_id,))
-                    conn.commit()
+                self.db.submit(
+                    services.delete_bus, bus_id, on_done=deleted, widget=window,
+                    on_error=lambda error: messagebox.showerror("Error", str(error)),
+                )
 
-                messagebox.showinfo("Success", f"Bus '{bus_name}' deleted successfully!")
-                self.delete_bus_window.destroy()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            delete_button = tk.Button(window, text="Delete Bus", command=delete_selected_bus)
+            delete_button.pack(pady=20)
 
-        delete_button = tk.Button(self.delete_bus_window, text="Delete Bus", command=delete_selected_bus)
-        delete_button.pack(pady=20)
+        self.db.submit(services.list_bus_names, on_done=show_form, widget=window,
+                       on_error=lambda error: messagebox.showerror("Error", str(error)))
 
         
             
@@ -581,24 +510,13 @@ class BusAppGUI:
         # Title label
         tk.Label(self.manage_routes_window, text="Manage Routes", font=("Arial", 16)).pack(pady=10)
 
-        # Fetch all routes from the database
-        def fetch_routes():
-            with get_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT route_id, route_name, stops FROM routes")
-                return cur.fetchall()
-
-        # Refresh the route list display
-        def refresh_route_list():
-            routes_listbox.delete(0, tk.END)
-            routes = fetch_routes()
-            for route in routes:
-                routes_listbox.insert(tk.END, f"{route[1]} - Stops: {route[2]}")
-
-        # Route listbox to display routes
-        routes_listbox = tk.Listbox(self.manage_routes_window, width=70, height=15)
+        # Route listbox; patched in place as routes change
+        routes_listbox = LiveListbox(
+            self.manage_routes_window, self.db, services.route_changes,
+            lambda route: f"{route[1]} - Stops: {route[2]}", key="routes", width=70, height=15,
+        )
         routes_listbox.pack(pady=10)
-        refresh_route_list()
+        refresh_route_list = routes_listbox.refresh
 
         # Add new route functionality
         def add_route():
@@ -623,16 +541,15 @@ class BusAppGUI:
                     messagebox.showerror("Error", "All fields are required.")
                     return
 
-                with get_connection() as conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("INSERT INTO routes (route_name, stops) VALUES (?, ?)", (route_name, stops))
-                        conn.commit()
-                        messagebox.showinfo("Success", "Route added successfully!")
-                        add_route_window.destroy()
-                        refresh_route_list()
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to add route: {str(e)}")
+                def added(route_id):
+                    messagebox.showinfo("Success", "Route added successfully!")
+                    add_route_window.destroy()
+                    refresh_route_list()
+
+                self.db.submit(
+                    services.add_route, route_name, stops, on_done=added, widget=add_route_window,
+                    on_error=lambda error: messagebox.showerror("Error", f"Failed to add route: {error}"),
+                )
 
             tk.Button(add_route_window, text="Save", command=save_new_route).pack(pady=10)
 
@@ -643,7 +560,7 @@ class BusAppGUI:
                 messagebox.showerror("Error", "Please select a route to update.")
                 return
 
-            selected_route = fetch_routes()[selected_index[0]]
+            selected_route = routes_listbox.rows[selected_index[0]]
             route_id, route_name, stops = selected_route
 
             update_route_window = tk.Toplevel(self.manage_routes_window)
@@ -669,19 +586,16 @@ class BusAppGUI:
                     messagebox.showerror("Error", "All fields are required.")
                     return
 
-                with get_connection() as conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute(
-                            "UPDATE routes SET route_name = ?, stops = ? WHERE route_id = ?",
-                            (updated_name, updated_stops, route_id),
-                        )
-                        conn.commit()
-                        messagebox.showinfo("Success", "Route updated successfully!")
-                        update_route_window.destroy()
-                        refresh_route_list()
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to update route: {str(e)}")
+                def updated(_):
+                    messagebox.showinfo("Success", "Route updated successfully!")
+                    update_route_window.destroy()
+                    refresh_route_list()
+
+                self.db.submit(
+                    services.update_route, route_id, updated_name, updated_stops,
+                    on_done=updated, widget=update_route_window,
+                    on_error=lambda error: messagebox.showerror("Error", f"Failed to update route: {error}"),
+                )
 
             tk.Button(update_route_window, text="Save Changes", command=save_updated_route).pack(pady=10)
 
@@ -692,19 +606,18 @@ class BusAppGUI:
                 messagebox.showerror("Error", "Please select a route to delete.")
                 return
 
-            selected_route = fetch_routes()[selected_index[0]]
+            selected_route = routes_listbox.rows[selected_index[0]]
             route_id, route_name, _ = selected_route
 
             if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete route '{route_name}'?"):
-                with get_connection() as conn:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("DELETE FROM routes WHERE route_id = ?", (route_id,))
-                        conn.commit()
-                        messagebox.showinfo("Success", "Route deleted successfully!")
-                        refresh_route_list()
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to delete route: {str(e)}")
+                def deleted(_):
+                    messagebox.showinfo("Success", "Route deleted successfully!")
+                    refresh_route_list()
+
+                self.db.submit(
+                    services.delete_route, route_id, on_done=deleted, widget=self.manage_routes_window,
+                    on_error=lambda error: messagebox.showerror("Error", f"Failed to delete route: {error}"),
+                )
 
         # Buttons for managing routes
         buttons_frame = tk.Frame(self.manage_routes_window)
@@ -724,19 +637,19 @@ class BusAppGUI:
         # Create a new window for managing drivers
         self.driver_window = tk.Toplevel(self.root)
         self.driver_window.title("Manage Drivers")
-        self.driver_window.geometry("600x400")
+        self.driver_window.geometry("600x520")
         self.driver_window.resizable(False, False)
 
         # Title Label
         tk.Label(self.driver_window, text="Manage Drivers", font=("Arial", 16)).pack(pady=10)
 
-        # List of drivers
-        self.driver_listbox = tk.Listbox(self.driver_window, width=50, height=10)
+        # List of drivers; fetched here and patched in place as drivers change
+        self.driver_listbox = LiveListbox(
+            self.driver_window, self.db, services.driver_changes,
+            lambda driver: f"{driver[1]} - {driver[2]}", key="drivers", width=50, height=10,
+        )  # name - license_number
         self.driver_listbox.pack(pady=10)
 
-        # Fetch drivers and display them
-        self.fetch_drivers()
-
         # Add Driver Button
         add_driver_button = tk.Button(self.driver_window, text="Add Driver", font=("Arial", 12), command=self.add_driver)
         add_driver_button.pack(pady=10)
@@ -749,19 +662,15 @@ class BusAppGUI:
         delete_driver_button = tk.Button(self.driver_window, text="Delete Driver", font=("Arial", 12), command=self.delete_driver)
         delete_driver_button.pack(pady=10)
 
-    def fetch_drivers(self):
-        """Fetch and display drivers."""
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT driver_id, name, license_number FROM drivers")
-            drivers = cur.fetchall()
-
-        # Clear the listbox
-        self.driver_listbox.delete(0, tk.END)
+        # Rostering: one trip for the selected driver, or a whole date range
+        roster_frame = tk.Frame(self.driver_window)
+        roster_frame.pack(pady=10)
+        tk.Button(roster_frame, text="Assign to Trip", font=("Arial", 12), command=self.assign_driver).grid(row=0, column=0, padx=10)
+        tk.Button(roster_frame, text="Auto Roster", font=("Arial", 12), command=self.auto_roster).grid(row=0, column=1, padx=10)
 
-        # Populate the listbox with driver names
-        for driver in drivers:
-            self.driver_listbox.insert(tk.END, f"{driver[1]} - {driver[2]}")  # name - license_number
+    def fetch_drivers(self):
+        """Apply driver changes since the list was last refreshed."""
+        self.driver_listbox.refresh()
 
     def add_driver(self):
         """Add a new driver."""
@@ -771,173 +680,319 @@ class BusAppGUI:
         address = simpledialog.askstring("Add Driver", "Enter driver's address:")
 
         if name and license_number and phone and address:
-            with get_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT INTO drivers (name, license_number, phone, address)
-                    VALUES (?, ?, ?, ?)
-                """, (name, license_number, phone, address))
-                conn.commit()
+            def added(driver_id):
+                messagebox.showinfo("Driver Added", "Driver has been successfully added.")
+                self.fetch_drivers()
 
-            messagebox.showinfo("Driver Added", "Driver has been successfully added.")
-            self.fetch_drivers()
+            self.db.submit(
+                services.add_driver, name, license_number, phone, address,
+                on_done=added, widget=self.driver_window,
+                on_error=lambda error: messagebox.showerror("Error", str(error)),
+            )
 
     def update_driver(self):
         """Update an existing driver."""
         selected_driver = self.driver_listbox.curselection()
         if selected_driver:
-            driver_info = self.driver_listbox.get(selected_driver[0]).split(" - ")
-            driver_name = driver_info[0]
-            
-            with get_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT driver_id, name, license_number, phone, address FROM drivers WHERE name = ?", (driver_name,))
-                driver = cur.fetchone()
-
-            # Ask for updated details
-            new_name = simpledialog.askstring("Update Driver", f"Enter new name (current: {driver[1]}):", initialvalue=driver[1])
-            new_license = simpledialog.askstring("Update Driver", f"Enter new license number (current: {driver[2]}):", initialvalue=driver[2])
-            new_phone = simpledialog.askstring("Update Driver", f"Enter new phone number (current: {driver[3]}):", initialvalue=driver[3])
-            new_address = simpledialog.askstring("Update Driver", f"Enter new address (current: {driver[4]}):", initialvalue=driver[4])
-
-            # Update the database
-            with get_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    UPDATE drivers
-                    SET name = ?, license_number = ?, phone = ?, address = ?
-                    WHERE driver_id = ?
-                """, (new_name, new_license, new_phone, new_address, driver[0]))
-                conn.commit()
-
-            messagebox.showinfo("Driver Updated", "Driver details have been successfully updated.")
-            self.fetch_drivers()
+            driver_id = self.driver_listbox.rows[selected_driver[0]][0]
+
+            def ask(driver):
+                # Ask for updated details
+                new_name = simpledialog.askstring("Update Driver", f"Enter new name (current: {driver[1]}):", initialvalue=driver[1])
+                new_license = simpledialog.askstring("Update Driver", f"Enter new license number (current: {driver[2]}):", initialvalue=driver[2])
+                new_phone = simpledialog.askstring("Update Driver", f"Enter new phone number (current: {driver[3]}):", initialvalue=driver[3])
+                new_address = simpledialog.askstring("Update Driver", f"Enter new address (current: {driver[4]}):", initialvalue=driver[4])
+
+                def updated(_):
+                    messagebox.showinfo("Driver Updated", "Driver details have been successfully updated.")
+                    self.fetch_drivers()
+
+                # Update the database
+                self.db.submit(
+                    services.update_driver, driver[0], new_name, new_license, new_phone, new_address,
+                    on_done=updated, widget=self.driver_window,
+                    on_error=lambda error: messagebox.showerror("Error", str(error)),
+                )
+
+            def failed(error):
+                messagebox.showerror("Error", str(error))
+                self.fetch_drivers()
+
+            self.db.submit(services.get_driver, driver_id, on_done=ask, on_error=failed,
+                           key="update_driver", widget=self.driver_window)
+
+    def assign_driver(self):
+        """Put the selected driver on one bus trip, checked against their other shifts."""
+        driver = self.driver_listbox.selected_row()
+        if driver is None:
+            messagebox.showinfo("Assign to Trip", "Select a driver first.", parent=self.driver_window)
+            return
+        bus_id = simpledialog.askinteger("Assign to Trip", "Bus ID:", parent=self.driver_window)
+        departure = simpledialog.askstring("Assign to Trip", "Departure (YYYY-MM-DD HH:MM):", parent=self.driver_window)
+        if bus_id is None or not departure:
+            return
+        self.db.submit(
+            services.assign_driver, driver[0], bus_id, departure,
+            on_done=lambda shift_id: messagebox.showinfo(
+                "Driver Assigned", f"{driver[1]} drives bus {bus_id} at {departure}.", parent=self.driver_window),
+            on_error=lambda error: messagebox.showerror("Error", str(error), parent=self.driver_window),
+            widget=self.driver_window,
+        )
+
+    def auto_roster(self):
+        """Give a driver to every trip without one in a date range (default: the next 7 days)."""
+        today = date.today()
+        start = simpledialog.askstring("Auto Roster", "From (YYYY-MM-DD):", initialvalue=today.isoformat(),
+                                       parent=self.driver_window)
+        end = simpledialog.askstring("Auto Roster", "To (YYYY-MM-DD):",
+                                     initialvalue=(today + timedelta(days=6)).isoformat(), parent=self.driver_window)
+        if not start or not end:
+            return
+
+        def show_result(result):
+            message = (f"{result.trips} trip(s): {result.assigned} assigned, "
+                       f"{result.already_covered} already had a driver.")
+            if result.unassigned:
+                message += f"\n{len(result.unassigned)} trip(s) could not be covered without breaking the rest rules."
+            messagebox.showinfo("Auto Roster", message, parent=self.driver_window)
+
+        self.db.submit(
+            services.auto_roster, start, end, on_done=show_result, widget=self.driver_window, key="auto_roster",
+            on_error=lambda error: messagebox.showerror("Error", str(error), parent=self.driver_window),
+        )
 
     def delete_driver(self):
         """Delete a driver."""
         selected_driver = self.driver_listbox.curselection()
         if selected_driver:
-            driver_info = self.driver_listbox.get(selected_driver[0]).split(" - ")
-            driver_name = driver_info[0]
-            
+            driver_id, driver_name, license_number = self.driver_listbox.rows[selected_driver[0]]
+
             confirm_delete = messagebox.askyesno("Delete Driver", f"Are you sure you want to delete driver {driver_name}?")
             if confirm_delete:
-                with get_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("DELETE FROM drivers WHERE name = ?", (driver_name,))
-                    conn.commit()
+                def deleted(_):
+                    messagebox.showinfo("Driver Deleted", "Driver has been successfully deleted.")
+                    self.fetch_drivers()
 
-                messagebox.showinfo("Driver Deleted", "Driver has been successfully deleted.")
-                self.fetch_drivers()
+                def failed(error):
+                    messagebox.showerror("Error", str(error))
+                    self.fetch_drivers()
+
+                self.db.submit(services.delete_driver, driver_id, on_done=deleted, on_error=failed,
+                               widget=self.driver_window)
 
 
 
     def manage_tickets(self):
         """Admin function to manage tickets."""
-        
+        import seat_generator
+        from seat_map_view import SeatMapView
+
         self.ticket_window = tk.Toplevel(self.root)
         self.ticket_window.title("Manage Tickets")
-        self.ticket_window.geometry("600x400")
+        self.ticket_window.geometry("640x620")
         self.ticket_window.resizable(False, False)
 
         tk.Label(self.ticket_window, text="Manage Tickets", font=("Arial", 16)).pack(pady=10)
 
-        # Listbox to show all tickets
-        self.ticket_listbox = tk.Listbox(self.ticket_window, width=50, height=10)
+        self.ticket_tabs = ttk.Notebook(self.ticket_window)
+        self.ticket_tabs.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        # Seat map of one bus (and trip); only changed seats are redrawn as tickets change
+        map_tab = tk.Frame(self.ticket_tabs)
+        self.ticket_tabs.add(map_tab, text="Seat Map")
+        controls = tk.Frame(map_tab)
+        controls.pack(pady=5)
+        tk.Label(controls, text="Bus ID:").pack(side=tk.LEFT)
+        bus_entry = tk.Entry(controls, width=8)
+        bus_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(controls, text="Schedule ID (optional):").pack(side=tk.LEFT)
+        schedule_entry = tk.Entry(controls, width=8)
+        schedule_entry.pack(side=tk.LEFT, padx=5)
+        layout = tk.StringVar(value=seat_generator.DEFAULT_LAYOUT)
+        tk.OptionMenu(controls, layout, *seat_generator.LAYOUTS).pack(side=tk.LEFT, padx=5)
+
+        self.seat_map = SeatMapView(map_tab, self.db, services.trip_seats, key="seat_map", height=330)
+        self.seat_map.pack(fill=tk.BOTH, expand=True, pady=5)
+        legend = "Green: unsold, yellow: held, red: sold, grey: no ticket. Click or drag to select seats."
+        selection_label = tk.Label(map_tab, text=legend)
+        selection_label.pack()
+
+        def show_seats():
+            bus_id, schedule_id = bus_entry.get().strip(), schedule_entry.get().strip()
+            if not bus_id.isdigit() or (schedule_id and not schedule_id.isdigit()):
+                messagebox.showerror("Error", "Bus ID and Schedule ID must be numbers.", parent=self.ticket_window)
+                return
+            self.seat_map.show(int(bus_id), int(schedule_id) if schedule_id else None, layout.get())
+
+        def show_selection(event):
+            rows = self.seat_map.selected_rows()
+            selection_label.config(text=f"{len(rows)} ticket(s) selected, "
+                                        f"{sum(row[4] == 'sold' for row in rows)} sold." if rows else legend)
+
+        tk.Button(controls, text="Show", command=show_seats).pack(side=tk.LEFT, padx=5)
+        bus_entry.bind("<Return>", lambda event: show_seats())
+        self.seat_map.bind("<<SeatSelect>>", show_selection)
+
+        # Listbox to show all tickets; patched in place as tickets change
+        list_tab = tk.Frame(self.ticket_tabs)
+        self.ticket_tabs.add(list_tab, text="All Tickets")
+        self.ticket_listbox = LiveListbox(
+            list_tab, self.db, services.ticket_changes,
+            lambda ticket: f"{ticket[1]} - Seat {ticket[2]} - Status: {ticket[4]}",
+            key="tickets", width=50, height=18,
+        )
         self.ticket_listbox.pack(pady=10)
 
-        self.fetch_tickets()
-
-        add_ticket_button = tk.Button(self.ticket_window, text="Add Ticket", font=("Arial", 12), command=self.add_ticket)
-        add_ticket_button.pack(pady=10)
+        button_frame = tk.Frame(self.ticket_window)
+        button_frame.pack(pady=10)
+        for text, command in (("Add Ticket", self.add_ticket), ("Update Ticket", self.update_ticket),
+                              ("Delete Ticket", self.delete_ticket), ("Generate Seats", self.generate_seats)):
+            tk.Button(button_frame, text=text, font=("Arial", 12), command=command).pack(side=tk.LEFT, padx=5)
+
+    def selected_tickets(self):
+        """Ticket rows selected on the visible tab: seats on the map, or one row of the list."""
+        if self.ticket_tabs.index(self.ticket_tabs.select()) == 0:
+            return self.seat_map.selected_rows()
+        row = self.ticket_listbox.selected_row()
+        return [row] if row else []
+
+    def generate_seats(self):
+        """Create or resync a bus's whole seat inventory in one go."""
+        import seat_generator
+
+        window = tk.Toplevel(self.ticket_window)
+        window.title("Generate Seats")
+        window.resizable(False, False)
+
+        labels = ["Bus ID:", "From Date (YYYY-MM-DD, optional):", "To Date (YYYY-MM-DD, optional):",
+                  "Price Tiers (e.g. 1-2:1.25, optional):"]
+        entries = []
+        for i, label_text in enumerate(labels):
+            tk.Label(window, text=label_text).grid(row=i, column=0, sticky="w", padx=10, pady=5)
+            entry = tk.Entry(window)
+            entry.grid(row=i, column=1, padx=10, pady=5)
+            entries.append(entry)
 
-        update_ticket_button = tk.Button(self.ticket_window, text="Update Ticket", font=("Arial", 12), command=self.update_ticket)
-        update_ticket_button.pack(pady=10)
+        layout = tk.StringVar(value=seat_generator.DEFAULT_LAYOUT)
+        tk.Label(window, text="Seat Layout:").grid(row=len(labels), column=0, sticky="w", padx=10, pady=5)
+        tk.OptionMenu(window, layout, *seat_generator.LAYOUTS).grid(row=len(labels), column=1, padx=10, pady=5)
 
-        delete_ticket_button = tk.Button(self.ticket_window, text="Delete Ticket", font=("Arial", 12), command=self.delete_ticket)
-        delete_ticket_button.pack(pady=10)
+        def show_result(result):
+            if result.trips == 0:
+                messagebox.showinfo("No Trips", "The bus has no schedules in that date range.", parent=window)
+                return
+            messagebox.showinfo(
+                "Seats Generated",
+                f"{result.trips} trip(s): {result.created} seats created, {result.repriced} repriced, "
+                f"{result.removed} removed.",
+                parent=window,
+            )
+            window.destroy()
+            self.fetch_tickets()
 
-    def fetch_tickets(self):
-        """Fetch and display tickets."""
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT tickets.ticket_id, buses.name, tickets.seat_number, tickets.price, tickets.status
-                FROM tickets
-                JOIN buses ON tickets.bus_id = buses.bus_id
-            """)
-            tickets = cur.fetchall()
+        def generate():
+            bus_id, start_date, end_date, tiers = (entry.get() for entry in entries)
+            self.db.submit(
+                services.generate_seats, bus_id, start_date, end_date, layout.get(), tiers,
+                on_done=show_result, widget=window,
+                on_error=lambda error: messagebox.showerror("Error", str(error), parent=window),
+            )
 
-        self.ticket_listbox.delete(0, tk.END)
+        tk.Button(window, text="Generate", command=generate).grid(row=len(labels) + 1, columnspan=2, pady=10)
 
-        for ticket in tickets:
-            self.ticket_listbox.insert(tk.END, f"{ticket[1]} - Seat {ticket[2]} - Status: {ticket[4]}")
+    def fetch_tickets(self):
+        """Apply ticket changes since the list and seat map were last refreshed."""
+        self.ticket_listbox.refresh()
+        self.seat_map.refresh()
 
     def add_ticket(self):
         """Add a new ticket for a bus."""
         bus_id = simpledialog.askinteger("Add Ticket", "Enter Bus ID for the ticket:")
         seat_number = simpledialog.askinteger("Add Ticket", "Enter seat number:")
-        seat_id = f"{bus_id}-{seat_number}"  # Combine bus ID and seat number to generate a unique seat ID
         price = simpledialog.askfloat("Add Ticket", "Enter price for the ticket:")
 
         if bus_id and seat_number and price:
-            with get_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT INTO tickets (bus_id, seat_number, seat_id, price, status)
-                    VALUES (?, ?, ?, ?, 'unsold')
-                """, (bus_id, seat_number, seat_id, price))
-                conn.commit()
-
-            messagebox.showinfo("Ticket Added", "Ticket has been successfully added.")
-            self.fetch_tickets()
+            def added(ticket_id):
+                messagebox.showinfo("Ticket Added", "Ticket has been successfully added.")
+                self.fetch_tickets()
 
-    def update_ticket(self):
-        """Update an existing ticket."""
-        selected_ticket = self.ticket_listbox.curselection()
-        if selected_ticket:
-            ticket_info = self.ticket_listbox.get(selected_ticket[0]).split(" - ")
-            bus_name = ticket_info[0]
+            self.db.submit(
+                services.add_ticket, bus_id, seat_number, price, on_done=added, widget=self.ticket_window,
+                on_error=lambda error: messagebox.showerror("Error", str(error)),
+            )
 
-            new_status = simpledialog.askstring("Update Ticket", f"Enter new status (current: {ticket_info[2]}):", initialvalue=ticket_info[2])
+    def update_ticket(self):
+        """Update the status of the selected tickets."""
+        tickets = self.selected_tickets()
+        if tickets:
+            statuses = {status for _, _, _, _, status in tickets}
+            current = statuses.pop() if len(statuses) == 1 else "mixed"
+            new_status = simpledialog.askstring(
+                "Update Ticket", f"Enter new status for {len(tickets)} ticket(s) (current: {current}):",
+                initialvalue=current if current != "mixed" else "")
 
             if new_status:
-                with get_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("""
-                        UPDATE tickets
-                        SET status = ?
-                        WHERE seat_id = ?
-                    """, (new_status, ticket_info[1]))
-                    conn.commit()
-
-                messagebox.showinfo("Ticket Updated", "Ticket status has been updated.")
-                self.fetch_tickets()
+                new_status = new_status.strip().lower()
+                if new_status not in ("sold", "unsold"):
+                    messagebox.showerror("Error", "Status must be 'sold' or 'unsold'.")
+                    return
+
+                def show_result(results):
+                    failed = [result for result in results if result.status != booking.UPDATED]
+                    if not failed:
+                        messagebox.showinfo("Ticket Updated", f"{len(results)} ticket status(es) updated.")
+                    elif len(results) == 1:
+                        messagebox.showerror("Ticket Not Updated", failed[0].message)
+                    else:
+                        messagebox.showerror(
+                            "Tickets Not Updated",
+                            f"{len(results) - len(failed)} of {len(results)} updated; "
+                            f"the rest changed meanwhile or are gone:\n{failed[0].message}",
+                        )
+                    self.fetch_tickets()
+
+                # Each only applies if nobody changed the ticket since it was listed
+                self.db.submit(
+                    services.set_ticket_statuses, [(ticket[0], ticket[4]) for ticket in tickets], new_status,
+                    on_done=show_result, widget=self.ticket_window,
+                    on_error=lambda error: messagebox.showerror("Error", str(error)),
+                )
 
     def delete_ticket(self):
-        """Delete a ticket."""
-        selected_ticket = self.ticket_listbox.curselection()
-        if selected_ticket:
-            ticket_info = self.ticket_listbox.get(selected_ticket[0]).split(" - ")
-            seat_id = ticket_info[1]
-            
-            confirm_delete = messagebox.askyesno("Delete Ticket", f"Are you sure you want to delete ticket for seat {seat_id}?")
+        """Delete the selected tickets."""
+        tickets = self.selected_tickets()
+        if tickets:
+            if len(tickets) == 1:
+                ticket_id, bus_name, seat_number, price, status = tickets[0]
+                question = f"Are you sure you want to delete ticket for {bus_name} seat {seat_number}?"
+            else:
+                question = f"Are you sure you want to delete {len(tickets)} tickets?"
+            confirm_delete = messagebox.askyesno("Delete Ticket", question)
             if confirm_delete:
-                with get_connection() as conn:
-                    cur = conn.cursor()
-                    cur.execute("DELETE FROM tickets WHERE seat_id = ?", (seat_id,))
-                    conn.commit()
+                def deleted(count):
+                    if count == len(tickets):
+                        messagebox.showinfo("Ticket Deleted", f"{count} ticket(s) successfully deleted.")
+                    else:
+                        messagebox.showinfo("Ticket Deleted", f"{count} of {len(tickets)} ticket(s) deleted; "
+                                                              f"the rest were already gone.")
+                    self.fetch_tickets()
 
-                messagebox.showinfo("Ticket Deleted", "Ticket has been successfully deleted.")
-                self.fetch_tickets()
+                def failed(error):
+                    messagebox.showerror("Error", str(error))
+                    self.fetch_tickets()
+
+                self.db.submit(services.delete_tickets, [ticket[0] for ticket in tickets],
+                               on_done=deleted, on_error=failed, widget=self.ticket_window)
 
 
 
 
    
 
-    def view_all_buses(self):
+    def view_all_buses(self, user_id=None):
         """User function to view all buses with detailed information."""
+        import search
+
         self.view_buses_window = tk.Toplevel(self.root)
         self.view_buses_window.title("View All Buses")
         self.view_buses_window.geometry("900x600")
@@ -946,27 +1001,16 @@ class BusAppGUI:
         # Title Label
         tk.Label(self.view_buses_window, text="Available Buses", font=("Arial", 16)).pack(pady=10)
 
-        # Fetch all buses with their details (including route, stops, schedules, and ticket prices)
-        def fetch_all_buses():
-            with get_connection() as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT buses.bus_id, buses.name, buses.number, buses.ticket_price, buses.capacity, 
-                        routes.route_name, routes.stops
-                    FROM buses
-                    JOIN routes ON buses.route_id = routes.route_id
-                """)
-                return cur.fetchall()
-
-        all_buses = fetch_all_buses()
-
-        if not all_buses:
-            messagebox.showinfo("No Buses", "No buses are available at the moment.")
-            self.view_buses_window.destroy()
-            return
+        # Search box: matches bus name/number, route and stops as you type
+        search_frame = tk.Frame(self.view_buses_window)
+        search_frame.pack(pady=5)
+        tk.Label(search_frame, text="Search buses, routes or stops:").pack(side=tk.LEFT, padx=5)
+        search_entry = tk.Entry(search_frame, width=40)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.focus_set()
 
         # Create a treeview widget to display the bus details in a table format
-        treeview = ttk.Treeview(self.view_buses_window, columns=("Bus Name", "Bus Number", "Route", "Stops", "Capacity", "Ticket Price"), show="headings")
+        treeview = ttk.Treeview(self.view_buses_window, columns=("Bus Name", "Bus Number", "Route", "Stops", "Capacity", "Seats Left", "Ticket Price"), show="headings")
         treeview.pack(pady=10, fill=tk.BOTH, expand=True)
 
         # Define headings for the treeview columns
@@ -975,33 +1019,78 @@ class BusAppGUI:
         treeview.heading("Route", text="Route")
         treeview.heading("Stops", text="Stops")
         treeview.heading("Capacity", text="Capacity")
+        treeview.heading("Seats Left", text="Seats Left")
         treeview.heading("Ticket Price", text="Ticket Price")
 
         # Adjust column widths for better readability
-        treeview.column("Bus Name", width=200)
-        treeview.column("Bus Number", width=120)
+        treeview.column("Bus Name", width=180)
+        treeview.column("Bus Number", width=100)
         treeview.column("Route", width=150)
-        treeview.column("Stops", width=200)
-        treeview.column("Capacity", width=100)
+        treeview.column("Stops", width=190)
+        treeview.column("Capacity", width=80)
+        treeview.column("Seats Left", width=80)
         treeview.column("Ticket Price", width=100)
 
-        # Insert rows of bus data into the treeview
-        for bus in all_buses:
-            bus_id, bus_name, bus_number, ticket_price, capacity, route_name, stops = bus
-            formatted_ticket_price = f"${ticket_price:.2f}"  # Format ticket price as currency
-            treeview.insert("", tk.END, values=(bus_name, bus_number, route_name, stops, capacity, formatted_ticket_price))
+        # Buses currently shown, by bus_id
+        shown_buses = {}
+
+        # Insert rows of bus data into the treeview once the query returns
+        def fetch_buses(text):
+            # Top search hits, or every bus until a search term is typed
+            if len(text) >= search.MIN_SEARCH_CHARS:
+                buses = services.search_buses(text)
+                # Seat counts come from the trigger-maintained summary, one row per trip
+                return buses, services.seats_left([bus[0] for bus in buses])
+            return services.list_buses(), services.seats_left()
+
+        def show_buses(result, text):
+            all_buses, seats_left = result
+            if not all_buses and not text:
+                messagebox.showinfo("No Buses", "No buses are available at the moment.")
+                self.view_buses_window.destroy()
+                return
+
+            treeview.delete(*treeview.get_children())
+            shown_buses.clear()
+            for bus in all_buses:
+                bus_id, bus_name, bus_number, ticket_price, capacity, route_name, stops = bus
+                shown_buses[bus_id] = bus
+                formatted_ticket_price = f"${ticket_price:.2f}"  # Format ticket price as currency
+                treeview.insert("", tk.END, iid=str(bus_id),
+                                values=(bus_name, bus_number, route_name, stops, capacity,
+                                        seats_left.get(bus_id, 0), formatted_ticket_price))
+
+        # Debounced: a query runs once typing pauses, and a newer one supersedes it
+        search_state = {"timer": None, "text": None}
+
+        def run_search():
+            search_state["timer"] = None
+            text = search_entry.get().strip()
+            if text == search_state["text"]:
+                return
+            search_state["text"] = text
+            self.db.submit(fetch_buses, text, on_done=lambda result: show_buses(result, text),
+                           key="all_buses", widget=treeview)
+
+        def on_search_typed(event):
+            if search_state["timer"] is not None:
+                treeview.after_cancel(search_state["timer"])
+            search_state["timer"] = treeview.after(SEARCH_DEBOUNCE_MS, run_search)
+
+        search_entry.bind("<KeyRelease>", on_search_typed)
+        run_search()
 
         # Optionally, create a double-click event to show more detailed information about a bus
         def view_bus_details(event):
             selected_item = treeview.selection()
             if selected_item:
                 bus_details = treeview.item(selected_item)["values"]
-                bus_name, bus_number, route_name, stops, capacity, ticket_price = bus_details
+                bus_name, bus_number, route_name, stops, capacity, seats_left, ticket_price = bus_details
 
                 # Create a window to display bus details in more detail
                 bus_details_window = tk.Toplevel(self.view_buses_window)
                 bus_details_window.title(f"Bus Details - {bus_name}")
-                bus_details_window.geometry("400x300")
+                bus_details_window.geometry("400x330")
                 bus_details_window.resizable(False, False)
 
                 # Display detailed information
@@ -1010,10 +1099,23 @@ class BusAppGUI:
                 tk.Label(bus_details_window, text=f"Route: {route_name}", font=("Arial", 12)).pack(pady=5)
                 tk.Label(bus_details_window, text=f"Stops: {stops}", font=("Arial", 12)).pack(pady=5)
                 tk.Label(bus_details_window, text=f"Capacity: {capacity} seats", font=("Arial", 12)).pack(pady=5)
+                tk.Label(bus_details_window, text=f"Seats Left: {seats_left}", font=("Arial", 12)).pack(pady=5)
                 tk.Label(bus_details_window, text=f"Ticket Price: {ticket_price}", font=("Arial", 12)).pack(pady=5)
 
         treeview.bind("<Double-1>", view_bus_details)
 
+        # Prebook straight from the list instead of typing the names in
+        def prebook_selected():
+            selected_item = treeview.selection()
+            if not selected_item:
+                messagebox.showerror("Error", "Please select a bus to prebook.", parent=self.view_buses_window)
+                return
+            bus = shown_buses[int(selected_item[0])]
+            self.prebook_bus(user_id, route_name=bus[5], bus_name=bus[1])
+
+        if user_id is not None:
+            tk.Button(self.view_buses_window, text="Prebook Selected", command=prebook_selected).pack(pady=5)
+
         # Close the view buses window button
         close_button = tk.Button(self.view_buses_window, text="Close", command=self.view_buses_window.destroy)
         close_button.pack(pady=10)
@@ -1024,74 +1126,153 @@ class BusAppGUI:
 
 
 
-    def prebook_bus(self, user_id):
+    def prebook_bus(self, user_id, route_name=None, bus_name=None):
         """User function to prebook a bus."""
-        route_name = simpledialog.askstring("Prebook Bus", "Enter the route name:")
-        bus_name = simpledialog.askstring("Prebook Bus", "Enter the bus name you want to prebook:")
+        if route_name is None:
+            route_name = simpledialog.askstring("Prebook Bus", "Enter the route name:")
+        if bus_name is None:
+            bus_name = simpledialog.askstring("Prebook Bus", "Enter the bus name you want to prebook:")
         
         # Validate input
         if not route_name or not bus_name:
             messagebox.showwarning("Invalid Input", "Route name and bus name cannot be empty.")
             return
         
-        # Fetch bus details and available schedules based on route and bus name
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT buses.bus_id, schedules.schedule_id, schedules.departure_date, schedules.departure_time
-                FROM buses
-                JOIN schedules ON buses.bus_id = schedules.bus_id
-                WHERE buses.name = ? AND buses.route_id = (SELECT route_id FROM routes WHERE route_name = ?)
-            """, (bus_name, route_name))
-            available_schedules = cur.fetchall()
-
-        if not available_schedules:
-            messagebox.showinfo("Prebook Successful", f"Successfully prebooked the bus for schedule .")
-            return
+        def show_result(result, trip):
+            if result.status == booking.BOOKED:
+                messagebox.showinfo("Prebook Successful", f"Successfully prebooked the bus for {trip[2]} {trip[3]}.")
+            else:
+                messagebox.showerror("Prebook Failed", result.message)
 
-        # Display available schedules
-        schedule_list = "\n".join([f"Schedule ID: {s[1]}, Date: {s[2]}, Time: {s[3]}" for s in available_schedules])
-        selected_schedule_id = simpledialog.askinteger("Prebook Bus", f"Available schedules:\n{schedule_list}\nEnter Schedule ID to prebook:")
+        def choose_schedule(available_schedules):
+            if not available_schedules:
+                messagebox.showinfo("No Schedules", "No upcoming trips found for that bus and route.")
+                return
 
-        if not selected_schedule_id:
-            messagebox.show("Prebook Successful", f"Successfully prebooked the bus for schedule .")
-            return
+            # Display available trips; recurring ones have no schedule ID until someone books them
+            schedule_list = "\n".join(f"{n}. Date: {s[2]}, Time: {s[3]}"
+                                      for n, s in enumerate(available_schedules, start=1))
+            choice = simpledialog.askinteger("Prebook Bus", f"Upcoming trips:\n{schedule_list}\nEnter the trip number to prebook:")
 
-        # Validate schedule selection
-        if selected_schedule_id < 1 or selected_schedule_id > len(available_schedules):
-            messagebox.showinfo("Prebook Successful", f"Successfully prebooked the bus for schedule .")
-            return
+            if not choice:
+                return
+
+            # Validate trip selection
+            if not 1 <= choice <= len(available_schedules):
+                messagebox.showerror("Invalid Trip", "Please enter one of the listed trip numbers.")
+                return
+
+            # Prebook the bus; the booking service guards against a concurrent prebooking
+            trip = available_schedules[choice - 1]
+            bus_id, schedule_id, _, _, pattern_id, service_date = trip
+            if schedule_id is None:
+                job = (services.prebook_trip, user_id, pattern_id, service_date)
+            else:
+                job = (services.prebook, user_id, bus_id, schedule_id)
+            self.db.submit(*job, on_done=lambda result: show_result(result, trip))
+
+        # Fetch available schedules based on route and bus name
+        self.db.submit(services.find_schedules, bus_name, route_name, on_done=choose_schedule, key="prebook")
 
-        # Prebook the bus
-        selected_bus_id = available_schedules[selected_schedule_id - 1][0]
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO prebooked_buses (user_id, bus_id, prebook_date)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            """, (user_id, selected_bus_id))  # Assume valid selection
-            conn.commit()
 
-        messagebox.showinfo("Prebook Successful", f"Successfully prebooked the bus for schedule ID: {selected_schedule_id}.")
 
 
 
+    def export_metrics(self):
+        """Save query and handler latency metrics as JSON or Prometheus text."""
+        path = filedialog.asksaveasfilename(
+            parent=self.root, title="Export Metrics", defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            instrumentation.dump(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to export metrics: {str(e)}")
+            return
+        slow = len(instrumentation.metrics.snapshot()["slow_queries"])
+        messagebox.showinfo("Export Metrics", f"Metrics saved to {path}.\n{slow} slow queries logged.")
+
+    def reprice_seats(self):
+        """Preview dynamic prices for upcoming trips, then apply them if confirmed."""
+        def show_error(error):
+            messagebox.showerror("Error", str(error))
+
+        def applied(result):
+            messagebox.showinfo("Reprice Seats", f"Updated {result.changed} ticket prices in {result.seconds:.1f}s.")
+
+        def confirm(preview):
+            if not preview.changed:
+                messagebox.showinfo("Reprice Seats", f"All {preview.tickets} unsold seats are already at their price.")
+                return
+            largest = sorted(preview.changes, key=lambda c: abs(c.new - c.old), reverse=True)[:5]
+            lines = "\n".join(f"Trip {c.schedule_id}: {c.old:.2f} -> {c.new:.2f}" for c in largest)
+            if messagebox.askyesno(
+                "Reprice Seats",
+                f"{preview.changed} of {preview.tickets} unsold seats on {preview.trips} trips would change "
+                f"({preview.raised} up, {preview.lowered} down). Largest changes:\n{lines}\n\nApply the new prices?",
+            ):
+                self.db.submit(services.reprice, on_done=applied, on_error=show_error, key="pricing")
+
+        self.db.submit(services.reprice, dry_run=True, on_done=confirm, on_error=show_error, key="pricing")
+
+    def backup_now(self):
+        """Take a verified snapshot of the database while bookings carry on."""
+        import backup
+
+        def show_result(result):
+            messagebox.showinfo(
+                "Backup",
+                f"Saved {result.path}" + (f" and {result.archive}" if result.archive else "") +
+                f" ({result.bytes / 1e6:.1f} MB) in {result.seconds:.1f}s, "
+                f"{result.mb_per_s} MB/s.\nLongest pause for other connections: {result.stall_max_ms:.0f} ms.",
+            )
+
+        def show_error(error):
+            messagebox.showerror("Error", f"Backup failed: {error}")
 
+        self.db.submit(backup.snapshot, on_done=show_result, on_error=show_error, key="backup")
 
     def logout_admin(self):
         """Logout admin and return to login."""
+        services.logout(self.session)
+        self.session = None
         self.admin_window.quit()
         self.root.deiconify()
 
     def logout_user(self):
         """Logout user and return to login."""
+        services.logout(self.session)
+        self.session = None
         self.user_window.quit()
         self.root.deiconify()
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bus Service Application")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print a startup timeline once the login screen is drawn, then exit")
+    args = parser.parse_args(argv)
+
+    # Before init_db so every pooled connection is traced; dumped again on exit
+    import archive
+    instrumentation.install(connection_pool.get_pool(), dump_path=METRICS_FILE)
+    archive.install(connection_pool.get_pool())
+    startup.mark("archive attached")
+    init_db()  # Applies any new tables/indexes to an existing database
+    startup.mark("init_db")
     root = tk.Tk()
+    startup.mark("Tk()")
     app = BusAppGUI(root)
-    root.mainloop()
+    startup.mark("login screen built")
+    if args.profile_startup:
+        root.update()
+        startup.mark("first frame drawn")
+        startup.report()
+        root.destroy()
+    else:
+        root.mainloop()
+    app.db.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,278 @@
+"""Hot/archive split: past trips and their sales move to a separate file.
+
+Completed trips (arrival more than ARCHIVE_AFTER_DAYS ago) are moved, with
+their tickets and driver shifts, from the main database into "<db>_archive.db". Transactions
+and prebookings older than the same cutoff go with them. The main file then
+only holds current and future activity, which keeps it small enough to stay
+in the page cache.
+
+Every pooled connection ATTACHes the archive as schema `archive` (see
+install()) and gets TEMP views all_schedules, all_tickets, all_transactions,
+all_prebooked_buses and all_driver_shifts that union both files, for reports
+that need the whole history.
+
+Rows move in batches of BATCH_SIZE. Each batch is copied into the archive
+(INSERT OR IGNORE on the original ids) in one transaction and removed from
+the main file in a second. SQLite does not commit attached WAL databases
+atomically together, so a crash between the two leaves a row in both files
+rather than in neither; the views hide such duplicates and the next run
+finishes the move. Freed pages are returned to the OS by an incremental
+VACUUM of at most VACUUM_PAGES pages per maintain() call. That needs
+auto_vacuum=INCREMENTAL, which schema.sql sets on new files; an older file
+is switched over once by enable_vacuum(), a full VACUUM that rewrites the
+whole file, so it is an admin step and never part of scheduled maintenance.
+
+Usage: python archive.py run [--days N] | vacuum | enable-vacuum | stats
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from timetable import TS_FORMAT
+
+ARCHIVE_AFTER_DAYS = 30
+BATCH_SIZE = 500
+VACUUM_PAGES = 2000   # ~8 MB of 4 KB pages per maintain() call
+ARCHIVE_ENV = "BUS_ARCHIVE_DB"
+
+# table -> (id column, timestamp column selecting old rows or None, archive indexes)
+ARCHIVED_TABLES = {
+    "schedules": ("schedule_id", "arrival_ts", ("bus_id, departure_ts", "route_id, departure_ts")),
+    "tickets": ("ticket_id", None, ("schedule_id", "user_id")),
+    "driver_shifts": ("shift_id", None, ("driver_id, starts_at", "bus_id, starts_at")),
+    "transactions": ("transaction_id", "transaction_date", ("transaction_date", "user_id")),
+    "prebooked_buses": ("prebook_id", "prebook_date", ("user_id",)),
+}
+
+
+def archive_path(db_path):
+    """Where the archive for the database at `db_path` lives."""
+    return os.environ.get(ARCHIVE_ENV) or os.path.splitext(db_path)[0] + "_archive.db"
+
+def _columns(conn, table, schema="main"):
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def _sync_schema(conn):
+    """Create or extend the archive tables so they mirror the main ones."""
+    for table, (id_column, _, indexes) in ARCHIVED_TABLES.items():
+        columns = _columns(conn, table)
+        existing = {name for name, _ in _columns(conn, table, "archive")}
+        if not existing:
+            definitions = ", ".join(
+                f"{name} {kind} PRIMARY KEY" if name == id_column else f"{name} {kind}" for name, kind in columns)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} ({definitions})")
+            for i, index in enumerate(indexes):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_{i} ON {table}({index})")
+        else:
+            for name, kind in columns:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {kind}")
+
+def _create_views(conn):
+    for table, (id_column, _, _) in ARCHIVED_TABLES.items():
+        names = ", ".join(name for name, _ in _columns(conn, table))
+        conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+        conn.execute(f"""
+            CREATE TEMP VIEW all_{table} AS
+            SELECT {names} FROM main.{table}
+            UNION ALL
+            SELECT {names} FROM archive.{table} AS old
+            WHERE NOT EXISTS (SELECT 1 FROM main.{table} AS hot WHERE hot.{id_column} = old.{id_column})
+        """)
+
+def attach(conn):
+    """ATTACH the archive to `conn` (once) and create the all_* views.
+
+    Must be called outside a transaction. Does nothing for in-memory databases.
+    """
+    databases = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    if "archive" in databases or not databases.get("main"):
+        return
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(databases["main"]),))
+    if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM archive.sqlite_master)").fetchone()[0]:
+        conn.execute("PRAGMA archive.journal_mode = WAL")
+    _sync_schema(conn)
+    if conn.in_transaction:
+        conn.commit()
+    _create_views(conn)
+
+def install(pool):
+    """Attach the archive on every connection `pool` opens from now on."""
+    if attach not in pool.on_connect:
+        pool.on_connect.append(attach)
+
+
+def _move(pool, parts, stats):
+    """Copy [(table, ids)] into the archive in one transaction, then delete them in another.
+
+    A trip, and with it its shifts, is only deleted once none of its tickets
+    are left in the main file. Shifts are deleted before their trips, so
+    trg_schedules_shifts_delete finds nothing left to drop.
+    """
+    with pool.writer() as conn:
+        attach(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        for table, ids in parts:
+            id_column = ARCHIVED_TABLES[table][0]
+            names = ", ".join(name for name, _ in _columns(conn, table))
+            conn.execute(
+                f"INSERT OR IGNORE INTO archive.{table} ({names}) "
+                f"SELECT {names} FROM main.{table} WHERE {id_column} IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),),
+            )
+    with pool.writer() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table, ids in parts:
+            id_column = ARCHIVED_TABLES[table][0]
+            unsold_elsewhere = {
+                "schedules": " AND NOT EXISTS (SELECT 1 FROM main.tickets "
+                             "WHERE tickets.schedule_id = schedules.schedule_id)",
+                "driver_shifts": " AND NOT EXISTS (SELECT 1 FROM main.schedules "
+                                 "JOIN main.tickets ON tickets.schedule_id = schedules.schedule_id "
+                                 "WHERE schedules.bus_id = driver_shifts.bus_id "
+                                 "AND schedules.departure_ts = driver_shifts.starts_at)",
+            }.get(table, "")
+            moved = conn.execute(
+                f"DELETE FROM main.{table} WHERE {id_column} IN (SELECT value FROM json_each(?)) "
+                f"AND {id_column} IN (SELECT {id_column} FROM archive.{table}){unsold_elsewhere}",
+                (json.dumps(ids),),
+            ).rowcount
+            stats[table] = stats.get(table, 0) + moved
+            if table == "schedules" and moved:
+                # The trips' summaries and holds go with them
+                for summary in ("bus_availability", "seat_maps", "seat_holds"):
+                    conn.execute(
+                        f"DELETE FROM main.{summary} WHERE (bus_id, schedule_id) IN "
+                        f"(SELECT bus_id, schedule_id FROM archive.schedules "
+                        f"WHERE schedule_id IN (SELECT value FROM json_each(?))) "
+                        f"AND schedule_id NOT IN (SELECT schedule_id FROM main.schedules)",
+                        (json.dumps(ids),),
+                    )
+
+def _ids(pool, sql, params):
+    with pool.reader() as conn:
+        return [row[0] for row in conn.execute(sql, params)]
+
+def run(pool=None, days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, pause=0.0):
+    """Move everything older than `days` into the archive; returns {table: rows moved}.
+
+    Trips go first, each batch together with its tickets and shifts, then
+    transactions and prebookings. `pause` seconds between batches lets other writers in.
+    """
+    if pool is None:
+        from connection_pool import get_pool
+        pool = get_pool()
+    cutoff = (datetime.now() - timedelta(days=days)).strftime(TS_FORMAT)
+    stats = {}
+
+    last = 0
+    while True:
+        trips = _ids(pool, "SELECT schedule_id FROM schedules WHERE arrival_ts < ? AND schedule_id > ? "
+                           "ORDER BY schedule_id LIMIT ?", (cutoff, last, batch_size))
+        if not trips:
+            break
+        last = trips[-1]
+        tickets = _ids(pool, "SELECT ticket_id FROM tickets WHERE schedule_id IN (SELECT value FROM json_each(?))",
+                       (json.dumps(trips),))
+        shifts = _ids(pool, "SELECT shift_id FROM driver_shifts WHERE (bus_id, starts_at) IN "
+                            "(SELECT bus_id, departure_ts FROM schedules "
+                            "WHERE schedule_id IN (SELECT value FROM json_each(?)))",
+                      (json.dumps(trips),))
+        _move(pool, [("tickets", tickets), ("driver_shifts", shifts), ("schedules", trips)], stats)
+        time.sleep(pause)
+
+    # A prebooking stays while its trip does, so the trip cannot be prebooked twice
+    keep = {"prebooked_buses": " AND (schedule_id IS NULL OR schedule_id NOT IN (SELECT schedule_id FROM schedules))"}
+    for table in ("transactions", "prebooked_buses"):
+        id_column, ts_column, _ = ARCHIVED_TABLES[table]
+        last = 0
+        while True:
+            ids = _ids(pool, f"SELECT {id_column} FROM {table} WHERE {ts_column} < ? AND {id_column} > ?"
+                             f"{keep.get(table, '')} ORDER BY {id_column} LIMIT ?", (cutoff, last, batch_size))
+            if not ids:
+                break
+            last = ids[-1]
+            _move(pool, [(table, ids)], stats)
+            time.sleep(pause)
+    return stats
+
+def vacuum(pool=None, pages=VACUUM_PAGES):
+    """Return up to `pages` free pages of the main file to the OS; returns pages freed.
+
+    Frees nothing until the file is in incremental mode (see enable_vacuum()).
+    """
+    if pool is None:
+        from connection_pool import get_pool
+        pool = get_pool()
+    with pool.writer() as conn:
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+            return 0
+        before = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA main.incremental_vacuum({int(pages)})")
+        return before - conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+def enable_vacuum(pool=None):
+    """Switch the main file to auto_vacuum=INCREMENTAL; returns False if it already was.
+
+    Runs a full VACUUM, which rewrites the file and blocks writers until it
+    is done: run it once, at a quiet time.
+    """
+    if pool is None:
+        from connection_pool import get_pool
+        pool = get_pool()
+    with pool.writer() as conn:
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+        return True
+
+def maintain(days=ARCHIVE_AFTER_DAYS):
+    """One scheduled maintenance pass: archive, prune the change log, then an incremental VACUUM.
+
+    Returns (rows moved per table, change_log rows pruned, pages freed).
+    """
+    from changes import prune
+    from connection_pool import get_pool
+    moved = run(days=days)
+    with get_pool().writer() as conn:
+        pruned = prune(conn)
+    return moved, pruned, vacuum()
+
+def stats(pool=None):
+    """{table: (rows in the main file, rows in the archive)}."""
+    if pool is None:
+        from connection_pool import get_pool
+        pool = get_pool()
+    with pool.reader() as conn:
+        attach(conn)
+        return {table: (conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0],
+                        conn.execute(f"SELECT COUNT(*) FROM archive.{table}").fetchone()[0])
+                for table in ARCHIVED_TABLES}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("run", "vacuum", "enable-vacuum", "stats"))
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        moved = run(days=args.days, batch_size=args.batch)
+        print(", ".join(f"{rows} {table}" for table, rows in moved.items()) or "Nothing to archive.")
+        print(f"Freed {vacuum()} pages.")
+    elif args.command == "vacuum":
+        print(f"Freed {vacuum()} pages.")
+    elif args.command == "enable-vacuum":
+        print("Switched to incremental vacuum." if enable_vacuum() else "Incremental vacuum was already on.")
+    else:
+        for table, (hot, old) in stats().items():
+            print(f"{table:>16}: {hot} current, {old} archived")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
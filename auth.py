@@ -0,0 +1,157 @@
+"""Password hashing, login and in-memory sessions.
+
+Passwords are stored as "pbkdf2_sha256$<iterations>$<salt>$<hash>". The
+iteration count is tunable (PBKDF2_ITERATIONS, or the BUS_PBKDF2_ITERATIONS
+environment variable) and verification runs on a small dedicated thread pool
+-- hashlib releases the GIL while hashing -- so a slow KDF never blocks the
+Tk thread or an HTTP worker's event handling, and a login rush cannot use
+more than `VERIFY_WORKERS` cores.
+
+Hashes from the old scheme (one unsalted SHA-256) and hashes made with fewer
+iterations than the current setting are rewritten on the next good login.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_connection, get_read_connection
+
+SCHEME = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = int(os.environ.get("BUS_PBKDF2_ITERATIONS", 200000))
+SALT_BYTES = 16
+VERIFY_WORKERS = max(1, min(4, os.cpu_count() or 1))
+SESSION_TTL = 12 * 60 * 60  # seconds
+
+_verify_pool = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="auth")
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+def hash_password(password, iterations=None):
+    """Return a salted PBKDF2 hash string for storage."""
+    iterations = iterations or PBKDF2_ITERATIONS
+    salt = os.urandom(SALT_BYTES)
+    return f"{SCHEME}${iterations}${salt.hex()}${_pbkdf2(password, salt, iterations).hex()}"
+
+def _is_legacy(stored):
+    return len(stored) == 64 and "$" not in stored
+
+def verify_password(password, stored):
+    """Return (matches, needs_rehash) for a password against a stored hash."""
+    if _is_legacy(stored):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+    try:
+        scheme, iterations, salt, expected = stored.split("$")
+        iterations = int(iterations)
+        salt, expected = bytes.fromhex(salt), bytes.fromhex(expected)
+    except ValueError:
+        return False, False
+    if scheme != SCHEME:
+        return False, False
+    matches = hmac.compare_digest(_pbkdf2(password, salt, iterations), expected)
+    return matches, iterations < PBKDF2_ITERATIONS
+
+def verify_async(password, stored):
+    """Verify on the auth pool; returns a Future of (matches, needs_rehash)."""
+    return _verify_pool.submit(verify_password, password, stored)
+
+_dummy_hash = None
+
+def _unknown_user_hash():
+    """A throwaway hash verified for unknown emails, so both cases cost the same."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    return _dummy_hash
+
+
+def authenticate(email, password):
+    """Return {"user_id", "name", "role"} for valid credentials, else None."""
+    with get_read_connection() as conn:
+        row = conn.execute(
+            "SELECT user_id, name, role, password FROM users WHERE email = ?", (email,)
+        ).fetchone()
+
+    stored = row[3] if row else _unknown_user_hash()
+    matches, needs_rehash = verify_async(password, stored).result()
+    if row is None or not matches:
+        return None
+
+    user_id, name, role, _ = row
+    if needs_rehash:
+        new_hash = _verify_pool.submit(hash_password, password).result()
+        with get_connection() as conn:
+            # Only replace the hash we verified, in case it changed meanwhile
+            conn.execute("UPDATE users SET password = ? WHERE user_id = ? AND password = ?",
+                         (new_hash, user_id, stored))
+    return {"user_id": user_id, "name": name, "role": role}
+
+
+class SessionStore:
+    """Maps opaque tokens to logged-in users for SESSION_TTL seconds."""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, user):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._purge()
+            self._sessions[token] = (dict(user), time.monotonic() + self.ttl)
+        return token
+
+    def get(self, token):
+        """Return the user for a live token, or None."""
+        if not token:
+            return None
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._sessions[token]
+                return None
+            return user
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def revoke_user(self, user_id):
+        """End every session of a user, e.g. after a password change."""
+        with self._lock:
+            for token in [t for t, (user, _) in self._sessions.items() if user["user_id"] == user_id]:
+                del self._sessions[token]
+
+    def _purge(self):
+        now = time.monotonic()
+        for token in [t for t, (_, expires) in self._sessions.items() if expires < now]:
+            del self._sessions[token]
+
+
+sessions = SessionStore()
+
+
+def login(email, password):
+    """Authenticate and open a session; returns the user dict plus "token", or None."""
+    user = authenticate(email, password)
+    if user is None:
+        return None
+    user["token"] = sessions.create(user)
+    return user
+
+def logout(token):
+    sessions.revoke(token)
+
+def current_user(token):
+    """Return the user for a session token without re-verifying the password."""
+    return sessions.get(token)
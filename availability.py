@@ -0,0 +1,109 @@
+"""Per-bus, per-trip ticket summary maintained by triggers on `tickets`.
+
+bus_availability holds sold/unsold counts and revenue for every
+(bus_id, schedule_id) pair (schedule 0 = tickets without a schedule). The
+triggers in schema.sql keep it exact on every INSERT/UPDATE/DELETE, so the
+admin report and passenger bus list read one small row per bus instead of
+counting tickets.
+
+Usage: python availability.py verify|rebuild
+"""
+import json
+import sys
+
+from database import get_connection, get_read_connection
+
+# What the summary should contain, computed the slow way from tickets
+EXPECTED_QUERY = """
+    SELECT bus_id, COALESCE(schedule_id, 0) AS schedule_id,
+        SUM(status IS 'sold'), SUM(status IS 'unsold'),
+        TOTAL(CASE WHEN status IS 'sold' THEN price END)
+    FROM tickets
+    GROUP BY bus_id, COALESCE(schedule_id, 0)
+"""
+
+REVENUE_TOLERANCE = 0.005
+
+
+def rebuild(conn=None):
+    """Recompute the whole summary from tickets; returns the number of rows written."""
+    if conn is None:
+        with get_connection() as conn:
+            return rebuild(conn)
+    conn.execute("DELETE FROM bus_availability")
+    cur = conn.execute(f"""
+        INSERT INTO bus_availability (bus_id, schedule_id, sold, unsold, revenue)
+        SELECT expected.* FROM ({EXPECTED_QUERY}) AS expected
+        WHERE expected.bus_id IN (SELECT bus_id FROM buses)
+    """)
+    return cur.rowcount
+
+def migrate_availability(conn):
+    """Fill the summary the first time it exists next to older tickets."""
+    empty = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM bus_availability)").fetchone()[0]
+    if empty and conn.execute("SELECT EXISTS (SELECT 1 FROM tickets)").fetchone()[0]:
+        return rebuild(conn)
+    return 0
+
+def verify():
+    """Compare the summary with tickets; returns a list of mismatch descriptions."""
+    with get_read_connection() as conn:
+        expected = {(row[0], row[1]): row[2:] for row in conn.execute(EXPECTED_QUERY)}
+        actual = {(row[0], row[1]): row[2:] for row in conn.execute(
+            "SELECT bus_id, schedule_id, sold, unsold, revenue FROM bus_availability"
+        )}
+        bus_ids = {row[0] for row in conn.execute("SELECT bus_id FROM buses")}
+
+    problems = []
+    for key in sorted(set(expected) | set(actual)):
+        if key[0] not in bus_ids:
+            if key in actual:
+                problems.append(f"bus {key[0]} trip {key[1]}: summary row for a missing bus")
+            continue
+        want = expected.get(key, (0, 0, 0.0))
+        have = actual.get(key, (0, 0, 0.0))
+        if want[:2] != have[:2] or abs(want[2] - have[2]) > REVENUE_TOLERANCE:
+            problems.append(
+                f"bus {key[0]} trip {key[1]}: expected sold={want[0]} unsold={want[1]} "
+                f"revenue={want[2]:.2f}, found sold={have[0]} unsold={have[1]} revenue={have[2]:.2f}"
+            )
+    return problems
+
+def seats_left(bus_ids=None):
+    """Return {bus_id: unsold tickets across all of the bus's trips}.
+
+    Pass `bus_ids` to look up only those buses (e.g. a page of search hits).
+    """
+    with get_read_connection() as conn:
+        if bus_ids is None:
+            return dict(conn.execute(
+                "SELECT bus_id, SUM(unsold) FROM bus_availability GROUP BY bus_id"
+            ).fetchall())
+        return dict(conn.execute(
+            "SELECT bus_id, SUM(unsold) FROM bus_availability "
+            "WHERE bus_id IN (SELECT value FROM json_each(?)) GROUP BY bus_id",
+            (json.dumps(list(bus_ids)),),
+        ).fetchall())
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "verify"
+    if command == "rebuild":
+        print(f"Rebuilt {rebuild()} summary rows.")
+        return 0
+    if command == "verify":
+        problems = verify()
+        for problem in problems:
+            print(f"FAIL {problem}")
+        if problems:
+            print("Run `python availability.py rebuild` to repair the summary.")
+            return 1
+        print("bus_availability matches tickets.")
+        return 0
+    print(__doc__.strip().splitlines()[-1])
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Online backups of the live database with sqlite3.Connection.backup.
+
+snapshot() copies the database PAGES_PER_STEP pages at a time and sleeps
+STEP_SLEEP seconds between steps. Each step holds a read lock only briefly,
+so counters keep booking while a backup runs. The copy is written to a
+.partial file, checked with PRAGMA integrity_check and only then renamed to
+"<db>-YYYYmmdd-HHMMSS.db" in the backup directory. The newest KEEP
+snapshots are kept and older ones removed.
+
+A write made by another connection during the copy makes SQLite restart the
+backup from the first page. Restarts are counted in the result; after
+MAX_RESTARTS the rest is copied in a single step, which in WAL mode does
+not block writers either, so the backup always finishes.
+
+Step durations (the time a step holds the source) are recorded as the
+"backup:step" handler histogram in instrumentation.metrics, next to the
+query metrics, and each BackupResult reports throughput and stall times.
+
+The archive database (see archive.py) is copied in the same pass, to
+"<archive>-YYYYmmdd-HHMMSS.db" with the same timestamp, after the main file.
+A trip moved to the archive in between is then in both copies, which the
+all_* views already handle; copying the other way round could lose it.
+Pairs are verified, rotated and restored together: an old main file next to
+a newer archive would reuse ids the archive already holds, and the views
+would hide the archived rows behind the new ones.
+
+restore() verifies a snapshot and its archive pair and copies them over the
+live files, one backup call each. Other connections see the restored data on
+their next read.
+
+Usage: python backup.py snapshot | list | verify PATH | restore PATH
+"""
+import glob
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from instrumentation import metrics
+
+BACKUP_DIR = os.environ.get("BUS_BACKUP_DIR", "backups")
+KEEP = 7
+PAGES_PER_STEP = 256       # 1 MB of 4 KB pages
+STEP_SLEEP = 0.02          # seconds between steps, for other connections
+MAX_RESTARTS = 3
+
+BackupResult = namedtuple(
+    "BackupResult",
+    "path pages bytes seconds steps restarts stall_max_ms stall_total_ms mb_per_s archive",
+)
+
+
+class BackupError(Exception):
+    """A snapshot failed its integrity check or could not be made."""
+
+
+def _db_path():
+    from connection_pool import get_pool
+    return get_pool().path
+
+def integrity(path):
+    """PRAGMA integrity_check of the file at `path`: "ok" or the first problems found."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return "; ".join(row[0] for row in conn.execute("PRAGMA integrity_check(10)"))
+    finally:
+        conn.close()
+
+def paired(path, db_path=None):
+    """The archive snapshot taken with the main snapshot at `path`."""
+    from archive import archive_path
+    stem = os.path.splitext(os.path.basename(db_path or _db_path()))[0]
+    archive_stem = os.path.splitext(os.path.basename(archive_path(db_path or _db_path())))[0]
+    return os.path.join(os.path.dirname(path), archive_stem + os.path.basename(path)[len(stem):])
+
+def snapshots(directory=BACKUP_DIR, db_path=None):
+    """Existing snapshots of the database, newest first."""
+    stem = os.path.splitext(os.path.basename(db_path or _db_path()))[0]
+    return sorted(glob.glob(os.path.join(directory, f"{stem}-*.db")), reverse=True)
+
+def rotate(directory=BACKUP_DIR, keep=KEEP, db_path=None):
+    """Delete all but the newest `keep` snapshots and their archive pairs; returns the paths removed."""
+    removed = snapshots(directory, db_path)[keep:]
+    for path in removed:
+        os.remove(path)
+        if os.path.exists(paired(path, db_path)):
+            os.remove(paired(path, db_path))
+    return removed
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+def _copy(source, target, pages, sleep, name="main"):
+    """Stepped source.backup(target) of schema `name`; returns (steps, restarts, step durations)."""
+    state = {"remaining": None, "steps": 0, "restarts": 0, "step_started": time.perf_counter()}
+    durations = []
+
+    def progress(status, remaining, total):
+        duration = time.perf_counter() - state["step_started"]
+        durations.append(duration)
+        metrics.observe_handler("backup:step", duration)
+        state["steps"] += 1
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+        if remaining:
+            time.sleep(sleep)
+        state["step_started"] = time.perf_counter()
+
+    try:
+        source.backup(target, pages=pages, progress=progress, name=name)
+    except _TooManyRestarts:
+        # Too busy for small steps: copy everything in one read transaction,
+        # which in WAL mode still lets writers carry on.
+        state["step_started"] = time.perf_counter()
+        source.backup(target, pages=-1, progress=progress, name=name)
+    return state["steps"], state["restarts"], durations
+
+def snapshot(db_path=None, directory=BACKUP_DIR, keep=KEEP, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Take a verified snapshot of the live database and its archive; returns a BackupResult.
+
+    Raises BackupError (and keeps no file) if either copy fails its integrity check.
+    """
+    from archive import archive_path
+    db_path = db_path or _db_path()
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    path = os.path.join(directory, f"{stem}-{datetime.now():%Y%m%d-%H%M%S}.db")
+    copies = [("main", path)]
+    if os.path.exists(archive_path(db_path)):
+        copies.append(("archive", paired(path, db_path)))
+
+    started = time.perf_counter()
+    steps = restarts = page_count = 0
+    durations = []
+    source = sqlite3.connect(db_path)
+    try:
+        if len(copies) > 1:
+            source.execute("ATTACH DATABASE ? AS archive", (archive_path(db_path),))
+        for name, copy in copies:
+            target = sqlite3.connect(copy + ".partial")
+            try:
+                copy_steps, copy_restarts, copy_durations = _copy(source, target, pages, sleep, name)
+                page_count += target.execute("PRAGMA page_count").fetchone()[0]
+                target.execute("PRAGMA journal_mode = DELETE")  # a self-contained single file
+            finally:
+                target.close()
+            steps, restarts = steps + copy_steps, restarts + copy_restarts
+            durations += copy_durations
+    finally:
+        source.close()
+
+    for _, copy in copies:
+        status = integrity(copy + ".partial")
+        if status != "ok":
+            for _, other in copies:
+                if os.path.exists(other + ".partial"):
+                    os.remove(other + ".partial")
+            raise BackupError(f"Snapshot of {os.path.basename(copy)} failed its integrity check: {status}")
+    for _, copy in reversed(copies):  # the main file last: it is what snapshots() lists
+        os.replace(copy + ".partial", copy)
+    rotate(directory, keep, db_path)
+
+    seconds = time.perf_counter() - started
+    metrics.observe_handler("backup:snapshot", seconds)
+    size = sum(os.path.getsize(copy) for _, copy in copies)
+    return BackupResult(
+        path, page_count, size, round(seconds, 3), steps, restarts,
+        round(max(durations, default=0) * 1000, 3), round(sum(durations) * 1000, 3),
+        round(size / 1e6 / seconds, 2) if seconds else 0.0,
+        copies[1][1] if len(copies) > 1 else None,
+    )
+
+def restore(path, db_path=None):
+    """Replace the live database and archive with a verified snapshot pair; returns seconds taken.
+
+    Raises BackupError if the live archive exists but the snapshot has no
+    archive pair, since the two files must come from the same point in time.
+    """
+    from archive import archive_path
+    db_path = db_path or _db_path()
+    copies = [(path, db_path)]
+    if os.path.exists(paired(path, db_path)):
+        copies.append((paired(path, db_path), archive_path(db_path)))
+    elif os.path.exists(archive_path(db_path)):
+        raise BackupError(f"{path} has no archive snapshot to restore with {archive_path(db_path)}")
+    for copy, _ in copies:
+        status = integrity(copy)
+        if status != "ok":
+            raise BackupError(f"{copy} failed its integrity check: {status}")
+
+    started = time.perf_counter()
+    for copy, live in copies:
+        source = sqlite3.connect(f"file:{copy}?mode=ro", uri=True)
+        target = sqlite3.connect(live, timeout=30)
+        try:
+            source.backup(target)  # one step: the target is locked until it is done
+            target.execute("PRAGMA journal_mode = WAL")  # snapshots are stored in rollback mode
+        finally:
+            target.close()
+            source.close()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    from database import DB_NAME
+    if argv == ["snapshot"]:
+        result = snapshot(DB_NAME)
+        print(f"{result.path}: {result.pages} pages ({result.bytes / 1e6:.1f} MB) in {result.seconds:.2f}s "
+              f"({result.mb_per_s} MB/s), {result.steps} steps, {result.restarts} restarts, "
+              f"longest stall {result.stall_max_ms:.1f} ms")
+        if result.archive:
+            print(f"Archive: {result.archive}")
+    elif argv == ["list"]:
+        for path in snapshots(db_path=DB_NAME):
+            archive = paired(path, DB_NAME)
+            print(f"{path}  {os.path.getsize(path) / 1e6:.1f} MB" + (
+                f"  (archive {os.path.getsize(archive) / 1e6:.1f} MB)" if os.path.exists(archive) else ""))
+    elif argv[:1] == ["verify"] and len(argv) == 2:
+        paths = [argv[1]] + [paired(argv[1], DB_NAME)] * os.path.exists(paired(argv[1], DB_NAME))
+        statuses = [integrity(path) for path in paths]
+        for path, status in zip(paths, statuses):
+            print(f"{path}: {status}")
+        return 0 if all(status == "ok" for status in statuses) else 1
+    elif argv[:1] == ["restore"] and len(argv) == 2:
+        print(f"Restored {argv[1]} into {DB_NAME} in {restore(argv[1], DB_NAME):.2f}s.")
+    else:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
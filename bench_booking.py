@@ -0,0 +1,132 @@
+"""Multi-process booking benchmark.
+
+Starts several processes that all book random seats in one SQLite file
+through booking.book_seat, then reports throughput, latency percentiles and
+the conflict rate, and checks that no seat was sold twice.
+
+Usage: python bench_booking.py [--processes 8] [--bookings 300] [--buses 20] [--seats 40]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+
+def setup_db(path, buses, seats, users=100):
+    """Create a fresh database with `buses` x `seats` unsold tickets."""
+    conn = sqlite3.connect(path)
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")) as schema_file:
+        conn.executescript(schema_file.read())
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (name, email, phone, password) VALUES (?, ?, ?, ?)",
+            ((f"User {i}", f"user{i}@example.com", "000", "x") for i in range(1, users + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO routes (route_name, stops) VALUES (?, ?)",
+            ((f"Route {i}", "A, B") for i in range(1, buses + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO buses (name, number, route_id, ticket_price, capacity) VALUES (?, ?, ?, ?, ?)",
+            ((f"Bus {i}", f"N{i}", i, 500.0, seats) for i in range(1, buses + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO tickets (bus_id, seat_number, seat_id, price) VALUES (?, ?, ?, ?)",
+            ((b, s, f"{b}-{s}", 500.0) for b in range(1, buses + 1) for s in range(1, seats + 1)),
+        )
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+
+def worker(path, worker_id, bookings, buses, seats, users):
+    """Book random seats; return [(status, latency_seconds, ticket_id)]."""
+    import connection_pool
+    import booking
+
+    connection_pool.configure(path)
+    rng = random.Random(worker_id)
+    results = []
+    for _ in range(bookings):
+        bus_id = rng.randint(1, buses)
+        seat = rng.randint(1, seats)
+        started = time.perf_counter()
+        result = booking.book_seat(bus_id, seat, rng.randint(1, users))
+        results.append((result.status, time.perf_counter() - started, result.record_id))
+    connection_pool.close_pool()
+    return results
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def verify(path, booked_ids):
+    """Return a list of consistency problems (empty when all is well)."""
+    problems = []
+    if len(booked_ids) != len(set(booked_ids)):
+        problems.append(f"{len(booked_ids) - len(set(booked_ids))} tickets were booked more than once")
+    conn = sqlite3.connect(path)
+    sold = conn.execute("SELECT COUNT(*) FROM tickets WHERE status = 'sold'").fetchone()[0]
+    payments = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    conn.close()
+    if sold != len(booked_ids):
+        problems.append(f"{sold} tickets sold but {len(booked_ids)} bookings succeeded")
+    if payments != len(booked_ids):
+        problems.append(f"{payments} transactions recorded for {len(booked_ids)} bookings")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--bookings", type=int, default=300, help="attempts per process")
+    parser.add_argument("--buses", type=int, default=20)
+    parser.add_argument("--seats", type=int, default=40)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        setup_db(path, args.buses, args.seats, args.users)
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(args.processes) as pool:
+            started = time.perf_counter()
+            batches = pool.starmap(worker, [
+                (path, i, args.bookings, args.buses, args.seats, args.users)
+                for i in range(args.processes)
+            ])
+            elapsed = time.perf_counter() - started
+
+        results = [r for batch in batches for r in batch]
+        latencies = [r[1] for r in results]
+        booked = [r[2] for r in results if r[0] == "booked"]
+        conflicts = sum(1 for r in results if r[0] == "conflict")
+        busy = sum(1 for r in results if r[0] == "busy")
+        problems = verify(path, booked)
+
+    print(f"processes:      {args.processes}")
+    print(f"attempts:       {len(results)}")
+    print(f"booked:         {len(booked)} ({len(booked) / elapsed:.1f} bookings/sec)")
+    print(f"conflict rate:  {conflicts / len(results):.1%}")
+    print(f"busy (gave up): {busy}")
+    print(f"latency p50:    {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"latency p99:    {percentile(latencies, 99) * 1000:.2f} ms")
+    if problems:
+        for problem in problems:
+            print(f"FAIL {problem}")
+        return 1
+    print("No seat was double-sold.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
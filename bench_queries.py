@@ -0,0 +1,187 @@
+"""Latency benchmarks for the queries and data-access paths behind app.py.
+
+Generates a synthetic database (see synthetic_data.py), then times:
+
+- every statement in query_plans.HOT_QUERIES, run directly (writes are
+  rolled back so each repeat sees the same data);
+- the service-layer calls BusAppGUI makes for its screens, through the
+  connection pool with the reference cache bypassed.
+
+Each result is the median of --repeat runs. With --save the results become
+the baseline for this scale; otherwise they are compared with the saved
+baseline and the script exits 1 if anything is more than --tolerance slower
+(and at least NOISE_FLOOR_MS slower in absolute terms).
+
+Usage: python bench_queries.py [--scale small|medium|large] [--buses N]
+                               [--repeat N] [--tolerance 0.5] [--save]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import connection_pool
+import ref_cache
+import roster
+import services
+from query_plans import HOT_QUERIES
+from synthetic_data import SCALES, generate
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+TOLERANCE = 0.5       # fail when 50% slower than the baseline...
+NOISE_FLOOR_MS = 2.0  # ...and the difference is also at least this large
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def bench_statements(path, repeat):
+    """Time each hot statement on a plain connection; returns {name: ms}."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    results = {}
+    try:
+        for name, sql, params, _ in HOT_QUERIES:
+            def run():
+                conn.execute("BEGIN")
+                try:
+                    conn.execute(sql, params).fetchall()
+                finally:
+                    conn.execute("ROLLBACK")
+            results["sql: " + name] = _median_ms(run, repeat)
+    finally:
+        conn.close()
+    return results
+
+
+def access_paths(buses):
+    """(name, callable) for the service calls behind each BusAppGUI screen."""
+    bus_id = min(42, buses)
+    bus_name, route_name = f"Bus {bus_id}", f"Route {bus_id}"
+    with connection_pool.get_pool().reader() as conn:
+        ticket_id = conn.execute(
+            "SELECT ticket_id FROM tickets WHERE bus_id = ? AND status = 'unsold' LIMIT 1", (bus_id,)
+        ).fetchone()[0]
+        origin, destination = conn.execute(
+            "SELECT a.name, b.name FROM route_stops AS ra JOIN stops AS a ON a.stop_id = ra.stop_id "
+            "JOIN route_stops AS rb ON rb.route_id = ra.route_id AND rb.seq = ra.seq + 1 "
+            "JOIN stops AS b ON b.stop_id = rb.stop_id WHERE ra.route_id = ? AND ra.seq = 1",
+            (bus_id,),
+        ).fetchone()
+    bus_fields = services.get_bus(bus_id)
+
+    def toggle_ticket():
+        services.set_ticket_status(ticket_id, "sold", "unsold")
+        services.set_ticket_status(ticket_id, "unsold", "sold")
+
+    return [
+        ("view_all_details first page", lambda: services.details_page(0)),
+        ("view_all_details middle page", lambda: services.details_page(buses // 2)),
+        ("view_all_buses", services.list_buses),
+        ("view_all_buses seats left", services.seats_left),
+        ("view_all_buses search", lambda: services.search_buses(origin[:3] + " " + bus_name)),
+        ("update_bus bus list", services.list_bus_names),
+        ("update_bus fetch details", lambda: services.get_bus(bus_id)),
+        ("update_bus save", lambda: services.update_bus(bus_id, bus_fields)),
+        ("manage_routes list", services.list_routes),
+        ("find_buses", lambda: services.find_buses(origin, destination)),
+        ("manage_drivers list", services.list_drivers),
+        ("update_driver fetch", lambda: services.get_driver(1)),
+        ("manage_tickets list", services.list_tickets),
+        ("update_ticket sold/unsold", toggle_ticket),
+        ("prebook_bus schedules", lambda: services.find_schedules(bus_name, route_name)),
+        ("route trips 30 days", lambda: services.trips_between("2024-11-01", "2024-11-30", route_id=bus_id)),
+        ("auto roster week (dry run)", lambda: roster.auto_assign("2024-11-04", "2024-11-10", save=False)),
+    ]
+
+
+def bench_paths(path, buses, repeat):
+    """Time each service call against `path`; returns {name: ms}."""
+    connection_pool.configure(path)
+    results = {}
+    try:
+        with ref_cache.cache.disabled():
+            for name, fn in access_paths(buses):
+                results["path: " + name] = _median_ms(fn, repeat)
+    finally:
+        connection_pool.close_pool()
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return a description of every result that regressed against `baseline`."""
+    regressions = []
+    for name, ms in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if ms > before * (1 + tolerance) and ms - before >= NOISE_FLOOR_MS:
+            regressions.append(f"{name}: {before:.2f} ms -> {ms:.2f} ms (+{(ms / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def load_baselines(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--buses", type=int, help="overrides --scale")
+    parser.add_argument("--seats", type=int, default=40, help="seats per bus")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="record these results as the baseline")
+    args = parser.parse_args(argv)
+
+    buses = args.buses or SCALES[args.scale]
+    key = f"{buses} buses x {args.seats} seats"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        generate(path, buses=buses, seats_per_bus=args.seats)
+        print(f"Generated {key} in {time.perf_counter() - started:.1f}s")
+        results = bench_statements(path, args.repeat)
+        results.update(bench_paths(path, buses, args.repeat))
+
+    baselines = load_baselines(args.baseline)
+    baseline = baselines.get(key, {})
+    for name, ms in results.items():
+        before = baseline.get(name)
+        note = f"  (baseline {before:.2f})" if before is not None else ""
+        print(f"{ms:10.2f} ms  {name}{note}")
+
+    if args.save:
+        baselines[key] = {name: round(ms, 3) for name, ms in results.items()}
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"Saved baseline for {key} to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline for {key}; run with --save to record one.")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"FAIL {line}")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
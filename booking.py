@@ -0,0 +1,141 @@
+"""Concurrency-safe booking operations.
+
+Every operation runs in a BEGIN IMMEDIATE transaction and changes rows only
+through conditional updates (e.g. `WHERE status = 'unsold'`), so two agents
+racing for the same seat or trip cannot both win. SQLITE_BUSY/locked errors
+are retried a bounded number of times with jittered exponential backoff.
+"""
+import random
+import sqlite3
+import time
+from collections import namedtuple
+
+from database import get_transaction
+from seat_inventory import HELD, MISSING, SeatUnavailable, inventory
+
+BOOKED = "booked"
+UPDATED = "updated"
+CONFLICT = "conflict"
+NOT_FOUND = "not_found"
+BUSY = "busy"
+
+BookingResult = namedtuple("BookingResult", "status record_id attempts message")
+
+RETRY_ATTEMPTS = 6
+RETRY_BASE_DELAY = 0.01
+RETRY_MAX_DELAY = 0.5
+
+# How SQLite reports a second prebooking of a trip (idx_prebooked_trip)
+PREBOOKED_TRIP_CONFLICT = "UNIQUE constraint failed: prebooked_buses.bus_id, prebooked_buses.schedule_id"
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def with_retry(operation, attempts=RETRY_ATTEMPTS):
+    """Run operation(attempt) and retry it while the database is busy.
+
+    Returns BookingResult(BUSY, ...) once the attempts are used up instead of
+    raising, so callers always get a clean outcome.
+    """
+    delay = RETRY_BASE_DELAY
+    for attempt in range(1, attempts + 1):
+        try:
+            return operation(attempt)
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+            if attempt == attempts:
+                return BookingResult(BUSY, None, attempt, "Database is busy, please try again.")
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+def book_seat(bus_id, seat_number, user_id, schedule_id=None):
+    """Sell one seat that is free, or held for the user, and record the transaction.
+
+    Goes through the seat inventory, so seats held for another customer
+    are not sold from under them.
+    """
+    def attempt(n):
+        try:
+            ticket_ids = inventory.sell(bus_id, [seat_number], user_id, schedule_id)
+        except SeatUnavailable as e:
+            if e.reason == MISSING:
+                return BookingResult(NOT_FOUND, None, n, "No such seat.")
+            if e.reason == HELD:
+                return BookingResult(CONFLICT, None, n, "Seat is being held for another customer.")
+            return BookingResult(CONFLICT, None, n, "Seat is already sold.")
+        return BookingResult(BOOKED, ticket_ids[0], n, "Seat booked.")
+
+    return with_retry(attempt)
+
+def set_ticket_status(ticket_id, new_status, expected_status):
+    """Change a ticket's status only if it still has `expected_status`.
+
+    Guards admin edits against a concurrent sale: if someone else changed the
+    ticket since it was displayed, the result is CONFLICT and nothing changes.
+    """
+    return set_ticket_statuses([(ticket_id, expected_status)], new_status)[0]
+
+def set_ticket_statuses(changes, new_status):
+    """set_ticket_status() for [(ticket_id, expected_status)] in one transaction.
+
+    Returns a BookingResult per ticket; tickets changed by someone else are
+    left alone and the rest are updated.
+    """
+    if new_status not in ("sold", "unsold"):
+        raise ValueError("Status must be 'sold' or 'unsold'.")
+
+    def attempt(n):
+        results = []
+        with get_transaction() as conn:
+            cur = conn.cursor()
+            for ticket_id, expected_status in changes:
+                cur.execute(
+                    "UPDATE tickets SET status = ? WHERE ticket_id = ? AND status = ?",
+                    (new_status, ticket_id, expected_status),
+                )
+                if cur.rowcount == 1:
+                    results.append(BookingResult(UPDATED, ticket_id, n, "Ticket updated."))
+                    continue
+                cur.execute("SELECT 1 FROM tickets WHERE ticket_id = ?", (ticket_id,))
+                if cur.fetchone() is None:
+                    results.append(BookingResult(NOT_FOUND, ticket_id, n, "Ticket no longer exists."))
+                else:
+                    results.append(BookingResult(CONFLICT, ticket_id, n, "Ticket was changed by someone else."))
+        return results
+
+    results = with_retry(attempt)
+    if isinstance(results, BookingResult):  # busy
+        return [results._replace(record_id=ticket_id) for ticket_id, _ in changes]
+    return results
+
+def prebook(user_id, bus_id, schedule_id):
+    """Prebook a bus's whole trip for a user, if it runs that schedule and the trip is still free."""
+    def attempt(n):
+        with get_transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT 1 FROM schedules WHERE schedule_id = ? AND bus_id = ?",
+                (schedule_id, bus_id),
+            )
+            if cur.fetchone() is None:
+                return BookingResult(NOT_FOUND, None, n, "That schedule does not belong to this bus.")
+            try:
+                cur.execute(
+                    """
+                    INSERT INTO prebooked_buses (user_id, bus_id, schedule_id, prebook_date)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    """,
+                    (user_id, bus_id, schedule_id),
+                )
+            except sqlite3.IntegrityError as e:
+                # idx_prebooked_trip lets only one prebooking per trip in; any
+                # other constraint failure is a real error
+                if PREBOOKED_TRIP_CONFLICT not in str(e):
+                    raise
+                return BookingResult(CONFLICT, None, n, "This trip has already been prebooked.")
+            return BookingResult(BOOKED, cur.lastrowid, n, "Bus prebooked.")
+
+    return with_retry(attempt)
@@ -0,0 +1,328 @@
+"""Bulk import and export of buses, routes and schedules.
+
+One row per scheduled trip, with the same fields as the Add Bus form
+(services.BUS_FIELDS). Rows sharing a bus number add schedules to the same
+bus; rows naming an existing route or bus reuse it.
+
+The importer streams its input, validates each row, and writes in batches
+with executemany inside a single BEGIN IMMEDIATE transaction. Row ids are
+allocated up front so no per-row lastrowid round trips are needed. Once an
+import turns out to be large (DEFER_MIN_ROWS rows, and at least
+DEFER_FRACTION of the trips already stored), secondary indexes on the tables
+being loaded are dropped for the rest of it and rebuilt once at the end;
+smaller imports just maintain them, which is cheaper than rebuilding them
+from the whole table. Invalid rows are skipped and reported with their line
+number; with strict=True any error rolls the whole import back.
+
+The exporter walks a cursor and writes rows as they arrive.
+
+Usage:
+    python bulk_io.py import depot.csv [--strict] [--dry-run] [--keep-indexes | --defer-indexes]
+    python bulk_io.py export fleet.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import namedtuple
+
+from database import get_read_connection, get_transaction
+from ref_cache import invalidates
+from route_stops import parse_stops
+from services import BUS_FIELDS, ServiceError, validate_bus
+
+BATCH_SIZE = 1000
+DEFERRED_INDEX_TABLES = ("buses", "schedules", "driver_assignments", "route_stops")
+DEFER_MIN_ROWS = 10000
+DEFER_FRACTION = 0.25   # of the schedules already stored
+
+ImportResult = namedtuple("ImportResult", "rows routes buses schedules errors committed")
+
+
+class _Rollback(Exception):
+    pass
+
+
+def detect_format(path):
+    return "jsonl" if path.endswith((".jsonl", ".json", ".ndjson")) else "csv"
+
+def read_rows(stream, fmt="csv"):
+    """Yield (line_number, fields, error) for each input row without reading ahead."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = [field for field in BUS_FIELDS if field not in (reader.fieldnames or [])]
+        optional = {"co_driver_id"}
+        if [field for field in missing if field not in optional]:
+            raise ServiceError(f"CSV header is missing: {', '.join(missing)}")
+        for fields in reader:
+            yield reader.line_num, fields, None
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                fields = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(fields, dict):
+                yield line_number, None, "Each line must be a JSON object."
+                continue
+            yield line_number, fields, None
+    else:
+        raise ServiceError(f"Unknown format {fmt!r}; use csv or jsonl.")
+
+
+def _next_id(conn, table, column):
+    """First id after both the highest row and the AUTOINCREMENT sequence."""
+    highest = conn.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}").fetchone()[0]
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return max(highest, seq[0] if seq else 0) + 1
+
+def _drop_indexes(conn):
+    """Drop secondary indexes on the loaded tables; returns their CREATE statements."""
+    marks = ", ".join("?" * len(DEFERRED_INDEX_TABLES))
+    indexes = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({marks})",
+        DEFERRED_INDEX_TABLES,
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+class _Loader:
+    """Validates rows and queues them for batched inserts on one connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.next_route = _next_id(conn, "routes", "route_id")
+        self.next_bus = _next_id(conn, "buses", "bus_id")
+        self.driver_ids = {row[0] for row in conn.execute("SELECT driver_id FROM drivers")}
+        self.routes = {}     # route_name -> route_id
+        self.buses = {}      # bus number -> (bus_id, route_id)
+        self.trips = set()   # (bus_id, departure_date, departure_time) queued
+        self.counts = {"routes": 0, "buses": 0, "schedules": 0}
+        self._clear()
+
+    def _clear(self):
+        self.new_stops = set()
+        self.new_routes = []
+        self.new_route_stops = []
+        self.new_buses = []
+        self.new_schedules = []
+        self.new_assignments = []
+
+    def _route_id(self, name, stops):
+        if name not in self.routes:
+            row = self.conn.execute(
+                "SELECT route_id FROM routes WHERE route_name = ? LIMIT 1", (name,)
+            ).fetchone()
+            if row:
+                self.routes[name] = row[0]
+            else:
+                route_id = self.routes[name] = self.next_route
+                self.next_route += 1
+                names = parse_stops(stops)
+                self.new_stops.update(names)
+                self.new_routes.append((route_id, name, stops))
+                self.new_route_stops.extend((route_id, seq, stop) for seq, stop in enumerate(names))
+        return self.routes[name]
+
+    def _bus(self, v):
+        number = v["number"]
+        if number not in self.buses:
+            row = self.conn.execute(
+                "SELECT bus_id, route_id FROM buses WHERE number = ?", (number,)
+            ).fetchone()
+            if row:
+                self.buses[number] = tuple(row)
+            else:
+                route_id = self._route_id(v["route_name"], v["stops"])
+                bus_id = self.next_bus
+                self.next_bus += 1
+                self.buses[number] = (bus_id, route_id)
+                self.new_buses.append((bus_id, v["name"], number, route_id, v["ticket_price"],
+                                       v["capacity"], v["driver_id"], v["co_driver_id"]))
+                self.new_assignments.append((bus_id, v["driver_id"]))
+                if v["co_driver_id"]:
+                    self.new_assignments.append((bus_id, v["co_driver_id"]))
+        return self.buses[number]
+
+    def add(self, fields):
+        """Validate one row and queue its inserts; raises ServiceError if invalid."""
+        v = validate_bus(fields)
+        for key in ("driver_id", "co_driver_id"):
+            if v[key] and v[key] not in self.driver_ids:
+                raise ServiceError(f"Driver {v[key]} does not exist.")
+
+        bus_id, route_id = self._bus(v)
+        trip = (bus_id, v["departure_date"], v["departure_time"])
+        if trip in self.trips or self.conn.execute(
+            "SELECT 1 FROM schedules WHERE bus_id = ? AND departure_date = ? AND departure_time = ?", trip
+        ).fetchone():
+            raise ServiceError("Duplicate schedule for this bus.")
+        self.trips.add(trip)
+        self.new_schedules.append((bus_id, route_id, v["departure_date"], v["departure_time"],
+                                   v["arrival_time"]))
+        if len(self.new_schedules) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        cur = self.conn.cursor()
+        cur.executemany("INSERT OR IGNORE INTO stops (name) VALUES (?)", ((s,) for s in self.new_stops))
+        cur.executemany("INSERT INTO routes (route_id, route_name, stops) VALUES (?, ?, ?)", self.new_routes)
+        cur.executemany(
+            """
+            INSERT INTO route_stops (route_id, seq, stop_id)
+            SELECT ?, ?, stop_id FROM stops WHERE name = ?
+            """,
+            self.new_route_stops,
+        )
+        cur.executemany(
+            """
+            INSERT INTO buses (bus_id, name, number, route_id, ticket_price, capacity, driver_id1, driver_id2)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            self.new_buses,
+        )
+        cur.executemany(
+            """
+            INSERT INTO schedules (bus_id, route_id, departure_date, departure_time, arrival_time)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            self.new_schedules,
+        )
+        cur.executemany("INSERT INTO driver_assignments (bus_id, driver_id) VALUES (?, ?)", self.new_assignments)
+        self.counts["routes"] += len(self.new_routes)
+        self.counts["buses"] += len(self.new_buses)
+        self.counts["schedules"] += len(self.new_schedules)
+        self._clear()
+
+
+@invalidates("buses", "routes")
+def import_rows(rows, strict=False, dry_run=False, defer_indexes=None):
+    """Load (line_number, fields, error) rows in one transaction; returns ImportResult.
+
+    errors is a list of (line_number, message). Nothing is committed when
+    dry_run is set, or when strict is set and any row failed. defer_indexes
+    True or False forces index deferral on or off; None decides by size.
+    """
+    errors = []
+    total = 0
+    committed = False
+    try:
+        with get_transaction() as conn:
+            index_sql = _drop_indexes(conn) if defer_indexes else []
+            deferred = bool(defer_indexes)
+            # Highest id as a cheap estimate of the table's size
+            threshold = max(DEFER_MIN_ROWS, DEFER_FRACTION * (_next_id(conn, "schedules", "schedule_id") - 1))
+            loader = _Loader(conn)
+            for line_number, fields, error in rows:
+                total += 1
+                if defer_indexes is None and not deferred and total >= threshold:
+                    # Large enough: rows still to come are cheaper to index in one rebuild
+                    index_sql, deferred = _drop_indexes(conn), True
+                if error is None:
+                    try:
+                        loader.add(fields)
+                    except ServiceError as e:
+                        error = str(e)
+                if error is not None:
+                    errors.append((line_number, error))
+            loader.flush()
+            for sql in index_sql:
+                conn.execute(sql)
+            if dry_run or (strict and errors):
+                raise _Rollback()
+            committed = True
+    except _Rollback:
+        pass
+    return ImportResult(total, loader.counts["routes"], loader.counts["buses"],
+                        loader.counts["schedules"], errors, committed)
+
+def import_file(path, fmt=None, **options):
+    """Import a CSV or JSONL file; see import_rows for the options."""
+    with open(path, newline="", encoding="utf-8") as stream:
+        return import_rows(read_rows(stream, fmt or detect_format(path)), **options)
+
+
+EXPORT_QUERY = """
+    SELECT b.name, b.number, b.ticket_price, b.capacity, r.route_name, r.stops,
+        b.driver_id1, b.driver_id2, s.departure_date, s.departure_time, s.arrival_time
+    FROM buses b
+    JOIN routes r ON r.route_id = b.route_id
+    JOIN schedules s ON s.bus_id = b.bus_id
+    ORDER BY b.bus_id, s.departure_date, s.departure_time
+"""
+
+def export_rows(stream, fmt="csv"):
+    """Write every scheduled trip in import format; returns the row count.
+
+    Buses without a schedule are not exported, as the importer needs one.
+    """
+    count = 0
+    with get_read_connection() as conn:
+        cur = conn.execute(EXPORT_QUERY)
+        if fmt == "csv":
+            writer = csv.writer(stream)
+            writer.writerow(BUS_FIELDS)
+            for row in cur:
+                writer.writerow(row)
+                count += 1
+        elif fmt == "jsonl":
+            for row in cur:
+                stream.write(json.dumps(dict(zip(BUS_FIELDS, row))) + "\n")
+                count += 1
+        else:
+            raise ServiceError(f"Unknown format {fmt!r}; use csv or jsonl.")
+    return count
+
+def export_file(path, fmt=None):
+    with open(path, "w", newline="", encoding="utf-8") as stream:
+        return export_rows(stream, fmt or detect_format(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export of buses and schedules")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="load a CSV/JSONL file ('-' for stdin)")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=("csv", "jsonl"))
+    imp.add_argument("--strict", action="store_true", help="roll back everything if any row fails")
+    imp.add_argument("--dry-run", action="store_true", help="validate only")
+    indexes = imp.add_mutually_exclusive_group()
+    indexes.add_argument("--keep-indexes", dest="defer_indexes", action="store_false", default=None,
+                         help="never defer index maintenance")
+    indexes.add_argument("--defer-indexes", dest="defer_indexes", action="store_true",
+                         help="always defer index maintenance")
+    exp = sub.add_parser("export", help="write a CSV/JSONL file ('-' for stdout)")
+    exp.add_argument("path")
+    exp.add_argument("--format", choices=("csv", "jsonl"))
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+    if args.command == "export":
+        if args.path == "-":
+            count = export_rows(sys.stdout, fmt)
+        else:
+            count = export_file(args.path, fmt)
+        print(f"Exported {count} rows.", file=sys.stderr)
+        return 0
+
+    options = dict(strict=args.strict, dry_run=args.dry_run, defer_indexes=args.defer_indexes)
+    if args.path == "-":
+        result = import_rows(read_rows(sys.stdin, fmt), **options)
+    else:
+        result = import_file(args.path, fmt, **options)
+    for line_number, message in result.errors:
+        print(f"line {line_number}: {message}", file=sys.stderr)
+    state = "committed" if result.committed else "rolled back"
+    print(f"{result.rows} rows read, {len(result.errors)} rejected; {result.routes} routes, "
+          f"{result.buses} buses, {result.schedules} schedules {state}.")
+    return 1 if result.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
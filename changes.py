@@ -0,0 +1,76 @@
+"""Change feed for incremental list refreshes.
+
+Triggers in schema.sql append (table, row id) to change_log on every write
+to tickets, drivers and routes. A view remembers the last version it showed
+and asks `poll` for what happened since: usually a handful of row ids whose
+current rows it patches in place, and nothing at all when the database has
+not changed. It falls back to a full reload when the log has been pruned
+past its version, too many rows changed, or a "reload" table changed.
+
+prune() keeps the log to its newest PRUNE_KEEP rows; it runs in init_db()
+and in every scheduled archive.maintain().
+"""
+import json
+from collections import namedtuple
+
+from connection_pool import get_pool
+from database import get_read_connection
+
+PRUNE_KEEP = 10000   # change_log rows kept by prune()
+MAX_PATCH = 500      # more changed rows than this and a full reload is cheaper
+
+# rows: the whole list (full reload) or None; changed: {row_id: row or None}
+Delta = namedtuple("Delta", "version data_version rows changed")
+
+
+def current_version(conn):
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+
+def changed_ids(conn, since, tables):
+    """Row ids per table changed after `since`, or None if the log no longer reaches back."""
+    oldest = conn.execute("SELECT MIN(version) FROM change_log").fetchone()[0]
+    if oldest is not None and oldest > since + 1:
+        return None
+    marks = ", ".join("?" * len(tables))
+    changed = {table: set() for table in tables}
+    for table, row_id in conn.execute(
+        f"SELECT table_name, row_id FROM change_log WHERE version > ? AND table_name IN ({marks})",
+        (since, *tables),
+    ):
+        changed[table].add(row_id)
+    return changed
+
+def poll(since, data_version, query, id_column, table, reload_on=()):
+    """What changed in the list `query` since change version `since`.
+
+    `query` is the list's SELECT (first column = row id, no WHERE clause) and
+    `data_version` the pool data_version from the previous Delta. Pass
+    since=None for the initial load. Returns a Delta; when nothing changed,
+    both rows and changed are None and no reader connection is used.
+    """
+    seen = get_pool().data_version()
+    if since is not None and seen == data_version:
+        return Delta(since, seen, None, None)
+
+    with get_read_connection() as conn:
+        conn.execute("BEGIN")  # version and rows from one snapshot
+        version = current_version(conn)
+        if since is not None and version == since:
+            return Delta(since, seen, None, None)
+
+        changed = None if since is None else changed_ids(conn, since, (table,) + tuple(reload_on))
+        if (changed is None or any(changed[other] for other in reload_on)
+                or len(changed[table]) > MAX_PATCH):
+            return Delta(version, seen, conn.execute(f"{query} ORDER BY {id_column}").fetchall(), None)
+
+        ids = sorted(changed[table])
+        rows = {row[0]: row for row in conn.execute(
+            f"{query} WHERE {id_column} IN (SELECT value FROM json_each(?))", (json.dumps(ids),)
+        )}
+        return Delta(version, seen, None, {row_id: rows.get(row_id) for row_id in ids})
+
+def prune(conn, keep=PRUNE_KEEP):
+    """Drop all but the newest `keep` log rows; returns how many were removed."""
+    return conn.execute(
+        "DELETE FROM change_log WHERE version <= (SELECT MAX(version) FROM change_log) - ?", (keep,)
+    ).rowcount
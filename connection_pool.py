@@ -0,0 +1,283 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Pragmas applied once to every pooled connection.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA cache_size = -16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 134217728",    # 128 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+)
+
+CACHED_STATEMENTS = 256
+BUSY_TIMEOUT = 5.0
+
+
+class ConnectionPool:
+    """Hands out long-lived SQLite connections: one writer and N readers."""
+
+    def __init__(self, path, readers=4, timeout=BUSY_TIMEOUT):
+        self.path = path
+        self.max_readers = readers
+        self.timeout = timeout
+        self.connection_factory = sqlite3.Connection
+        self.on_connect = []  # callables run on every new connection
+
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._writer_owner = None
+        self._writer_depth = 0
+        self._idle_readers = queue.LifoQueue()
+        self._probe = None
+        self._probe_lock = threading.Lock()
+        self._reader_count = 0
+        self._closed = False
+
+        self._stats = {
+            "opened": 0,
+            "closed": 0,
+            "acquired": 0,
+            "reused": 0,
+            "in_use": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    def _connect(self):
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+            factory=self.connection_factory,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        for hook in self.on_connect:
+            hook(conn)
+        with self._lock:
+            self._stats["opened"] += 1
+        return conn
+
+    def _record_acquire(self, started, reused):
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["in_use"] += 1
+            if reused:
+                self._stats["reused"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+    def _record_release(self):
+        with self._lock:
+            self._stats["in_use"] -= 1
+
+    @contextmanager
+    def writer(self):
+        """Borrow the writer connection; commit on success, roll back on error.
+
+        Re-entrant within a thread: nested blocks share the outer transaction.
+        """
+        me = threading.get_ident()
+        if self._writer_owner == me:
+            self._writer_depth += 1
+            try:
+                yield self._writer
+            finally:
+                self._writer_depth -= 1
+            return
+
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed.")
+        started = time.perf_counter()
+        self._writer_lock.acquire()
+        try:
+            reused = self._writer is not None
+            if not reused:
+                self._writer = self._connect()
+            self._writer_owner = me
+            self._record_acquire(started, reused)
+            conn = self._writer
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                self._record_release()
+        finally:
+            self._writer_owner = None
+            self._writer_lock.release()
+
+    @contextmanager
+    def transaction(self):
+        """Borrow the writer inside a BEGIN IMMEDIATE transaction.
+
+        Takes SQLite's write lock up front, so read-check-write sequences
+        cannot be interleaved with another connection's writes.
+        """
+        with self.writer() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection from the reader pool."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed.")
+        started = time.perf_counter()
+        conn, reused = None, True
+        try:
+            conn = self._idle_readers.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._reader_count < self.max_readers
+                if can_open:
+                    self._reader_count += 1
+            if can_open:
+                try:
+                    conn, reused = self._connect(), False
+                except Exception:
+                    with self._lock:
+                        self._reader_count -= 1
+                    raise
+            else:
+                conn = self._idle_readers.get()
+        self._record_acquire(started, reused)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._record_release()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle_readers.put(conn)
+
+    def data_version(self):
+        """Return PRAGMA data_version from a dedicated probe connection.
+
+        The value changes whenever any other connection (in this process or
+        another) commits, which makes it a cheap "has anything changed?" test
+        for in-memory caches. It is only comparable between calls to this
+        method, never across connections.
+        """
+        with self._probe_lock:
+            if self._probe is None:
+                self._probe = self._connect()
+            return self._probe.execute("PRAGMA data_version").fetchone()[0]
+
+    def external_version(self):
+        """Return PRAGMA data_version as seen by the writer, or None.
+
+        Unlike data_version(), this ignores commits made through this pool's
+        own writer, so it only moves when another process changed the file.
+        Returns None (meaning "assume changed") when the writer has not been
+        opened yet or is busy, rather than waiting for it.
+        """
+        if self._writer is None or not self._writer_lock.acquire(blocking=False):
+            return None
+        try:
+            if self._writer is None:
+                return None
+            return self._writer.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            self._writer_lock.release()
+
+    def stats(self):
+        """Return a snapshot of pool usage counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["open"] = (self._reader_count + (1 if self._writer is not None else 0)
+                                + (1 if self._probe is not None else 0))
+            snapshot["readers_open"] = self._reader_count
+            snapshot["readers_idle"] = self._idle_readers.qsize()
+        acquired = snapshot["acquired"]
+        snapshot["reuse_ratio"] = snapshot["reused"] / acquired if acquired else 0.0
+        snapshot["wait_avg"] = snapshot["wait_total"] / acquired if acquired else 0.0
+        return snapshot
+
+    def health(self):
+        """Check that the database answers and report pool statistics."""
+        report = self.stats()
+        try:
+            with self.reader() as conn:
+                conn.execute("SELECT 1").fetchone()
+                report["journal_mode"] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            report["ok"] = True
+        except sqlite3.Error as e:
+            report["ok"] = False
+            report["error"] = str(e)
+        return report
+
+    def close(self):
+        """Close every pooled connection."""
+        self._closed = True
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                with self._lock:
+                    self._stats["closed"] += 1
+        with self._probe_lock:
+            if self._probe is not None:
+                self._probe.close()
+                self._probe = None
+                with self._lock:
+                    self._stats["closed"] += 1
+        while True:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._reader_count -= 1
+                self._stats["closed"] += 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if path is None:
+                from database import DB_NAME
+                path = DB_NAME
+            _pool = ConnectionPool(path)
+        return _pool
+
+
+def configure(path, readers=4, timeout=BUSY_TIMEOUT):
+    """Replace the process-wide pool, e.g. to point at another database file."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(path, readers=readers, timeout=timeout)
+        return _pool
+
+
+def close_pool():
+    """Close the process-wide pool if one is open."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
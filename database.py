@@ -1,14 +1,57 @@
-import sqlite3
+from connection_pool import get_pool
 
 DB_NAME = "bus_service.db"
 
+# Columns added to tables after their first release: (table, column, declaration).
+# CREATE TABLE IF NOT EXISTS leaves old tables alone, so these are applied by hand.
+ADDED_COLUMNS = [
+    ("tickets", "schedule_id", "INTEGER REFERENCES schedules(schedule_id) ON DELETE CASCADE"),
+    ("schedules", "departure_ts", "TEXT"),
+    ("schedules", "arrival_ts", "TEXT"),
+    ("schedules", "pattern_id", "INTEGER REFERENCES schedule_patterns(pattern_id) ON DELETE SET NULL"),
+    ("tickets", "base_price", "REAL"),
+    ("prebooked_buses", "schedule_id", "INTEGER"),
+]
+
+def add_missing_columns(conn):
+    """Bring tables created by older versions of schema.sql up to date."""
+    for table, column, declaration in ADDED_COLUMNS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if existing and column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
 def init_db():
     """Initialize the database and create tables if they don't exist."""
-    with sqlite3.connect(DB_NAME) as conn:
+    with get_pool().writer() as conn:
+        add_missing_columns(conn)
         with open("schema.sql", "r") as schema_file:
             conn.executescript(schema_file.read())
+
+        # Local imports: these modules depend on this one
+        from route_stops import migrate_route_stops
+        from availability import migrate_availability
+        from changes import prune as prune_change_log
+        from search import migrate_search
+        from timetable import migrate_timestamps
+        migrate_route_stops(conn)
+        migrate_availability(conn)
+        migrate_search(conn)
+        migrate_timestamps(conn)
+        prune_change_log(conn)
     print("Database initialized successfully!")
 
 def get_connection():
-    """Get a database connection."""
-    return sqlite3.connect(DB_NAME)
+    """Get the shared writer connection (use as a context manager)."""
+    return get_pool().writer()
+
+def get_transaction():
+    """Get the writer inside a BEGIN IMMEDIATE transaction (use as a context manager)."""
+    return get_pool().transaction()
+
+def get_read_connection():
+    """Get a pooled read-only connection (use as a context manager)."""
+    return get_pool().reader()
+
+def pool_stats():
+    """Return health and usage statistics for the connection pool."""
+    return get_pool().health()
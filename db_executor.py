@@ -0,0 +1,120 @@
+import queue
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from tkinter import messagebox
+
+from instrumentation import timed
+
+
+class DBExecutor:
+    """Runs database jobs on worker threads and hands results back to Tk.
+
+    Jobs are plain callables; `submit` returns a concurrent.futures.Future.
+    Callbacks always run on the Tk thread: workers push finished jobs onto a
+    queue which is drained from a `root.after` poll that only runs while jobs
+    are outstanding. Submitting with a `key` supersedes the previous job with
+    the same key, so stale results (e.g. an older refresh) are never shown.
+    """
+
+    def __init__(self, root, workers=4, poll_ms=30):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._done = queue.Queue()
+        self._latest = {}
+        self._pending = 0
+        self._visible = 0  # outstanding jobs that show the busy cursor
+        self._polling = False
+        self._lock = threading.Lock()
+        self._saved_cursor = None
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, widget=None, quiet=False, **kwargs):
+        """Run fn(*args, **kwargs) on a worker thread.
+
+        on_done(result) / on_error(exc) run on the Tk thread. If `widget` is
+        given, callbacks are skipped once it has been destroyed. Background
+        jobs (e.g. auto-refresh polls) pass quiet=True to skip the busy cursor.
+        """
+        # Timed as "job:<name>": the handler that submits it returns at once
+        job = timed("job:" + getattr(fn, "__name__", "job"))(fn)
+        future = self._pool.submit(job, *args, **kwargs)
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._latest[key] = future
+
+        self._set_busy(1, quiet)
+        future.add_done_callback(lambda f: self._done.put((f, key, on_done, on_error, widget, quiet)))
+        self._schedule_poll()
+        return future
+
+    def cancel(self, key):
+        """Cancel (or discard the result of) the outstanding job for `key`."""
+        future = self._latest.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        while True:
+            try:
+                future, key, on_done, on_error, widget, quiet = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._set_busy(-1, quiet)
+            self._deliver(future, key, on_done, on_error, widget)
+        if self._pending:
+            self._schedule_poll()
+
+    def _deliver(self, future, key, on_done, on_error, widget):
+        if key is not None:
+            if self._latest.get(key) is not future:
+                return  # superseded by a newer job
+            del self._latest[key]
+        if future.cancelled():
+            return
+        if widget is not None and not widget.winfo_exists():
+            return
+        try:
+            result = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            else:
+                messagebox.showerror("Error", str(e))
+            return
+        if on_done is not None:
+            on_done(result)
+
+    def _set_busy(self, delta, quiet=False):
+        """Show a busy cursor while any non-quiet job is outstanding."""
+        with self._lock:
+            self._pending += delta
+            if not quiet:
+                self._visible += delta
+            visible = self._visible
+        try:
+            if visible and self._saved_cursor is None:
+                self._saved_cursor = self.root.cget("cursor")
+                self.root.configure(cursor="watch")
+            elif not visible and self._saved_cursor is not None:
+                self.root.configure(cursor=self._saved_cursor)
+                self._saved_cursor = None
+        except Exception:
+            pass  # root already destroyed
+
+    @property
+    def busy(self):
+        return self._visible > 0
+
+    def shutdown(self, wait=False):
+        """Stop accepting jobs and cancel anything not yet started."""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,327 @@
+"""Query tracing and latency metrics.
+
+install(pool) makes every pooled connection an instrumented one:
+
+- each statement run through a cursor is timed from execute() until its
+  result set is exhausted, and counted with the rows it returned or changed;
+- sqlite3's trace callback counts every statement SQLite runs, including
+  those fired inside triggers and executescript();
+- statements slower than SLOW_QUERY_MS are kept with their query plan.
+
+Handlers are timed with the `timed` decorator or `instrument(obj, names)`.
+Metrics are held in latency histograms and can be written as JSON or
+Prometheus text with `dump(path)`, on exit and on demand.
+"""
+import atexit
+import bisect
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SLOW_QUERY_MS = float(os.environ.get("BUS_SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG = 50
+MAX_STATEMENTS = 500  # distinct SQL texts tracked; the rest share one bucket
+
+# Upper bounds in seconds, Prometheus style (the last bucket is +Inf)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Bucketed latency histogram with count, sum, max and rows."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def observe(self, seconds, rows=0):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "rows": self.rows,
+        }
+
+
+class Metrics:
+    """Thread-safe store of statement and handler histograms."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.handlers = {}
+        self.traced = {}
+        self.slow = deque(maxlen=SLOW_QUERY_LOG)
+        self.started = time.time()
+
+    def observe_statement(self, sql, seconds, rows):
+        key = normalize(sql)
+        with self.lock:
+            if key not in self.statements and len(self.statements) >= MAX_STATEMENTS:
+                key = "(other)"
+            self.statements.setdefault(key, Histogram()).observe(seconds, rows)
+
+    def observe_handler(self, name, seconds):
+        with self.lock:
+            self.handlers.setdefault(name, Histogram()).observe(seconds)
+
+    def count_traced(self, sql):
+        key = normalize(sql)
+        with self.lock:
+            if key not in self.traced and len(self.traced) >= MAX_STATEMENTS:
+                key = "(other)"
+            self.traced[key] = self.traced.get(key, 0) + 1
+
+    def record_slow(self, sql, seconds, rows, plan):
+        with self.lock:
+            self.slow.append({
+                "sql": normalize(sql),
+                "ms": round(seconds * 1000, 3),
+                "rows": rows,
+                "plan": plan,
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "slow_query_ms": SLOW_QUERY_MS,
+                "handlers": {name: h.to_dict() for name, h in sorted(self.handlers.items())},
+                "statements": {sql: h.to_dict() for sql, h in sorted(
+                    self.statements.items(), key=lambda item: -item[1].total)},
+                "traced_statements": dict(sorted(self.traced.items(), key=lambda item: -item[1])),
+                "slow_queries": list(self.slow),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.handlers.clear()
+            self.traced.clear()
+            self.slow.clear()
+            self.started = time.time()
+
+
+metrics = Metrics()
+
+
+def normalize(sql):
+    return re.sub(r"\s+", " ", sql).strip()[:300]
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Times each statement from execute() until its rows are used up."""
+
+    _pending = None  # [sql, params, started, seconds, rows] of the open statement
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._pending = [sql, params, time.perf_counter(), 0.0, 0]
+
+    def _run(self, method, sql, params):
+        self._begin(sql, params)
+        try:
+            method(sql, params)
+        finally:
+            pending = self._pending
+            pending[3] += time.perf_counter() - pending[2]
+            if self.description is None:
+                # Not a query: nothing to fetch, so the statement is done
+                pending[4] = max(self.rowcount, 0)
+                self._finish()
+        return self
+
+    def execute(self, sql, params=()):
+        return self._run(super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._run(super().executemany, sql, seq_of_params)
+
+    def _fetched(self, started, rows, exhausted):
+        pending = self._pending
+        if pending is None:
+            return
+        pending[3] += time.perf_counter() - started
+        pending[4] += rows
+        if exhausted:
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), len(rows) < (self.arraysize if size is None else size))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # e.g. conn.execute(...).fetchone(): the cursor is dropped unexhausted
+        self._finish()
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        sql, params, _, seconds, rows = pending
+        metrics.observe_statement(sql, seconds, rows)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            metrics.record_slow(sql, seconds, rows, _plan(self.connection, sql, params))
+
+
+def _plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN lines for a statement, or [] when it cannot be explained."""
+    if not isinstance(params, (tuple, list, dict)):
+        params = ()  # executemany: explain without its parameter stream
+    try:
+        cur = sqlite3.Cursor(conn)  # plain cursor, so explaining is not itself timed
+        return [row[3] for row in cur.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error:
+        return []
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), are traced."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def _on_connect(conn):
+    conn.set_trace_callback(metrics.count_traced)
+
+
+_dump_path = None
+
+def install(pool, dump_path=None):
+    """Instrument connections `pool` opens from now on; optionally dump on exit."""
+    global _dump_path
+    pool.connection_factory = TracedConnection
+    if _on_connect not in pool.on_connect:
+        pool.on_connect.append(_on_connect)
+    if dump_path and _dump_path is None:
+        atexit.register(lambda: dump(_dump_path))
+    _dump_path = dump_path or _dump_path
+
+
+def timed(name=None):
+    """Decorator: record how long each call of a handler takes."""
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.observe_handler(label, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def instrument(obj, names):
+    """Replace obj's bound methods `names` with timed versions."""
+    for name in names:
+        setattr(obj, name, timed(name)(getattr(obj, name)))
+
+
+def to_prometheus(snapshot=None):
+    """Render metrics in the Prometheus text exposition format."""
+    snapshot = snapshot or metrics.snapshot()
+    with metrics.lock:
+        handlers = dict(metrics.handlers)
+        statements = dict(metrics.statements)
+    lines = []
+    for metric, label, histograms in (("bus_handler_seconds", "handler", handlers),
+                                      ("bus_statement_seconds", "sql", statements)):
+        lines.append(f"# TYPE {metric} histogram")
+        for key, h in histograms.items():
+            value = key.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(BUCKETS, h.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label}="{value}",le="+Inf"}} {h.count}')
+            lines.append(f'{metric}_sum{{{label}="{value}"}} {h.total:.6f}')
+            lines.append(f'{metric}_count{{{label}="{value}"}} {h.count}')
+    lines.append("# TYPE bus_statement_rows_total counter")
+    for sql, h in statements.items():
+        value = sql.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'bus_statement_rows_total{{sql="{value}"}} {h.rows}')
+    lines.append("# TYPE bus_slow_queries_logged gauge")
+    lines.append(f"bus_slow_queries_logged {len(snapshot['slow_queries'])}")
+    return "\n".join(lines) + "\n"
+
+def dump(path):
+    """Write metrics to `path`: Prometheus text for *.prom/*.txt, JSON otherwise."""
+    if path.endswith((".prom", ".txt")):
+        text = to_prometheus()
+    else:
+        text = json.dumps(metrics.snapshot(), indent=2)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial = path + ".tmp"
+    with open(partial, "w", encoding="utf-8") as out:
+        out.write(text)
+    os.replace(partial, path)
+    return path
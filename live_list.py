@@ -0,0 +1,103 @@
+import bisect
+import tkinter as tk
+from tkinter import messagebox
+
+AUTO_REFRESH_MS = 2000
+
+
+class LiveListbox(tk.Listbox):
+    """A Listbox kept in step with the database through the change feed.
+
+    `poll(since, data_version)` is one of the services.*_changes functions and
+    runs on the DBExecutor; `render(row)` gives a row's text. The first poll
+    fills the list, later ones patch only the rows that changed, so the
+    scroll position and selection survive. `rows` holds the shown rows in
+    listbox order (ordered by row id, the first column) and every
+    AUTO_REFRESH_MS the list polls again, which is free when nothing changed.
+    """
+
+    def __init__(self, parent, db, poll, render, key, interval_ms=AUTO_REFRESH_MS, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.db = db
+        self.poll = poll
+        self.render = render
+        self.key = key
+        self.interval_ms = interval_ms
+        self.rows = []
+        self._ids = []
+        self._version = None
+        self._data_version = None
+        self._timer = None
+        self.bind("<Destroy>", self._on_destroy, add="+")
+        self.refresh()
+
+    def refresh(self, quiet=False):
+        """Fetch what changed since the last refresh and apply it."""
+        if self._timer is not None:
+            self.after_cancel(self._timer)
+            self._timer = None
+        self.db.submit(self.poll, self._version, self._data_version, on_done=self._apply,
+                       on_error=self._retry, key=self.key, widget=self, quiet=quiet)
+
+    def selected_row(self):
+        """The row under the selection, or None."""
+        selection = self.curselection()
+        return self.rows[selection[0]] if selection else None
+
+    def _apply(self, delta):
+        if delta.rows is not None:
+            self._replace(delta.rows)
+        elif delta.changed:
+            self._patch(delta.changed)
+        self._version, self._data_version = delta.version, delta.data_version
+        self._schedule()
+
+    def _retry(self, error):
+        if self._version is None:
+            messagebox.showerror("Error", str(error))
+        self._schedule()  # e.g. database busy: try again on the next tick
+
+    def _schedule(self):
+        if self.interval_ms and self.winfo_exists():
+            self._timer = self.after(self.interval_ms, lambda: self.refresh(quiet=True))
+
+    def _replace(self, rows):
+        """Show `rows`, keeping the selected rows and the scroll position."""
+        selected = {self._ids[i] for i in self.curselection()}
+        top = self.yview()[0]
+        self.delete(0, tk.END)
+        if rows:
+            self.insert(tk.END, *(self.render(row) for row in rows))
+        self.rows = list(rows)
+        self._ids = [row[0] for row in rows]
+        for position, row_id in enumerate(self._ids):
+            if row_id in selected:
+                self.selection_set(position)
+        self.yview_moveto(top)
+
+    def _patch(self, changed):
+        """Update, insert or remove only the rows in `changed` ({id: row or None})."""
+        for row_id, row in changed.items():
+            position = bisect.bisect_left(self._ids, row_id)
+            present = position < len(self._ids) and self._ids[position] == row_id
+            if row is None:
+                if present:
+                    self.delete(position)
+                    del self.rows[position], self._ids[position]
+            elif present:
+                if self.rows[position] != row:
+                    was_selected = self.selection_includes(position)
+                    self.delete(position)
+                    self.insert(position, self.render(row))
+                    self.rows[position] = row
+                    if was_selected:
+                        self.selection_set(position)
+            else:
+                self.insert(position, self.render(row))
+                self.rows.insert(position, row)
+                self._ids.insert(position, row_id)
+
+    def _on_destroy(self, event):
+        if event.widget is self and self._timer is not None:
+            self.after_cancel(self._timer)
+            self._timer = None
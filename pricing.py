@@ -0,0 +1,160 @@
+"""Dynamic seat prices for upcoming trips.
+
+Each seat's base fare is tickets.base_price: its tier fare from
+seat_generator (front rows dearer, say), or its price before the first
+repricing. reprice() computes one factor per trip departing in the next
+HORIZON_DAYS and sets every unsold seat on it to
+
+    base fare * factor,  factor = load * time * demand, clipped to [MIN_FACTOR, MAX_FACTOR]
+
+so seats keep their tier differences.
+
+- load: the trip's load factor (sold seats / capacity, from the
+  trigger-maintained bus_availability) against TARGET_LOAD; fuller trips
+  cost more.
+- time: interpolated from TIME_CURVE by hours to departure; prices rise as
+  departure nears.
+- demand: the route's load factor over the horizon against the network's.
+
+The trips and their unsold tickets are read with two bulk queries, and the
+arithmetic runs as NumPy array operations over those columns. Changed prices
+are written back with executemany, WRITE_BATCH rows per transaction so
+that bookings are not held up behind one long write. Tickets sold in the
+meantime keep their price, and tickets not tied to a trip (schedule_id
+NULL) are never repriced.
+
+NumPy is only needed here and is imported on first use.
+
+Usage: python pricing.py [--dry-run] [--days N] [--show N]
+"""
+import argparse
+import itertools
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from database import get_read_connection, get_transaction
+from timetable import TS_FORMAT
+
+HORIZON_DAYS = 60
+TARGET_LOAD = 0.6
+LOAD_WEIGHT = 0.5            # +/- 50% of the distance from TARGET_LOAD
+# (hours to departure, multiplier), interpolated linearly in between
+TIME_CURVE = ((0, 1.25), (24, 1.15), (72, 1.0), (14 * 24, 0.9))
+DEMAND_WEIGHT = 0.3
+DEMAND_BOUNDS = (0.9, 1.2)
+MIN_FACTOR, MAX_FACTOR = 0.7, 1.5
+WRITE_BATCH = 20000
+
+# now, start, end
+TRIPS_QUERY = """
+    SELECT schedules.schedule_id, schedules.route_id,
+           MAX(buses.capacity, COALESCE(bus_availability.sold + bus_availability.unsold, 0)),
+           COALESCE(bus_availability.sold, 0),
+           (julianday(schedules.departure_ts) - julianday(?)) * 24
+    FROM schedules
+    JOIN buses ON buses.bus_id = schedules.bus_id
+    LEFT JOIN bus_availability ON bus_availability.bus_id = schedules.bus_id
+        AND bus_availability.schedule_id = schedules.schedule_id
+    WHERE schedules.departure_ts >= ? AND schedules.departure_ts < ?
+    ORDER BY schedules.schedule_id
+"""
+
+# start, end
+UNSOLD_QUERY = """
+    SELECT tickets.ticket_id, tickets.schedule_id, tickets.price, COALESCE(tickets.base_price, tickets.price)
+    FROM schedules
+    JOIN tickets ON tickets.schedule_id = schedules.schedule_id
+    WHERE schedules.departure_ts >= ? AND schedules.departure_ts < ? AND tickets.status = 'unsold'
+"""
+
+# Pins the base fare on first repricing, so later runs never compound
+UPDATE_PRICE = """
+    UPDATE tickets SET price = ?, base_price = COALESCE(base_price, price)
+    WHERE ticket_id = ? AND status = 'unsold'
+"""
+
+PriceChange = namedtuple("PriceChange", "ticket_id schedule_id old new")
+RepriceResult = namedtuple("RepriceResult", "trips tickets changed raised lowered seconds changes")
+
+
+def _columns(np, rows, dtypes):
+    """Rows of a query as one NumPy array per column."""
+    if not rows:
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+    return [np.asarray(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)]
+
+def trip_factors(np, capacity, sold, hours, route):
+    """Price factors for trips given as arrays: capacity, seats sold, hours
+    to departure and route ids."""
+    load = sold / np.maximum(capacity, 1)
+    load_factor = 1 + LOAD_WEIGHT * (load - TARGET_LOAD)
+
+    hours_points, multipliers = zip(*TIME_CURVE)
+    time_factor = np.interp(hours, hours_points, multipliers)
+
+    _, codes = np.unique(route, return_inverse=True)
+    route_load = np.bincount(codes, weights=sold) / np.maximum(np.bincount(codes, weights=capacity), 1)
+    network_load = sold.sum() / max(capacity.sum(), 1)
+    demand = route_load[codes] / network_load if network_load else np.ones_like(sold)
+    demand_factor = np.clip(1 + DEMAND_WEIGHT * (demand - 1), *DEMAND_BOUNDS)
+
+    return np.clip(load_factor * time_factor * demand_factor, MIN_FACTOR, MAX_FACTOR)
+
+def reprice(days=HORIZON_DAYS, dry_run=False, now=None):
+    """Recompute the price of every unsold ticket on trips departing in the next `days`.
+
+    Returns a RepriceResult; `changes` lists a PriceChange per ticket whose
+    price moves. With dry_run=True nothing is written.
+    """
+    import numpy as np  # only the pricing engine needs it
+
+    started = time.perf_counter()
+    now = now or datetime.now().replace(microsecond=0)
+    start, end = now.strftime(TS_FORMAT), (now + timedelta(days=days)).strftime(TS_FORMAT)
+    with get_read_connection() as conn:
+        conn.execute("BEGIN")  # both queries see the same snapshot
+        trips = conn.execute(TRIPS_QUERY, (start, start, end)).fetchall()
+        unsold = conn.execute(UNSOLD_QUERY, (start, end)).fetchall()
+
+    trip_ids, route, capacity, sold, hours = _columns(np, trips, (np.int64, np.int64, float, float, float))
+    ticket_ids, ticket_trips, old, base = _columns(np, unsold, (np.int64, np.int64, float, float))
+
+    factors = trip_factors(np, capacity, sold, hours, route)
+    new = np.round(base * factors[np.searchsorted(trip_ids, ticket_trips)], 2)
+    moved = np.abs(new - old) >= 0.005
+    changed_ids, changed_new = ticket_ids[moved], new[moved]
+
+    if not dry_run:
+        updates = zip(changed_new.tolist(), changed_ids.tolist())
+        while batch := list(itertools.islice(updates, WRITE_BATCH)):
+            with get_transaction() as conn:
+                conn.executemany(UPDATE_PRICE, batch)
+
+    changes = [PriceChange(*change) for change in zip(
+        changed_ids.tolist(), ticket_trips[moved].tolist(), old[moved].tolist(), changed_new.tolist())]
+    return RepriceResult(
+        len(trips), len(unsold), len(changes),
+        int((changed_new > old[moved]).sum()), int((changed_new < old[moved]).sum()),
+        round(time.perf_counter() - started, 3), changes,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="show the changes without saving them")
+    parser.add_argument("--days", type=int, default=HORIZON_DAYS)
+    parser.add_argument("--show", type=int, default=20, help="largest changes to list")
+    args = parser.parse_args(argv)
+    result = reprice(args.days, args.dry_run)
+    for change in sorted(result.changes, key=lambda c: abs(c.new - c.old), reverse=True)[:args.show]:
+        print(f"ticket {change.ticket_id} (trip {change.schedule_id}): {change.old:.2f} -> {change.new:.2f}")
+    print(f"{result.tickets} unsold tickets on {result.trips} trips: {result.changed} "
+          f"{'would change' if args.dry_run else 'changed'} ({result.raised} up, {result.lowered} down) "
+          f"in {result.seconds:.2f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
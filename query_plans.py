@@ -0,0 +1,210 @@
+"""Query-plan regression check for the statements the application runs.
+
+Builds a large synthetic database from schema.sql, runs EXPLAIN QUERY PLAN
+on every hot statement and fails if any of them falls back to a full table
+SCAN. Listing screens that legitimately read a whole table declare that
+table in `allowed_scans`.
+
+Usage: python query_plans.py [--buses N] [--verbose]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+from recurrence import EXCEPTIONS_QUERY, PATTERNS_QUERY, SCHEDULED_TRIPS_QUERY
+from reports import DETAILS_PAGE_SIZE, DETAILS_QUERY
+from search import RANK, SEARCH_LIMIT, SEARCH_QUERY
+from services import (BUS_CHILD_TABLES, BUS_DETAILS_QUERY, DELETE_BUSES_QUERY, UPDATE_ROUTE_QUERY,
+                      UPDATE_SCHEDULE_QUERY)
+from synthetic_data import generate
+from timetable import NAMES_QUERY, STOP_ROUTES_QUERY
+
+# (name, sql, params, allowed_scans) -- the statements behind app.py (services, auth, reports)
+HOT_QUERIES = [
+    ("authenticate",
+     "SELECT user_id, name, role, password FROM users WHERE email = ?",
+     ("user1@example.com",), ()),
+    ("view_all_details page", DETAILS_QUERY, (0, DETAILS_PAGE_SIZE), ()),
+    ("passenger seats left",
+     "SELECT bus_id, SUM(unsold) FROM bus_availability GROUP BY bus_id",
+     (), ("bus_availability",)),
+    ("update_bus bus list",
+     "SELECT bus_id, name FROM buses", (), ("buses",)),
+    ("fetch_bus_details", BUS_DETAILS_QUERY, (42,), ()),
+    ("save_changes route update", UPDATE_ROUTE_QUERY, ("r", "a, b", 42), ()),
+    ("save_changes schedule update", UPDATE_SCHEDULE_QUERY, ("2024-01-01", "08:00", "12:00", 42), ()),
+] + [
+    (f"delete_bus {table}", DELETE_BUSES_QUERY.format(table), ("[42]",), ())
+    for table in BUS_CHILD_TABLES + ("buses",)
+] + [
+    ("fetch_routes",
+     "SELECT route_id, route_name, stops FROM routes", (), ("routes",)),
+    ("fetch_drivers",
+     "SELECT driver_id, name, license_number FROM drivers", (), ("drivers",)),
+    ("update_driver lookup",
+     "SELECT driver_id, name, license_number, phone, address FROM drivers WHERE driver_id = ?",
+     (7,), ()),
+    ("delete_driver",
+     "DELETE FROM drivers WHERE driver_id = ?", (7,), ()),
+    ("fetch_tickets",
+     """
+     SELECT tickets.ticket_id, buses.name, tickets.seat_number, tickets.price, tickets.status
+     FROM tickets
+     JOIN buses ON tickets.bus_id = buses.bus_id
+     """,
+     (), ("tickets",)),
+    ("seat map",
+     """
+     SELECT tickets.ticket_id, buses.name, tickets.seat_number, tickets.price, tickets.status
+     FROM tickets
+     JOIN buses ON tickets.bus_id = buses.bus_id
+     WHERE tickets.bus_id = ? AND tickets.schedule_id IS ?
+     ORDER BY tickets.seat_number
+     """,
+     (42, 1), ()),
+    ("update_ticket",
+     "UPDATE tickets SET status = ? WHERE ticket_id = ? AND status = ?", ("sold", 42, "unsold"), ()),
+    ("delete_ticket",
+     "DELETE FROM tickets WHERE ticket_id = ?", (42,), ()),
+    ("view_all_buses",
+     """
+     SELECT buses.bus_id, buses.name, buses.number, buses.ticket_price, buses.capacity,
+         routes.route_name, routes.stops
+     FROM buses
+     JOIN routes ON buses.route_id = routes.route_id
+     """,
+     (), ("buses",)),
+    ("prebook schedules",
+     """
+     SELECT buses.bus_id, schedules.schedule_id, schedules.departure_date, schedules.departure_time
+     FROM buses
+     JOIN schedules ON buses.bus_id = schedules.bus_id
+     WHERE buses.name = ? AND buses.route_id = (SELECT route_id FROM routes WHERE route_name = ?)
+     """,
+     ("Bus 42", "Route 42"), ()),
+    ("buses_for_stop",
+     """
+     SELECT buses.bus_id, buses.name, buses.number, routes.route_name
+     FROM stops
+     JOIN route_stops ON route_stops.stop_id = stops.stop_id
+     JOIN routes ON routes.route_id = route_stops.route_id
+     JOIN buses ON buses.route_id = route_stops.route_id
+     WHERE stops.name = ?
+     ORDER BY buses.bus_id
+     """,
+     ("B42",), ()),
+    ("routes_between",
+     """
+     SELECT routes.route_id, routes.route_name, a.seq, b.seq
+     FROM stops AS origin
+     JOIN route_stops AS a ON a.stop_id = origin.stop_id
+     JOIN stops AS destination ON destination.name = ?
+     JOIN route_stops AS b
+         ON b.stop_id = destination.stop_id AND b.route_id = a.route_id AND b.seq > a.seq
+     JOIN routes ON routes.route_id = a.route_id
+     WHERE origin.name = ?
+     ORDER BY b.seq - a.seq, routes.route_id
+     """,
+     ("C42", "A42"), ()),
+    ("seat map rebuild",
+     "SELECT seat_number, status FROM tickets WHERE bus_id = ? AND schedule_id IS ?",
+     (42, None), ()),
+    ("bus search", SEARCH_QUERY, ('"pok"* "route"*', RANK, SEARCH_LIMIT), ()),
+    ("search seats left",
+     "SELECT bus_id, SUM(unsold) FROM bus_availability "
+     "WHERE bus_id IN (SELECT value FROM json_each(?)) GROUP BY bus_id",
+     ("[1, 2, 3]",), ()),
+    ("stop board routes", STOP_ROUTES_QUERY, ("Pokhara",), ()),
+    ("departure names", NAMES_QUERY, ("[1, 2, 3]", "[4, 5]"), ()),
+    ("prebookings by user",
+     "SELECT bus_id, prebook_date FROM prebooked_buses WHERE user_id = ?", (7,), ()),
+    ("route patterns", PATTERNS_QUERY + " AND route_id = ?", ("2024-11-30", "2024-11-01", 42), ()),
+    ("route trips", SCHEDULED_TRIPS_QUERY + " AND route_id = ? ORDER BY departure_ts",
+     ("2024-11-01 00:00:00", "2024-12-01 00:00:00", 42), ()),
+    ("bus trips", SCHEDULED_TRIPS_QUERY + " AND bus_id = ? ORDER BY departure_ts",
+     ("2024-11-01 00:00:00", "2024-12-01 00:00:00", 42), ()),
+    ("pattern exceptions", EXCEPTIONS_QUERY, ("[1, 2, 3]", "2024-11-01", "2024-11-30"), ()),
+    ("booked pattern trip",
+     "SELECT schedule_id FROM schedules WHERE bus_id = ? AND departure_date = ? AND departure_time = ?",
+     (42, "2024-11-05", "07:15"), ()),
+    ("shift before",
+     "SELECT starts_at, ends_at FROM driver_shifts WHERE driver_id = ? AND starts_at < ? "
+     "AND shift_id IS NOT ? ORDER BY starts_at DESC LIMIT 1",
+     (7, "2024-11-05 08:00:00", None), ()),
+    ("shift after",
+     "SELECT starts_at, ends_at FROM driver_shifts WHERE driver_id = ? AND starts_at >= ? "
+     "AND shift_id IS NOT ? ORDER BY starts_at LIMIT 1",
+     (7, "2024-11-05 08:00:00", None), ()),
+    ("trip already driven",
+     "SELECT driver_id FROM driver_shifts WHERE bus_id = ? AND starts_at = ? AND role = ?",
+     (42, "2024-11-05 08:00:00", "driver"), ()),
+]
+
+
+def build_synthetic_db(path, buses=5000, seats_per_bus=40):
+    """Create a schema.sql database at `path` filled with synthetic rows."""
+    generate(path, buses=buses, seats_per_bus=seats_per_bus)
+    return sqlite3.connect(path)
+
+
+def explain(conn, sql, params):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def full_scans(plan, allowed_scans=()):
+    """Return the plan lines that scan a table without an index."""
+    bad = []
+    for line in plan:
+        if not line.startswith("SCAN "):
+            continue
+        table = line.split()[1]
+        if table in allowed_scans or "USING" in line or "VIRTUAL TABLE INDEX" in line:
+            continue
+        # CTE results and subquery materializations are not table scans
+        if table in ("page", "hits", "json_each") or table.startswith("("):
+            continue
+        bad.append(line)
+    return bad
+
+
+def check_query_plans(conn, queries=HOT_QUERIES, verbose=False):
+    """Run every query through EXPLAIN QUERY PLAN; return {name: bad lines}."""
+    failures = {}
+    for name, sql, params, allowed_scans in queries:
+        plan = explain(conn, sql, params)
+        if verbose:
+            print(f"{name}:")
+            for line in plan:
+                print(f"    {line}")
+        bad = full_scans(plan, allowed_scans)
+        if bad:
+            failures[name] = bad
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buses", type=int, default=5000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_synthetic_db(os.path.join(tmp, "plans.db"), buses=args.buses)
+        try:
+            failures = check_query_plans(conn, verbose=args.verbose)
+        finally:
+            conn.close()
+
+    if failures:
+        for name, lines in failures.items():
+            print(f"FAIL {name}: " + "; ".join(lines))
+        return 1
+    print(f"All {len(HOT_QUERIES)} hot queries use indexes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""Recurring schedules stored as rules and expanded into trips on demand.
+
+A schedule_patterns row says "this bus runs this route at HH:MM on these
+weekdays, every N weeks, from valid_from until valid_until (or forever)";
+pattern_exceptions cancels single service dates. Nothing is stored per trip:
+expand() generates a pattern's trips for any date window and
+trips_between() merges every pattern with the schedules rows in that window,
+lazily and in departure order.
+
+Until it is booked, a trip is identified by (pattern_id, service_date).
+book_seat() and prebook() write it to schedules (with pattern_id set) and
+create its seat inventory in the same transaction as the booking, and roll
+both back if the booking fails. So schedules, tickets and every report that
+joins them grow with real bookings, not with the length of the timetable.
+
+Usage: python recurrence.py trips START END [ROUTE_ID]
+"""
+import heapq
+import json
+import sys
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+
+import booking
+import timetable
+from database import get_connection, get_read_connection, get_transaction
+
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DAILY = 0b1111111
+WEEKDAY_SETS = {"daily": DAILY, "weekdays": 0b0011111, "weekends": 0b1100000}
+MAX_WINDOW_DAYS = 366
+
+Pattern = namedtuple(
+    "Pattern",
+    "pattern_id bus_id route_id departure_time arrival_time weekdays interval_weeks valid_from valid_until",
+)
+# service_date is 'YYYY-MM-DD'; schedule_id is None until the trip is booked
+Trip = namedtuple("Trip", "departure_ts arrival_ts bus_id route_id pattern_id service_date schedule_id")
+
+PATTERN_COLUMNS = """
+    pattern_id, bus_id, route_id, departure_time, arrival_time,
+    weekdays, interval_weeks, valid_from, valid_until
+"""
+
+# end, start; filters are appended
+PATTERNS_QUERY = f"""
+    SELECT {PATTERN_COLUMNS} FROM schedule_patterns
+    WHERE valid_from <= ? AND (valid_until IS NULL OR valid_until >= ?)
+"""
+
+# start ts, end ts; filters are appended
+SCHEDULED_TRIPS_QUERY = """
+    SELECT departure_ts, arrival_ts, bus_id, route_id, pattern_id, departure_date, schedule_id
+    FROM schedules
+    WHERE departure_ts >= ? AND departure_ts < ?
+"""
+
+# JSON list of pattern ids, first date, last date
+EXCEPTIONS_QUERY = """
+    SELECT pattern_id, service_date FROM pattern_exceptions
+    WHERE pattern_id IN (SELECT value FROM json_each(?)) AND service_date BETWEEN ? AND ?
+"""
+
+
+def as_date(value):
+    """A date, or an ISO date string, as a date."""
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(timetable.parse_date(value))
+
+def parse_weekdays(text):
+    """Weekday bitmask from "daily", "weekdays", "weekends", "Mon-Fri", "mon,wed,fri" or "Fri-Mon"."""
+    mask = 0
+    for part in str(text or "").lower().replace(" ", "").split(","):
+        if part in WEEKDAY_SETS:
+            mask |= WEEKDAY_SETS[part]
+            continue
+        first, _, last = part.partition("-")
+        try:
+            day, stop = WEEKDAY_NAMES.index(first[:3]), WEEKDAY_NAMES.index((last or first)[:3])
+        except ValueError:
+            raise ValueError(f"Unknown weekdays {part!r}; use e.g. Mon-Fri, Sat,Sun or daily.")
+        while True:  # ranges may wrap past Sunday
+            mask |= 1 << day
+            if day == stop:
+                break
+            day = (day + 1) % 7
+    if not mask:
+        raise ValueError("No weekdays given.")
+    return mask
+
+def format_weekdays(mask):
+    for name, days in WEEKDAY_SETS.items():
+        if mask == days:
+            return name
+    return ",".join(name.title() for bit, name in enumerate(WEEKDAY_NAMES) if mask >> bit & 1)
+
+def _pattern(row):
+    return Pattern(*row[:7], as_date(row[7]), as_date(row[8]) if row[8] else None)
+
+def occurs_on(pattern, day, skip=()):
+    """Whether `pattern` runs on `day` (a date), leaving out dates in `skip`."""
+    if day < pattern.valid_from or (pattern.valid_until is not None and day > pattern.valid_until):
+        return False
+    if not pattern.weekdays >> day.weekday() & 1:
+        return False
+    if pattern.interval_weeks > 1:
+        first_monday = pattern.valid_from - timedelta(days=pattern.valid_from.weekday())
+        if (day - first_monday).days // 7 % pattern.interval_weeks:
+            return False
+    return day not in skip
+
+def expand(pattern, start, end, skip=()):
+    """Yield the pattern's unbooked trips departing on dates start..end, in order."""
+    day = max(as_date(start), pattern.valid_from)
+    last = as_date(end) if pattern.valid_until is None else min(as_date(end), pattern.valid_until)
+    while day <= last:
+        if occurs_on(pattern, day, skip):
+            departure_ts, arrival_ts = timetable.timestamps(day.isoformat(), pattern.departure_time,
+                                                            pattern.arrival_time)
+            yield Trip(departure_ts, arrival_ts, pattern.bus_id, pattern.route_id,
+                       pattern.pattern_id, day.isoformat(), None)
+        day += timedelta(days=1)
+
+def _filters(bus_id, route_id):
+    clauses, params = "", ()
+    if bus_id is not None:
+        clauses, params = clauses + " AND bus_id = ?", params + (bus_id,)
+    if route_id is not None:
+        clauses, params = clauses + " AND route_id = ?", params + (route_id,)
+    return clauses, params
+
+def trips_between(start, end, bus_id=None, route_id=None):
+    """Every trip departing on dates start..end (inclusive), earliest first.
+
+    Yields Trip tuples: booked and one-off trips come from schedules (with
+    their schedule_id), the rest are generated from the patterns. Filter by
+    bus_id or route_id to keep the lookups on their indexes.
+    """
+    start, end = as_date(start), as_date(end)
+    if end < start or (end - start).days > MAX_WINDOW_DAYS:
+        raise ValueError(f"The date window must run forwards and span at most {MAX_WINDOW_DAYS} days.")
+    clauses, params = _filters(bus_id, route_id)
+    with get_read_connection() as conn:
+        conn.execute("BEGIN")  # patterns and booked trips from one snapshot
+        patterns = [_pattern(row) for row in conn.execute(
+            PATTERNS_QUERY + clauses, (end.isoformat(), start.isoformat()) + params)]
+        scheduled = [Trip(*row) for row in conn.execute(
+            SCHEDULED_TRIPS_QUERY + clauses + " ORDER BY departure_ts",
+            (f"{start.isoformat()} 00:00:00", f"{end + timedelta(days=1)} 00:00:00") + params)]
+        skip = defaultdict(set)
+        if patterns:
+            for pattern_id, service_date in conn.execute(
+                EXCEPTIONS_QUERY, (json.dumps([p.pattern_id for p in patterns]), start.isoformat(), end.isoformat())
+            ):
+                skip[pattern_id].add(as_date(service_date))
+
+    # A scheduled row stands in for the pattern's trip: booked trips carry the
+    # pattern_id, and a hand-entered trip may coincide with a generated one.
+    taken = {(trip.bus_id, trip.departure_ts) for trip in scheduled}
+    for trip in scheduled:
+        if trip.pattern_id is not None:
+            skip[trip.pattern_id].add(as_date(trip.service_date))
+    streams = [
+        (trip for trip in expand(pattern, start, end, skip[pattern.pattern_id])
+         if (trip.bus_id, trip.departure_ts) not in taken)
+        for pattern in patterns
+    ]
+    return heapq.merge(iter(scheduled), *streams, key=lambda trip: trip.departure_ts)
+
+
+def get_pattern(conn, pattern_id):
+    row = conn.execute(f"SELECT {PATTERN_COLUMNS} FROM schedule_patterns WHERE pattern_id = ?",
+                       (pattern_id,)).fetchone()
+    return _pattern(row) if row else None
+
+def list_patterns(bus_id=None, route_id=None):
+    """Patterns, optionally for one bus or route, as Pattern tuples."""
+    clauses, params = _filters(bus_id, route_id)
+    with get_read_connection() as conn:
+        return [_pattern(row) for row in conn.execute(
+            f"SELECT {PATTERN_COLUMNS} FROM schedule_patterns WHERE 1 = 1{clauses} ORDER BY pattern_id", params)]
+
+def add_pattern(bus_id, departure_time, arrival_time, weekdays="daily", interval_weeks=1,
+                valid_from=None, valid_until=None, route_id=None, conn=None):
+    """Store a recurring trip for a bus (on its own route by default); returns pattern_id.
+
+    Raises ValueError for bad times, dates or weekdays and LookupError for an
+    unknown bus.
+    """
+    if conn is None:
+        with get_connection() as conn:
+            return add_pattern(bus_id, departure_time, arrival_time, weekdays, interval_weeks,
+                               valid_from, valid_until, route_id, conn)
+    mask = weekdays if isinstance(weekdays, int) else parse_weekdays(weekdays)
+    if not 0 < mask <= DAILY:
+        raise ValueError("No weekdays given.")
+    interval_weeks = int(interval_weeks)
+    if interval_weeks < 1:
+        raise ValueError("The interval must be at least one week.")
+    valid_from = as_date(valid_from or date.today())
+    valid_until = as_date(valid_until) if valid_until else None
+    if valid_until is not None and valid_until < valid_from:
+        raise ValueError("The pattern must end on or after its first day.")
+    bus = conn.execute("SELECT route_id FROM buses WHERE bus_id = ?", (bus_id,)).fetchone()
+    if bus is None:
+        raise LookupError(f"Bus {bus_id} not found.")
+    cur = conn.execute(
+        """
+        INSERT INTO schedule_patterns (bus_id, route_id, departure_time, arrival_time,
+            weekdays, interval_weeks, valid_from, valid_until)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (bus_id, route_id or bus[0], timetable.parse_time(departure_time), timetable.parse_time(arrival_time),
+         mask, interval_weeks, valid_from.isoformat(), valid_until and valid_until.isoformat()),
+    )
+    return cur.lastrowid
+
+# bus_id, from ts; driver shifts on trips that have no schedules row
+UNBOOKED_SHIFTS_QUERY = """
+    SELECT shift_id, starts_at FROM driver_shifts
+    WHERE bus_id = ? AND starts_at >= ? AND NOT EXISTS (
+        SELECT 1 FROM schedules
+        WHERE schedules.bus_id = driver_shifts.bus_id AND schedules.departure_ts = driver_shifts.starts_at)
+"""
+
+def delete_pattern(pattern_id):
+    """Stop a pattern; trips already booked stay as ordinary schedules.
+
+    Driver shifts on its upcoming unbooked trips are removed with it.
+    """
+    with get_connection() as conn:
+        pattern = get_pattern(conn, pattern_id)
+        if pattern is None:
+            return 0
+        now = datetime.now().strftime(timetable.TS_FORMAT)
+        conn.executemany("DELETE FROM driver_shifts WHERE shift_id = ?", [
+            (shift_id,) for shift_id, starts_at in conn.execute(UNBOOKED_SHIFTS_QUERY, (pattern.bus_id, now))
+            if occurs_on(pattern, as_date(starts_at[:10]))
+            and timetable.timestamps(starts_at[:10], pattern.departure_time, pattern.arrival_time)[0] == starts_at
+        ])
+        return conn.execute("DELETE FROM schedule_patterns WHERE pattern_id = ?", (pattern_id,)).rowcount
+
+def cancel_trip(pattern_id, service_date):
+    """Add an exception date. A trip that is already booked keeps running;
+    otherwise its driver shifts are removed."""
+    with get_connection() as conn:
+        pattern = get_pattern(conn, pattern_id)
+        if pattern is None:
+            raise LookupError(f"Schedule pattern {pattern_id} not found.")
+        day = as_date(service_date).isoformat()
+        conn.execute("INSERT OR IGNORE INTO pattern_exceptions (pattern_id, service_date) VALUES (?, ?)",
+                     (pattern_id, day))
+        departure_ts, _ = timetable.timestamps(day, pattern.departure_time, pattern.arrival_time)
+        conn.execute(
+            """
+            DELETE FROM driver_shifts WHERE bus_id = ? AND starts_at = ?
+            AND NOT EXISTS (SELECT 1 FROM schedules WHERE bus_id = ? AND departure_ts = ?)
+            """,
+            (pattern.bus_id, departure_ts, pattern.bus_id, departure_ts),
+        )
+
+def restore_trip(pattern_id, service_date):
+    """Remove an exception date."""
+    with get_connection() as conn:
+        return conn.execute("DELETE FROM pattern_exceptions WHERE pattern_id = ? AND service_date = ?",
+                            (pattern_id, as_date(service_date).isoformat())).rowcount
+
+
+def materialize(conn, pattern_id, service_date):
+    """(bus_id, schedule_id) of a pattern's trip, writing it and its seats if needed.
+
+    Runs in the caller's transaction. Raises LookupError if the pattern does
+    not exist or does not run on service_date.
+    """
+    pattern = get_pattern(conn, pattern_id)
+    if pattern is None:
+        raise LookupError(f"Schedule pattern {pattern_id} not found.")
+    day = as_date(service_date)
+    cancelled = conn.execute(
+        "SELECT 1 FROM pattern_exceptions WHERE pattern_id = ? AND service_date = ?",
+        (pattern_id, day.isoformat()),
+    ).fetchone()
+    if cancelled or not occurs_on(pattern, day):
+        raise LookupError(f"Schedule pattern {pattern_id} does not run on {day.isoformat()}.")
+
+    departure_ts, arrival_ts = timetable.timestamps(day.isoformat(), pattern.departure_time, pattern.arrival_time)
+    cur = conn.execute(
+        """
+        INSERT INTO schedules (bus_id, route_id, departure_date, departure_time, arrival_time,
+            departure_ts, arrival_ts, pattern_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (bus_id, departure_date, departure_time) DO NOTHING
+        """,
+        (pattern.bus_id, pattern.route_id, day.isoformat(), pattern.departure_time, pattern.arrival_time,
+         departure_ts, arrival_ts, pattern_id),
+    )
+    created = cur.rowcount == 1
+    schedule_id = conn.execute(
+        "SELECT schedule_id FROM schedules WHERE bus_id = ? AND departure_date = ? AND departure_time = ?",
+        (pattern.bus_id, day.isoformat(), pattern.departure_time),
+    ).fetchone()[0]
+    if created:
+        import seat_generator  # only a first booking creates seats
+
+        seat_generator.sync_trip(conn, pattern.bus_id, schedule_id)
+    return pattern.bus_id, schedule_id
+
+
+class _NotBooked(Exception):
+    """Unwinds the materialized trip when its booking did not go through."""
+
+    def __init__(self, result):
+        super().__init__(result.message)
+        self.result = result
+
+def _book_trip(pattern_id, service_date, book):
+    def attempt(n):
+        try:
+            with get_transaction() as conn:
+                try:
+                    bus_id, schedule_id = materialize(conn, pattern_id, service_date)
+                except LookupError as e:
+                    return booking.BookingResult(booking.NOT_FOUND, None, n, str(e))
+                result = book(bus_id, schedule_id)
+                if result.status != booking.BOOKED:
+                    raise _NotBooked(result)
+                return result
+        except _NotBooked as e:
+            return e.result._replace(attempts=n)
+
+    return booking.with_retry(attempt)
+
+def book_seat(pattern_id, service_date, seat_number, user_id):
+    """Sell a seat on a pattern's trip, materializing the trip with the sale."""
+    return _book_trip(pattern_id, service_date,
+                      lambda bus_id, schedule_id: booking.book_seat(bus_id, seat_number, user_id, schedule_id))
+
+def prebook(user_id, pattern_id, service_date):
+    """Prebook the bus of a pattern's trip, materializing the trip with the prebooking."""
+    return _book_trip(pattern_id, service_date,
+                      lambda bus_id, schedule_id: booking.prebook(user_id, bus_id, schedule_id))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["trips"] or len(argv) not in (3, 4):
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    route_id = int(argv[3]) if len(argv) == 4 else None
+    for trip in trips_between(argv[1], argv[2], route_id=route_id):
+        booked = f"trip {trip.schedule_id}" if trip.schedule_id else "not booked"
+        pattern = f"pattern {trip.pattern_id}" if trip.pattern_id else "one-off"
+        print(f"{trip.departure_ts} -> {trip.arrival_ts}  bus {trip.bus_id} route {trip.route_id} ({pattern}, {booked})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""In-process read-through cache for small reference tables.
+
+Route, driver and bus lists are read far more often than they change. Each
+cached result records which tables it was built from:
+
+- writes made through the service layer invalidate those tables
+  (see `invalidates`);
+- writes by other processes are detected with PRAGMA data_version and drop
+  the whole cache.
+
+The cache is bounded (least recently used entries are evicted) and counts
+hits and misses. Set BUS_REF_CACHE=0, or use `cache.disabled()`, to bypass
+it, e.g. in tests that edit the database behind the app's back.
+"""
+import functools
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from connection_pool import get_pool
+
+MAX_ENTRIES = 64
+
+
+class RefCache:
+    """Bounded LRU of query results tagged with the tables they read."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()   # key -> (value, tables)
+        self._lock = threading.Lock()
+        self._seen = None               # (data_version, external_version) last checked
+        self._generation = 0            # bumped by every invalidation
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_external(self):
+        """Drop everything if another process has committed since the last check."""
+        pool = get_pool()
+        version = pool.data_version()
+        if self._seen is not None and self._seen[0] == version:
+            return
+        # Something committed; find out whether it was only our own writer
+        external = pool.external_version()
+        with self._lock:
+            if self._seen is None or external is None or external != self._seen[1]:
+                if self._entries:
+                    self._stats["invalidations"] += 1
+                self._entries.clear()
+                self._generation += 1
+            self._seen = (version, external)
+
+    def get(self, key, load, tables):
+        """Return the cached value for `key`, calling load() on a miss."""
+        if not self.enabled:
+            return load()
+        self._check_external()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                # Invalidated while loading; the value may predate that write
+                return value
+            self._entries[key] = (value, frozenset(tables))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return value
+
+    def invalidate(self, *tables):
+        """Drop entries built from any of `tables` (everything when none are given)."""
+        with self._lock:
+            if not tables:
+                self._entries.clear()
+            else:
+                stale = [key for key, (_, used) in self._entries.items() if used.intersection(tables)]
+                for key in stale:
+                    del self._entries[key]
+            self._generation += 1
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats, size=len(self._entries), enabled=self.enabled)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_ratio"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+    @contextmanager
+    def disabled(self):
+        """Bypass the cache inside a with-block."""
+        previous, self.enabled = self.enabled, False
+        try:
+            yield self
+        finally:
+            self.enabled = previous
+
+
+cache = RefCache(enabled=os.environ.get("BUS_REF_CACHE", "1") != "0")
+
+
+def cached(*tables):
+    """Decorator: cache a reader's result, keyed on its arguments.
+
+    Results are returned as tuples so callers cannot mutate the shared copy.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            return cache.get((fn.__name__,) + args, lambda: tuple(fn(*args)), tables)
+        return wrapper
+    return decorate
+
+def invalidates(*tables):
+    """Decorator: drop cached results for `tables` after a write (even a failed one)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cache.invalidate(*tables)
+        return wrapper
+    return decorate
@@ -0,0 +1,71 @@
+import archive
+from database import get_read_connection
+
+DETAILS_HEADERS = [
+    "Bus ID", "Bus Name", "Route Name", "Driver 1", "Driver 2",
+    "Available Tickets", "Departure Schedule", "Arrival Time"
+]
+
+DETAILS_PAGE_SIZE = 100
+
+# "Available Tickets" comes from the trigger-maintained bus_availability
+# summary: the trip's own inventory if it has one, else the bus-wide seats.
+DETAILS_QUERY = """
+    WITH page AS (
+        SELECT bus_id FROM buses
+        WHERE bus_id > ?
+        ORDER BY bus_id
+        LIMIT ?
+    )
+    SELECT
+        buses.bus_id AS "Bus ID",
+        buses.name AS "Bus Name",
+        routes.route_name AS "Route Name",
+        drivers1.name AS "Driver 1",
+        drivers2.name AS "Driver 2",
+        COALESCE(trip.unsold, whole.unsold, 0) AS "Available Tickets",
+        schedules.departure_date || ' ' || schedules.departure_time AS "Departure Schedule",
+        schedules.arrival_time AS "Arrival Time"
+    FROM page
+    JOIN buses ON buses.bus_id = page.bus_id
+    LEFT JOIN routes ON buses.route_id = routes.route_id
+    LEFT JOIN drivers AS drivers1 ON buses.driver_id1 = drivers1.driver_id
+    LEFT JOIN drivers AS drivers2 ON buses.driver_id2 = drivers2.driver_id
+    LEFT JOIN schedules ON buses.bus_id = schedules.bus_id
+    LEFT JOIN bus_availability AS whole
+        ON whole.bus_id = buses.bus_id AND whole.schedule_id = 0
+    LEFT JOIN bus_availability AS trip
+        ON trip.bus_id = buses.bus_id AND trip.schedule_id = schedules.schedule_id
+    ORDER BY buses.bus_id, schedules.departure_date, schedules.departure_time
+"""
+
+def fetch_details_page(after_bus_id=0, limit=DETAILS_PAGE_SIZE):
+    """Fetch one page of the admin details report using keyset pagination.
+
+    Returns the rows for the next `limit` buses with bus_id > after_bus_id.
+    A bus with several schedules contributes several rows, so a page may hold
+    more than `limit` rows, but never splits a bus across two pages.
+    """
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DETAILS_QUERY, (after_bus_id, limit))
+        return cur.fetchall()
+
+
+SALES_HEADERS = ["Bus ID", "Bus Name", "Payments", "Revenue"]
+
+# Reads archive.py's all_transactions view, so archived payments count too
+SALES_QUERY = """
+    SELECT sales.bus_id, COALESCE(buses.name, '(deleted bus)'), COUNT(*), SUM(sales.total_amount)
+    FROM all_transactions AS sales
+    LEFT JOIN buses ON buses.bus_id = sales.bus_id
+    WHERE sales.transaction_date >= ? AND sales.transaction_date < ?
+    GROUP BY sales.bus_id
+    ORDER BY SUM(sales.total_amount) DESC
+"""
+
+def fetch_sales(start, end):
+    """Payments and revenue per bus for transaction dates in [start, end), archive included."""
+    with get_read_connection() as conn:
+        archive.attach(conn)
+        return conn.execute(SALES_QUERY, (start, end)).fetchall()
@@ -0,0 +1,318 @@
+"""Driver rostering: shifts on trips, checked against overlaps and rest rules.
+
+Each row of driver_shifts puts a driver on one trip (a bus's departure,
+booked or not) from its departure to its arrival. A driver's shifts never
+overlap, and after each one the driver rests for at least rest_after(its
+length) before the next (REST_RULES). Because every stored pair of
+neighbours already keeps that gap, a new shift only has to be checked
+against the shift just before it and the one just after it:
+
+- assign() finds those two with two seeks on idx_driver_shifts_driver
+  (driver_id, starts_at);
+- the solver keeps each driver's shifts in a Timeline, two sorted lists
+  searched by bisection.
+
+Either way a check costs O(log n) in the driver's number of shifts.
+
+auto_assign() fills every trip in a date window that has no driver. It
+walks the trips in departure order and keeps the drivers in a heap by the
+time they are next free. Each trip goes to the bus's regular driver if that
+driver can take it, otherwise to the driver who has been free the longest.
+The solver works from a read snapshot, so each shift it picks is checked
+again against the stored roster in the write transaction, and left out if
+an assign() in the meantime got in its way.
+
+Shifts move with their trip when a schedule is retimed and are deleted with
+it (see the triggers in schema.sql); check_trip() tells whether the moved
+shifts still fit.
+
+Usage: python roster.py auto START END | driver DRIVER_ID START END
+"""
+import bisect
+import heapq
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import recurrence
+from database import get_connection, get_read_connection, get_transaction
+
+# (shift length in hours from which the rule applies, rest required afterwards in hours)
+REST_RULES = (
+    (0, 0.5),     # turnaround between short trips
+    (4.5, 0.75),  # the break owed after 4.5 hours at the wheel
+    (9, 11),      # daily rest after a full day's driving
+)
+ROLES = ("driver", "co_driver")
+WINDOW_MARGIN = timedelta(days=2)  # shifts this close to a window still constrain its trips
+
+Shift = namedtuple("Shift", "shift_id driver_id bus_id role starts_at ends_at")
+AutoRosterResult = namedtuple("AutoRosterResult", "trips assigned already_covered unassigned")
+
+_EPOCH = datetime(2000, 1, 1)
+
+
+class RosterConflict(ValueError):
+    """The driver is already on a trip, or resting, at that time."""
+
+
+def _minutes(ts):
+    return int((datetime.fromisoformat(ts) - _EPOCH).total_seconds()) // 60
+
+def rest_after(minutes):
+    """Minutes of rest owed after a shift of `minutes`."""
+    rest = 0
+    for hours, rest_hours in REST_RULES:
+        if minutes >= hours * 60:
+            rest = rest_hours * 60
+    return int(rest)
+
+def _clash(before, after):
+    """Whether shift `after` starts before `before` ends plus its rest; shifts are (start, end) minutes."""
+    return before[1] + rest_after(before[1] - before[0]) > after[0]
+
+
+class Timeline:
+    """One driver's shifts as parallel sorted lists of start and end minutes."""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def conflict(self, start, end):
+        """The (start, end) neighbour that rules out [start, end), or None."""
+        i = bisect.bisect_left(self.starts, start)
+        if i and _clash((self.starts[i - 1], self.ends[i - 1]), (start, end)):
+            return self.starts[i - 1], self.ends[i - 1]
+        if i < len(self.starts) and _clash((start, end), (self.starts[i], self.ends[i])):
+            return self.starts[i], self.ends[i]
+        return None
+
+    def add(self, start, end):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    def free_from(self, before):
+        """When the driver is free again after the last shift starting before `before`."""
+        i = bisect.bisect_left(self.starts, before)
+        if not i:
+            return None
+        return self.ends[i - 1] + rest_after(self.ends[i - 1] - self.starts[i - 1])
+
+
+def _trip(conn, bus_id, departure_ts):
+    """(starts_at, ends_at) of a bus's trip at departure_ts, from schedules or its patterns."""
+    row = conn.execute(
+        "SELECT departure_ts, arrival_ts FROM schedules WHERE bus_id = ? AND departure_ts = ?",
+        (bus_id, departure_ts),
+    ).fetchone()
+    if row:
+        return row
+    day = datetime.fromisoformat(departure_ts).date()
+    for pattern in recurrence.list_patterns(bus_id=bus_id):
+        if recurrence.occurs_on(pattern, day):
+            trip = next(recurrence.expand(pattern, day, day), None)
+            if trip and trip.departure_ts == departure_ts:
+                return trip.departure_ts, trip.arrival_ts
+    raise LookupError(f"Bus {bus_id} has no trip departing at {departure_ts}.")
+
+def _neighbours(conn, driver_id, starts_at, shift_id=None):
+    before = conn.execute(
+        """
+        SELECT starts_at, ends_at FROM driver_shifts
+        WHERE driver_id = ? AND starts_at < ? AND shift_id IS NOT ? ORDER BY starts_at DESC LIMIT 1
+        """,
+        (driver_id, starts_at, shift_id),
+    ).fetchone()
+    after = conn.execute(
+        """
+        SELECT starts_at, ends_at FROM driver_shifts
+        WHERE driver_id = ? AND starts_at >= ? AND shift_id IS NOT ? ORDER BY starts_at LIMIT 1
+        """,
+        (driver_id, starts_at, shift_id),
+    ).fetchone()
+    return before, after
+
+def check(conn, driver_id, starts_at, ends_at, shift_id=None):
+    """Raise RosterConflict if the driver cannot take a shift from starts_at to ends_at.
+
+    `shift_id` is left out of the comparison, for checking a stored shift.
+    """
+    shift = (_minutes(starts_at), _minutes(ends_at))
+    before, after = _neighbours(conn, driver_id, starts_at, shift_id)
+    if before and _clash((_minutes(before[0]), _minutes(before[1])), shift):
+        other = before
+    elif after and _clash(shift, (_minutes(after[0]), _minutes(after[1]))):
+        other = after
+    else:
+        return
+    raise RosterConflict(
+        f"Driver {driver_id} is on a trip from {other[0]} to {other[1]}; "
+        f"the rest rules need a longer gap between the two."
+    )
+
+def check_trip(conn, bus_id, starts_at):
+    """Raise RosterConflict if a shift on the bus's trip at starts_at no longer fits its driver's roster."""
+    for shift_id, driver_id, ends_at in conn.execute(
+        "SELECT shift_id, driver_id, ends_at FROM driver_shifts WHERE bus_id = ? AND starts_at = ?",
+        (bus_id, starts_at),
+    ).fetchall():
+        check(conn, driver_id, starts_at, ends_at, shift_id)
+
+def assign(driver_id, bus_id, departure_ts, role="driver"):
+    """Put a driver on a bus's trip; returns shift_id.
+
+    Raises RosterConflict when the driver is busy or owed rest, ValueError
+    when the trip already has someone in that role and LookupError when the
+    driver or trip does not exist.
+    """
+    if role not in ROLES:
+        raise ValueError(f"Role must be one of {', '.join(ROLES)}.")
+    with get_transaction() as conn:
+        if conn.execute("SELECT 1 FROM drivers WHERE driver_id = ?", (driver_id,)).fetchone() is None:
+            raise LookupError(f"Driver {driver_id} not found.")
+        starts_at, ends_at = _trip(conn, bus_id, departure_ts)
+        taken = conn.execute(
+            "SELECT driver_id FROM driver_shifts WHERE bus_id = ? AND starts_at = ? AND role = ?",
+            (bus_id, starts_at, role),
+        ).fetchone()
+        if taken:
+            raise ValueError(f"Driver {taken[0]} is already the {role.replace('_', '-')} on that trip.")
+        check(conn, driver_id, starts_at, ends_at)
+        return conn.execute(
+            "INSERT INTO driver_shifts (driver_id, bus_id, role, starts_at, ends_at) VALUES (?, ?, ?, ?, ?)",
+            (driver_id, bus_id, role, starts_at, ends_at),
+        ).lastrowid
+
+def unassign(shift_id):
+    with get_connection() as conn:
+        return conn.execute("DELETE FROM driver_shifts WHERE shift_id = ?", (shift_id,)).rowcount
+
+def shifts_for(driver_id, start, end):
+    """A driver's shifts starting on dates start..end, as Shift tuples in time order."""
+    with get_read_connection() as conn:
+        return [Shift(*row) for row in conn.execute(
+            """
+            SELECT shift_id, driver_id, bus_id, role, starts_at, ends_at FROM driver_shifts
+            WHERE driver_id = ? AND starts_at >= ? AND starts_at < ?
+            ORDER BY starts_at
+            """,
+            (driver_id, f"{recurrence.as_date(start)} 00:00:00",
+             f"{recurrence.as_date(end) + timedelta(days=1)} 00:00:00"),
+        )]
+
+
+def auto_assign(start, end, driver_ids=None, save=True):
+    """Give a driver to every trip departing on dates start..end that lacks one.
+
+    Only drivers in `driver_ids` (default: all) are used. Returns an
+    AutoRosterResult; `unassigned` lists the (bus_id, departure_ts) of trips
+    no driver could take. With save=False nothing is written.
+    """
+    start, end = recurrence.as_date(start), recurrence.as_date(end)
+    window = (f"{start - WINDOW_MARGIN} 00:00:00", f"{end + timedelta(days=1) + WINDOW_MARGIN} 00:00:00")
+    with get_read_connection() as conn:
+        conn.execute("BEGIN")
+        drivers = [row[0] for row in conn.execute("SELECT driver_id FROM drivers ORDER BY driver_id")]
+        regular = dict(conn.execute("SELECT bus_id, driver_id1 FROM buses WHERE driver_id1 IS NOT NULL"))
+        timelines = {driver_id: Timeline() for driver_id in drivers}
+        covered = set()
+        for driver_id, bus_id, role, starts_at, ends_at in conn.execute(
+            "SELECT driver_id, bus_id, role, starts_at, ends_at FROM driver_shifts "
+            "WHERE starts_at >= ? AND starts_at < ? ORDER BY starts_at",
+            window,
+        ):
+            timelines[driver_id].add(_minutes(starts_at), _minutes(ends_at))
+            if role == "driver":
+                covered.add((bus_id, starts_at))
+    if driver_ids is not None:
+        allowed = set(driver_ids)
+        drivers = [driver_id for driver_id in drivers if driver_id in allowed]
+
+    first = _minutes(f"{start} 00:00:00")
+    free_at = {driver_id: timelines[driver_id].free_from(first) or 0 for driver_id in drivers}
+    ready = [(minute, driver_id) for driver_id, minute in free_at.items()]
+    heapq.heapify(ready)
+
+    def take(driver_id, trip_start, trip_end):
+        timelines[driver_id].add(trip_start, trip_end)
+        if trip_start >= free_at[driver_id]:
+            free_at[driver_id] = trip_end + rest_after(trip_end - trip_start)
+            heapq.heappush(ready, (free_at[driver_id], driver_id))
+
+    trips = assigned = already = 0
+    new_shifts, unassigned = [], []
+    for trip in recurrence.trips_between(start, end):
+        trips += 1
+        if (trip.bus_id, trip.departure_ts) in covered:
+            already += 1
+            continue
+        trip_start, trip_end = _minutes(trip.departure_ts), _minutes(trip.arrival_ts)
+        chosen = regular.get(trip.bus_id)
+        if chosen not in free_at or timelines[chosen].conflict(trip_start, trip_end):
+            chosen = None
+            while ready and ready[0][0] <= trip_start:
+                minute, driver_id = heapq.heappop(ready)
+                if minute != free_at[driver_id]:
+                    continue  # superseded by a later shift
+                clash = timelines[driver_id].conflict(trip_start, trip_end)
+                if clash:
+                    # Already rostered around this time: not free until after that shift
+                    free_at[driver_id] = clash[1] + rest_after(clash[1] - clash[0])
+                    heapq.heappush(ready, (free_at[driver_id], driver_id))
+                    continue
+                chosen = driver_id
+                break
+        if chosen is None:
+            unassigned.append((trip.bus_id, trip.departure_ts))
+            continue
+        take(chosen, trip_start, trip_end)
+        new_shifts.append((chosen, trip.bus_id, trip.departure_ts, trip.arrival_ts))
+        assigned += 1
+
+    if save and new_shifts:
+        # The roster may have changed since it was read: check each shift as it goes in
+        with get_transaction() as conn:
+            for driver_id, bus_id, starts_at, ends_at in new_shifts:
+                if conn.execute(
+                    "SELECT 1 FROM driver_shifts WHERE bus_id = ? AND starts_at = ? AND role = 'driver'",
+                    (bus_id, starts_at),
+                ).fetchone():
+                    assigned -= 1
+                    already += 1
+                    continue
+                try:
+                    check(conn, driver_id, starts_at, ends_at)
+                except RosterConflict:
+                    assigned -= 1
+                    unassigned.append((bus_id, starts_at))
+                    continue
+                conn.execute(
+                    "INSERT INTO driver_shifts (driver_id, bus_id, role, starts_at, ends_at) "
+                    "VALUES (?, ?, 'driver', ?, ?)",
+                    (driver_id, bus_id, starts_at, ends_at),
+                )
+        unassigned.sort(key=lambda trip: trip[1])
+    return AutoRosterResult(trips, assigned, already, unassigned)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["auto"] and len(argv) == 3:
+        started = datetime.now()
+        result = auto_assign(argv[1], argv[2])
+        print(f"{result.trips} trips: {result.assigned} assigned, {result.already_covered} already covered, "
+              f"{len(result.unassigned)} without a driver "
+              f"({(datetime.now() - started).total_seconds():.1f}s).")
+        return 0
+    if argv[:1] == ["driver"] and len(argv) == 4:
+        for shift in shifts_for(int(argv[1]), argv[2], argv[3]):
+            print(f"{shift.starts_at} -> {shift.ends_at}  bus {shift.bus_id} ({shift.role}, shift {shift.shift_id})")
+        return 0
+    print(__doc__.strip().splitlines()[-1])
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Normalized route stops: lookups and origin/destination matching in SQL."""
+from database import get_connection, get_read_connection
+
+def parse_stops(stops):
+    """Split a comma-separated stops string into clean stop names."""
+    return [name.strip() for name in stops.split(",") if name.strip()]
+
+def set_route_stops(conn, route_id, stops):
+    """Replace the ordered stops of a route from its comma-separated string.
+
+    Runs on the caller's connection so it joins the caller's transaction.
+    """
+    names = parse_stops(stops)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM route_stops WHERE route_id = ?", (route_id,))
+    cur.executemany("INSERT OR IGNORE INTO stops (name) VALUES (?)", ((name,) for name in names))
+    cur.executemany(
+        """
+        INSERT INTO route_stops (route_id, seq, stop_id)
+        SELECT ?, ?, stop_id FROM stops WHERE name = ?
+        """,
+        ((route_id, seq, name) for seq, name in enumerate(names)),
+    )
+
+def migrate_route_stops(conn=None):
+    """One-shot migration of routes.stops strings into route_stops.
+
+    Only routes that have no route_stops rows yet are converted, so running
+    it again is cheap. Returns the number of routes migrated.
+    """
+    if conn is None:
+        with get_connection() as conn:
+            return migrate_route_stops(conn)
+
+    pending = conn.execute("""
+        SELECT route_id, stops FROM routes
+        WHERE NOT EXISTS (SELECT 1 FROM route_stops WHERE route_stops.route_id = routes.route_id)
+    """).fetchall()
+    for route_id, stops in pending:
+        set_route_stops(conn, route_id, stops)
+    return len(pending)
+
+def routes_for_stop(stop_name):
+    """Return (route_id, route_name, seq) for every route serving a stop."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT routes.route_id, routes.route_name, route_stops.seq
+            FROM stops
+            JOIN route_stops ON route_stops.stop_id = stops.stop_id
+            JOIN routes ON routes.route_id = route_stops.route_id
+            WHERE stops.name = ?
+            ORDER BY routes.route_id
+        """, (stop_name.strip(),))
+        return cur.fetchall()
+
+def buses_for_stop(stop_name):
+    """Return (bus_id, bus_name, bus_number, route_name) for buses serving a stop."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT buses.bus_id, buses.name, buses.number, routes.route_name
+            FROM stops
+            JOIN route_stops ON route_stops.stop_id = stops.stop_id
+            JOIN routes ON routes.route_id = route_stops.route_id
+            JOIN buses ON buses.route_id = route_stops.route_id
+            WHERE stops.name = ?
+            ORDER BY buses.bus_id
+        """, (stop_name.strip(),))
+        return cur.fetchall()
+
+def routes_between(origin, destination):
+    """Return routes that call at `origin` and later at `destination`.
+
+    Rows are (route_id, route_name, origin_seq, destination_seq), fewest
+    intermediate stops first.
+    """
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT routes.route_id, routes.route_name, a.seq, b.seq
+            FROM stops AS origin
+            JOIN route_stops AS a ON a.stop_id = origin.stop_id
+            JOIN stops AS destination ON destination.name = ?
+            JOIN route_stops AS b
+                ON b.stop_id = destination.stop_id AND b.route_id = a.route_id AND b.seq > a.seq
+            JOIN routes ON routes.route_id = a.route_id
+            WHERE origin.name = ?
+            ORDER BY b.seq - a.seq, routes.route_id
+        """, (destination.strip(), origin.strip()))
+        return cur.fetchall()
+
+def buses_between(origin, destination):
+    """Return (bus_id, bus_name, bus_number, route_name) for buses from origin to destination."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT DISTINCT buses.bus_id, buses.name, buses.number, routes.route_name
+            FROM stops AS origin
+            JOIN route_stops AS a ON a.stop_id = origin.stop_id
+            JOIN stops AS destination ON destination.name = ?
+            JOIN route_stops AS b
+                ON b.stop_id = destination.stop_id AND b.route_id = a.route_id AND b.seq > a.seq
+            JOIN routes ON routes.route_id = a.route_id
+            JOIN buses ON buses.route_id = a.route_id
+            WHERE origin.name = ?
+            ORDER BY buses.bus_id
+        """, (destination.strip(), origin.strip()))
+        return cur.fetchall()
+
+def passes_before(route_id, first_stop, second_stop):
+    """True if the route calls at `first_stop` before `second_stop`."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT 1
+            FROM stops AS s1
+            JOIN route_stops AS a ON a.stop_id = s1.stop_id AND a.route_id = ?
+            JOIN stops AS s2 ON s2.name = ?
+            JOIN route_stops AS b ON b.stop_id = s2.stop_id AND b.route_id = a.route_id
+            WHERE s1.name = ? AND a.seq < b.seq
+            LIMIT 1
+        """, (route_id, second_stop.strip(), first_stop.strip()))
+        return cur.fetchone() is not None
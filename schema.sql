@@ -1,3 +1,8 @@
+-- New files return freed pages a few at a time (archive.vacuum()). This only
+-- takes effect before the first table exists; older files are switched once
+-- with "python archive.py enable-vacuum".
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -- Create Users Table
 CREATE TABLE IF NOT EXISTS users (
     user_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -13,7 +18,7 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS routes (
     route_id INTEGER PRIMARY KEY AUTOINCREMENT,
     route_name TEXT NOT NULL,
-    stops TEXT NOT NULL -- Optionally normalize into a separate table if needed
+    stops TEXT NOT NULL -- Display copy; normalized into route_stops
 );
 
 -- Create Drivers Table
@@ -32,7 +37,7 @@ CREATE TABLE IF NOT EXISTS buses (
     number TEXT NOT NULL UNIQUE,
     route_id INTEGER NOT NULL,
     ticket_price REAL NOT NULL,
-    is_prebooked INTEGER DEFAULT 0,
+    is_prebooked INTEGER DEFAULT 0,   -- unused: prebookings are per trip, in prebooked_buses
     prebooked_by INTEGER,
     capacity INTEGER NOT NULL,
     driver_id1 INTEGER,
@@ -51,9 +56,12 @@ CREATE TABLE IF NOT EXISTS tickets (
     seat_id TEXT NOT NULL UNIQUE,
     status TEXT CHECK(status IN ('sold', 'unsold')) DEFAULT 'unsold',
     price REAL NOT NULL,
+    base_price REAL,              -- the seat's fare before dynamic pricing (see pricing.py); NULL = price
     user_id INTEGER,
+    schedule_id INTEGER,          -- NULL for seats sold per bus rather than per trip
     FOREIGN KEY(bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE,
-    FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE SET NULL
+    FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE SET NULL,
+    FOREIGN KEY(schedule_id) REFERENCES schedules(schedule_id) ON DELETE CASCADE
 );
 
 -- Create Reviews Table
@@ -83,6 +91,7 @@ CREATE TABLE IF NOT EXISTS prebooked_buses (
     user_id INTEGER NOT NULL,
     bus_id INTEGER NOT NULL,
     prebook_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    schedule_id INTEGER,              -- the trip prebooked; NULL for prebookings older than this column
     FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
     FOREIGN KEY(bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE
 );
@@ -95,11 +104,53 @@ CREATE TABLE IF NOT EXISTS schedules (
     departure_date TEXT NOT NULL, -- In ISO 8601 (YYYY-MM-DD) format
     departure_time TEXT NOT NULL, -- In 24-hour format (HH:MM)
     arrival_time TEXT NOT NULL,   -- In 24-hour format (HH:MM)
+    departure_ts TEXT,            -- 'YYYY-MM-DD HH:MM:SS'; see timetable.py
+    arrival_ts TEXT,              -- after departure_ts, also for overnight trips
+    pattern_id INTEGER REFERENCES schedule_patterns(pattern_id) ON DELETE SET NULL,
     FOREIGN KEY (bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE,
     FOREIGN KEY (route_id) REFERENCES routes(route_id) ON DELETE CASCADE,
     UNIQUE (bus_id, departure_date, departure_time) -- Prevent duplicate schedules
 );
 
+-- Driver rostering (roster.py): who drives which trip. A trip is a bus's
+-- departure, booked or not, so shifts are keyed by (bus_id, starts_at) and
+-- need no schedules row; the times are copied from the trip.
+CREATE TABLE IF NOT EXISTS driver_shifts (
+    shift_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    driver_id INTEGER NOT NULL,
+    bus_id INTEGER NOT NULL,
+    role TEXT NOT NULL DEFAULT 'driver' CHECK (role IN ('driver', 'co_driver')),
+    starts_at TEXT NOT NULL,                -- trip departure_ts
+    ends_at TEXT NOT NULL,                  -- trip arrival_ts
+    FOREIGN KEY (driver_id) REFERENCES drivers(driver_id) ON DELETE CASCADE,
+    FOREIGN KEY (bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE,
+    UNIQUE (bus_id, starts_at, role)
+);
+
+-- Recurring services, expanded into trips on demand by recurrence.py. A
+-- trip only gets a schedules row (with pattern_id set) once it is booked.
+CREATE TABLE IF NOT EXISTS schedule_patterns (
+    pattern_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bus_id INTEGER NOT NULL,
+    route_id INTEGER NOT NULL,
+    departure_time TEXT NOT NULL,           -- HH:MM
+    arrival_time TEXT NOT NULL,             -- HH:MM, earlier than departure = next day
+    weekdays INTEGER NOT NULL DEFAULT 127,  -- bit 0 = Monday ... bit 6 = Sunday
+    interval_weeks INTEGER NOT NULL DEFAULT 1 CHECK (interval_weeks >= 1),
+    valid_from TEXT NOT NULL,               -- YYYY-MM-DD, first possible service date
+    valid_until TEXT,                       -- YYYY-MM-DD inclusive, NULL = open-ended
+    FOREIGN KEY (bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE,
+    FOREIGN KEY (route_id) REFERENCES routes(route_id) ON DELETE CASCADE
+);
+
+-- Service dates on which a pattern does not run
+CREATE TABLE IF NOT EXISTS pattern_exceptions (
+    pattern_id INTEGER NOT NULL,
+    service_date TEXT NOT NULL,             -- YYYY-MM-DD
+    PRIMARY KEY (pattern_id, service_date),
+    FOREIGN KEY (pattern_id) REFERENCES schedule_patterns(pattern_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
 -- Create Driver Assignments Table (Optional if not using driver columns in buses)
 CREATE TABLE IF NOT EXISTS driver_assignments (
     assignment_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -109,3 +160,312 @@ CREATE TABLE IF NOT EXISTS driver_assignments (
     FOREIGN KEY (driver_id) REFERENCES drivers(driver_id) ON DELETE CASCADE
 );
 
+
+-- Stop dictionary and ordered stops per route (normalized from routes.stops)
+CREATE TABLE IF NOT EXISTS stops (
+    stop_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE
+);
+
+CREATE TABLE IF NOT EXISTS route_stops (
+    route_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,         -- 0-based position along the route
+    stop_id INTEGER NOT NULL,
+    PRIMARY KEY (route_id, seq),
+    FOREIGN KEY (route_id) REFERENCES routes(route_id) ON DELETE CASCADE,
+    FOREIGN KEY (stop_id) REFERENCES stops(stop_id)
+) WITHOUT ROWID;
+
+-- Seat occupancy bitmaps per bus and trip (see seat_inventory.py).
+-- Bit n-1 of each blob stands for seat n; `stale` is set by the triggers
+-- below whenever tickets change behind the inventory engine's back.
+CREATE TABLE IF NOT EXISTS seat_maps (
+    bus_id INTEGER NOT NULL,
+    schedule_id INTEGER NOT NULL DEFAULT 0, -- 0 = tickets without a schedule
+    capacity INTEGER NOT NULL,
+    stock BLOB NOT NULL,          -- seats that have a ticket row
+    sold BLOB NOT NULL,
+    held BLOB NOT NULL,           -- holds at the last write; seat_holds is authoritative
+    version INTEGER NOT NULL DEFAULT 0,
+    stale INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bus_id, schedule_id),
+    FOREIGN KEY (bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Seats kept for a customer until expires_at ('YYYY-MM-DD HH:MM:SS');
+-- expired rows are ignored and cleared on the next write to the seat map.
+CREATE TABLE IF NOT EXISTS seat_holds (
+    bus_id INTEGER NOT NULL,
+    schedule_id INTEGER NOT NULL DEFAULT 0, -- 0 = tickets without a schedule
+    seat_number INTEGER NOT NULL,
+    holder INTEGER NOT NULL,                -- user_id the seats are held for
+    expires_at TEXT NOT NULL,
+    PRIMARY KEY (bus_id, schedule_id, seat_number),
+    FOREIGN KEY (bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_seat_map_insert AFTER INSERT ON tickets
+BEGIN
+    UPDATE seat_maps SET stale = 1
+    WHERE bus_id = NEW.bus_id AND schedule_id = COALESCE(NEW.schedule_id, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_seat_map_update
+AFTER UPDATE OF bus_id, schedule_id, seat_number, status ON tickets
+BEGIN
+    UPDATE seat_maps SET stale = 1
+    WHERE (bus_id = OLD.bus_id AND schedule_id = COALESCE(OLD.schedule_id, 0))
+       OR (bus_id = NEW.bus_id AND schedule_id = COALESCE(NEW.schedule_id, 0));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_seat_map_delete AFTER DELETE ON tickets
+BEGIN
+    UPDATE seat_maps SET stale = 1
+    WHERE bus_id = OLD.bus_id AND schedule_id = COALESCE(OLD.schedule_id, 0);
+END;
+
+-- Sold/unsold counts and revenue per bus and trip (see availability.py),
+-- kept exact by the triggers below so reports never aggregate tickets.
+CREATE TABLE IF NOT EXISTS bus_availability (
+    bus_id INTEGER NOT NULL,
+    schedule_id INTEGER NOT NULL DEFAULT 0, -- 0 = tickets without a schedule
+    sold INTEGER NOT NULL DEFAULT 0,
+    unsold INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,        -- sum of price over sold tickets
+    PRIMARY KEY (bus_id, schedule_id),
+    FOREIGN KEY (bus_id) REFERENCES buses(bus_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_availability_insert AFTER INSERT ON tickets
+BEGIN
+    INSERT INTO bus_availability (bus_id, schedule_id, sold, unsold, revenue)
+    VALUES (NEW.bus_id, COALESCE(NEW.schedule_id, 0), NEW.status IS 'sold', NEW.status IS 'unsold',
+            CASE WHEN NEW.status IS 'sold' THEN NEW.price ELSE 0 END)
+    ON CONFLICT (bus_id, schedule_id) DO UPDATE SET
+        sold = sold + excluded.sold,
+        unsold = unsold + excluded.unsold,
+        revenue = revenue + excluded.revenue;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_availability_update
+AFTER UPDATE OF bus_id, schedule_id, status, price ON tickets
+BEGIN
+    UPDATE bus_availability SET
+        sold = sold - (OLD.status IS 'sold'),
+        unsold = unsold - (OLD.status IS 'unsold'),
+        revenue = revenue - CASE WHEN OLD.status IS 'sold' THEN OLD.price ELSE 0 END
+    WHERE bus_id = OLD.bus_id AND schedule_id = COALESCE(OLD.schedule_id, 0);
+    INSERT INTO bus_availability (bus_id, schedule_id, sold, unsold, revenue)
+    VALUES (NEW.bus_id, COALESCE(NEW.schedule_id, 0), NEW.status IS 'sold', NEW.status IS 'unsold',
+            CASE WHEN NEW.status IS 'sold' THEN NEW.price ELSE 0 END)
+    ON CONFLICT (bus_id, schedule_id) DO UPDATE SET
+        sold = sold + excluded.sold,
+        unsold = unsold + excluded.unsold,
+        revenue = revenue + excluded.revenue;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_availability_delete AFTER DELETE ON tickets
+BEGIN
+    UPDATE bus_availability SET
+        sold = sold - (OLD.status IS 'sold'),
+        unsold = unsold - (OLD.status IS 'unsold'),
+        revenue = revenue - CASE WHEN OLD.status IS 'sold' THEN OLD.price ELSE 0 END
+    WHERE bus_id = OLD.bus_id AND schedule_id = COALESCE(OLD.schedule_id, 0);
+END;
+
+-- Row-level change feed for the admin lists (see changes.py). Every write to
+-- a listed table appends (table, row id); `version` only ever grows, so a
+-- view that remembers the last version it saw can patch just those rows.
+CREATE TABLE IF NOT EXISTS change_log (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_changes_insert AFTER INSERT ON tickets
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('tickets', NEW.ticket_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_changes_update AFTER UPDATE ON tickets
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('tickets', OLD.ticket_id);
+    INSERT INTO change_log (table_name, row_id)
+    SELECT 'tickets', NEW.ticket_id WHERE NEW.ticket_id IS NOT OLD.ticket_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tickets_changes_delete AFTER DELETE ON tickets
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('tickets', OLD.ticket_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_drivers_changes_insert AFTER INSERT ON drivers
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('drivers', NEW.driver_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_drivers_changes_update AFTER UPDATE ON drivers
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('drivers', OLD.driver_id);
+    INSERT INTO change_log (table_name, row_id)
+    SELECT 'drivers', NEW.driver_id WHERE NEW.driver_id IS NOT OLD.driver_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_drivers_changes_delete AFTER DELETE ON drivers
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('drivers', OLD.driver_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_changes_insert AFTER INSERT ON routes
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('routes', NEW.route_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_changes_update AFTER UPDATE ON routes
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('routes', OLD.route_id);
+    INSERT INTO change_log (table_name, row_id)
+    SELECT 'routes', NEW.route_id WHERE NEW.route_id IS NOT OLD.route_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_changes_delete AFTER DELETE ON routes
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('routes', OLD.route_id);
+END;
+
+-- The ticket list shows bus names, so a rename touches every ticket row
+CREATE TRIGGER IF NOT EXISTS trg_buses_changes_rename AFTER UPDATE OF name ON buses
+WHEN NEW.name IS NOT OLD.name
+BEGIN
+    INSERT INTO change_log (table_name, row_id) VALUES ('buses', NEW.bus_id);
+END;
+
+-- Full-text index for the passenger bus search (see search.py): one row per
+-- bus, rowid = bus_id, kept in step with buses and routes by the triggers below.
+CREATE VIRTUAL TABLE IF NOT EXISTS bus_search USING fts5(
+    name, number, route_name, stops,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_buses_search_insert AFTER INSERT ON buses
+BEGIN
+    INSERT INTO bus_search (rowid, name, number, route_name, stops)
+    VALUES (NEW.bus_id, NEW.name, NEW.number,
+            (SELECT route_name FROM routes WHERE route_id = NEW.route_id),
+            (SELECT stops FROM routes WHERE route_id = NEW.route_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_buses_search_update
+AFTER UPDATE OF bus_id, name, number, route_id ON buses
+BEGIN
+    DELETE FROM bus_search WHERE rowid = OLD.bus_id;
+    INSERT INTO bus_search (rowid, name, number, route_name, stops)
+    VALUES (NEW.bus_id, NEW.name, NEW.number,
+            (SELECT route_name FROM routes WHERE route_id = NEW.route_id),
+            (SELECT stops FROM routes WHERE route_id = NEW.route_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_buses_search_delete AFTER DELETE ON buses
+BEGIN
+    DELETE FROM bus_search WHERE rowid = OLD.bus_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_routes_search_update AFTER UPDATE OF route_name, stops ON routes
+BEGIN
+    UPDATE bus_search SET route_name = NEW.route_name, stops = NEW.stops
+    WHERE rowid IN (SELECT bus_id FROM buses WHERE route_id = NEW.route_id);
+END;
+
+-- Timestamps for writers that only set the text columns. An arrival time
+-- earlier than the departure time means the next day. Text that datetime()
+-- cannot read leaves NULL for timetable.migrate_timestamps() to convert.
+CREATE TRIGGER IF NOT EXISTS trg_schedules_timestamps_insert AFTER INSERT ON schedules
+WHEN NEW.departure_ts IS NULL
+BEGIN
+    UPDATE schedules SET
+        departure_ts = datetime(NEW.departure_date || ' ' || NEW.departure_time),
+        arrival_ts = datetime(NEW.departure_date || ' ' || NEW.arrival_time,
+                              CASE WHEN NEW.arrival_time < NEW.departure_time THEN '+1 day' ELSE '+0 days' END)
+    WHERE schedule_id = NEW.schedule_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedules_timestamps_update
+AFTER UPDATE OF departure_date, departure_time, arrival_time ON schedules
+WHEN NEW.departure_ts IS OLD.departure_ts AND NEW.arrival_ts IS OLD.arrival_ts
+BEGIN
+    UPDATE schedules SET
+        departure_ts = datetime(NEW.departure_date || ' ' || NEW.departure_time),
+        arrival_ts = datetime(NEW.departure_date || ' ' || NEW.arrival_time,
+                              CASE WHEN NEW.arrival_time < NEW.departure_time THEN '+1 day' ELSE '+0 days' END)
+    WHERE schedule_id = NEW.schedule_id;
+END;
+
+-- Shifts follow their trip when a scheduled trip is retimed; writers that
+-- retime trips check the moved shifts with roster.check_trip()
+CREATE TRIGGER IF NOT EXISTS trg_schedules_shifts_retime
+AFTER UPDATE OF departure_ts, arrival_ts ON schedules
+WHEN OLD.departure_ts IS NOT NULL
+BEGIN
+    UPDATE driver_shifts SET starts_at = NEW.departure_ts, ends_at = NEW.arrival_ts
+    WHERE bus_id = OLD.bus_id AND starts_at = OLD.departure_ts;
+END;
+
+-- A trip that goes away (deleted, or moved to the archive) takes its shifts
+-- with it, so it stops blocking its drivers
+CREATE TRIGGER IF NOT EXISTS trg_schedules_shifts_delete
+AFTER DELETE ON schedules
+BEGIN
+    DELETE FROM driver_shifts WHERE bus_id = OLD.bus_id AND starts_at = OLD.departure_ts;
+END;
+
+-- Secondary indexes for the lookups and joins the application runs.
+-- schedules(bus_id) is already served by the UNIQUE (bus_id, ...) index and
+-- tickets(seat_id) / users(email) by their UNIQUE constraints.
+
+-- Availability counts and per-bus ticket lookups
+CREATE INDEX IF NOT EXISTS idx_tickets_bus_status ON tickets(bus_id, status);
+-- Per-trip seat inventory
+CREATE INDEX IF NOT EXISTS idx_tickets_bus_schedule ON tickets(bus_id, schedule_id, seat_number);
+CREATE INDEX IF NOT EXISTS idx_tickets_schedule ON tickets(schedule_id);
+
+-- Prebooking looks buses up by name within a route
+CREATE INDEX IF NOT EXISTS idx_buses_name_route ON buses(name, route_id);
+CREATE INDEX IF NOT EXISTS idx_buses_route ON buses(route_id);
+-- Foreign-key checks when a driver is deleted
+CREATE INDEX IF NOT EXISTS idx_buses_driver1 ON buses(driver_id1) WHERE driver_id1 IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_buses_driver2 ON buses(driver_id2) WHERE driver_id2 IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_routes_name ON routes(route_name);
+CREATE INDEX IF NOT EXISTS idx_drivers_name ON drivers(name);
+-- Timetable range scans: a route's departures in time order. Also serves
+-- route_id lookups, so it replaces the old single-column index.
+CREATE INDEX IF NOT EXISTS idx_schedules_route_departure ON schedules(route_id, departure_ts);
+DROP INDEX IF EXISTS idx_schedules_route;
+-- Booked trips of a pattern by date; also the ON DELETE SET NULL lookup
+CREATE INDEX IF NOT EXISTS idx_schedules_pattern ON schedules(pattern_id, departure_date)
+    WHERE pattern_id IS NOT NULL;
+-- Patterns running on a route or bus, by start of validity
+CREATE INDEX IF NOT EXISTS idx_schedule_patterns_route ON schedule_patterns(route_id, valid_from);
+CREATE INDEX IF NOT EXISTS idx_schedule_patterns_bus ON schedule_patterns(bus_id, valid_from);
+
+-- A driver's shifts in time order: the neighbours of a new shift are two seeks
+CREATE INDEX IF NOT EXISTS idx_driver_shifts_driver ON driver_shifts(driver_id, starts_at);
+
+-- Reverse index: which routes pass a stop, and where along them
+CREATE INDEX IF NOT EXISTS idx_route_stops_stop ON route_stops(stop_id, route_id, seq);
+
+CREATE INDEX IF NOT EXISTS idx_driver_assignments_bus ON driver_assignments(bus_id, driver_id);
+CREATE INDEX IF NOT EXISTS idx_driver_assignments_driver ON driver_assignments(driver_id);
+
+CREATE INDEX IF NOT EXISTS idx_prebooked_user ON prebooked_buses(user_id, bus_id);
+CREATE INDEX IF NOT EXISTS idx_prebooked_bus ON prebooked_buses(bus_id);
+-- One prebooking per trip
+CREATE UNIQUE INDEX IF NOT EXISTS idx_prebooked_trip ON prebooked_buses(bus_id, schedule_id)
+    WHERE schedule_id IS NOT NULL;
+
+-- Foreign-key cascades when a bus is deleted
+CREATE INDEX IF NOT EXISTS idx_transactions_bus ON transactions(bus_id);
+-- Sales reports by period, and archive.py picking out old payments
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date);
+CREATE INDEX IF NOT EXISTS idx_reviews_bus ON reviews(bus_id);
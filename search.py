@@ -0,0 +1,86 @@
+"""Full-text bus search backed by the FTS5 table `bus_search`.
+
+bus_search holds each bus's name and number with its route's name and
+stops (rowid = bus_id); the triggers in schema.sql keep it in step with
+buses and routes. Every word typed is matched as a prefix and all words
+must match, so "pok exp" finds "Pokhara Express". Results are ranked by
+bm25 with name and number weighted above route and stops.
+
+Usage: python search.py rebuild | python search.py WORDS...
+"""
+import re
+import sys
+
+from database import get_connection, get_read_connection
+
+SEARCH_LIMIT = 50
+MIN_SEARCH_CHARS = 2  # a single letter matches most of the fleet; not worth ranking
+# bm25 column weights: name, number, route_name, stops
+RANK = "bm25(10.0, 8.0, 4.0, 2.0)"
+
+SEARCH_QUERY = """
+    WITH hits AS (
+        SELECT rowid AS bus_id, rank FROM bus_search
+        WHERE bus_search MATCH ? AND rank MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    )
+    SELECT buses.bus_id, buses.name, buses.number, buses.ticket_price, buses.capacity,
+        routes.route_name, routes.stops
+    FROM hits
+    JOIN buses ON buses.bus_id = hits.bus_id
+    LEFT JOIN routes ON routes.route_id = buses.route_id
+    ORDER BY hits.rank
+"""
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query: every word, as a prefix, must match."""
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_buses(text, limit=SEARCH_LIMIT):
+    """Best matches for `text`, shaped like services.list_buses() rows."""
+    expression = match_expression(text)
+    if not expression:
+        return []
+    with get_read_connection() as conn:
+        return conn.execute(SEARCH_QUERY, (expression, RANK, limit)).fetchall()
+
+
+def rebuild(conn=None):
+    """Re-index every bus; returns the number of rows indexed."""
+    if conn is None:
+        with get_connection() as conn:
+            return rebuild(conn)
+    conn.execute("DELETE FROM bus_search")
+    return conn.execute("""
+        INSERT INTO bus_search (rowid, name, number, route_name, stops)
+        SELECT buses.bus_id, buses.name, buses.number, routes.route_name, routes.stops
+        FROM buses
+        LEFT JOIN routes ON routes.route_id = buses.route_id
+    """).rowcount
+
+def migrate_search(conn):
+    """Index existing buses the first time the search table exists next to them."""
+    empty = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM bus_search)").fetchone()[0]
+    if empty and conn.execute("SELECT EXISTS (SELECT 1 FROM buses)").fetchone()[0]:
+        return rebuild(conn)
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    if argv == ["rebuild"]:
+        print(f"Indexed {rebuild()} buses.")
+        return 0
+    for bus in search_buses(" ".join(argv)):
+        print(f"{bus[0]:>6}  {bus[1]} ({bus[2]})  {bus[5]}: {bus[6]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Generate a bus's whole ticket inventory from its capacity and fare.
+
+Seats are numbered 1..capacity row by row. A layout gives the seats per row
+on each side of the aisle, and price tiers scale the bus's ticket_price for
+ranges of rows (e.g. "1-2:1.25,12-13:0.9" makes the first two rows 25% dearer
+and the last two 10% cheaper).
+
+Inventory is generated per bus (schedule_id NULL, seat_id "<bus>-<seat>",
+matching tickets added by hand) or per scheduled trip in a date range
+(seat_id "<bus>-<schedule>-<seat>"). Everything is written in one
+transaction with executemany and upserts on seat_id, and only seats that are
+missing or priced differently are written, so re-running is cheap. Sold
+seats are never repriced or removed.
+
+The tier fare is kept in tickets.base_price. Seats are compared on it
+rather than on price, so resyncing leaves dynamic prices (pricing.py) alone;
+when a seat's tier fare changes, its current dynamic factor is carried over.
+"""
+from collections import namedtuple
+
+from database import get_transaction
+
+# name -> (seats left of the aisle, seats right of the aisle)
+LAYOUTS = {
+    "2+2": (2, 2),
+    "2+1": (2, 1),
+    "1+1": (1, 1),
+    "3+2": (3, 2),
+}
+DEFAULT_LAYOUT = "2+2"
+
+SeatGenResult = namedtuple("SeatGenResult", "trips created repriced removed")
+
+
+def row_width(layout=DEFAULT_LAYOUT):
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}; choose from {', '.join(LAYOUTS)}.")
+    return sum(LAYOUTS[layout])
+
+def parse_tiers(spec):
+    """Parse "1-2:1.25,13:0.9" into [(first_row, last_row, multiplier)]."""
+    tiers = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            rows, multiplier = part.split(":")
+            first, _, last = rows.partition("-")
+            tier = (int(first), int(last or first), float(multiplier))
+        except ValueError:
+            raise ValueError(f"Bad price tier {part!r}; expected e.g. 1-2:1.25")
+        if tier[0] < 1 or tier[1] < tier[0] or tier[2] <= 0:
+            raise ValueError(f"Bad price tier {part!r}.")
+        tiers.append(tier)
+    return tiers
+
+def seat_prices(capacity, base_price, layout=DEFAULT_LAYOUT, tiers=()):
+    """Return {seat_number: price}; the first matching tier wins."""
+    width = row_width(layout)
+    prices = {}
+    for seat in range(1, capacity + 1):
+        row = (seat - 1) // width + 1
+        multiplier = next((m for first, last, m in tiers if first <= row <= last), 1.0)
+        prices[seat] = round(base_price * multiplier, 2)
+    return prices
+
+def seat_id(bus_id, seat_number, schedule_id=None):
+    if schedule_id is None:
+        return f"{bus_id}-{seat_number}"
+    return f"{bus_id}-{schedule_id}-{seat_number}"
+
+
+def _sync_trip(conn, bus_id, schedule_id, prices):
+    """Bring one trip's unsold seats in line with `prices`; returns (created, repriced, removed)."""
+    existing = {}
+    for seat_number, base_price, status in conn.execute(
+        "SELECT seat_number, COALESCE(base_price, price), status FROM tickets WHERE bus_id = ? AND schedule_id IS ?",
+        (bus_id, schedule_id),
+    ):
+        # Keep the first row per seat; a sold duplicate makes the seat sold
+        if seat_number not in existing or status == "sold":
+            existing[seat_number] = (base_price, status)
+
+    missing = [(bus_id, seat, seat_id(bus_id, seat, schedule_id), price, price, schedule_id)
+               for seat, price in prices.items() if seat not in existing]
+    repriced = [(price, existing[seat][0], price, bus_id, schedule_id, seat)
+                for seat, price in prices.items()
+                if seat in existing and existing[seat][1] == "unsold" and existing[seat][0] != price]
+
+    cur = conn.cursor()
+    cur.executemany(
+        """
+        INSERT INTO tickets (bus_id, seat_number, seat_id, price, base_price, schedule_id, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'unsold')
+        ON CONFLICT(seat_id) DO UPDATE SET price = excluded.price, base_price = excluded.base_price
+            WHERE tickets.status = 'unsold' AND COALESCE(tickets.base_price, tickets.price) IS NOT excluded.base_price
+        """,
+        missing,
+    )
+    # New tier fare, same dynamic factor (price / old fare) as before
+    cur.executemany(
+        """
+        UPDATE tickets SET price = ROUND(? * price / ?, 2), base_price = ?
+        WHERE bus_id = ? AND schedule_id IS ? AND seat_number = ? AND status = 'unsold'
+        """,
+        repriced,
+    )
+    # Seats beyond a reduced capacity, if nobody bought them
+    cur.execute(
+        "DELETE FROM tickets WHERE bus_id = ? AND schedule_id IS ? AND seat_number > ? AND status = 'unsold'",
+        (bus_id, schedule_id, len(prices)),
+    )
+    return len(missing), len(repriced), cur.rowcount
+
+def sync_trip(conn, bus_id, schedule_id, layout=DEFAULT_LAYOUT, tiers=()):
+    """Create or resync one trip's inventory inside the caller's transaction.
+
+    Returns (created, repriced, removed); raises LookupError for an unknown bus.
+    """
+    bus = conn.execute("SELECT capacity, ticket_price FROM buses WHERE bus_id = ?", (bus_id,)).fetchone()
+    if bus is None:
+        raise LookupError(f"Bus {bus_id} not found.")
+    return _sync_trip(conn, bus_id, schedule_id, seat_prices(bus[0], bus[1], layout, tiers))
+
+def generate_seats(bus_id, start_date=None, end_date=None, layout=DEFAULT_LAYOUT, tiers=()):
+    """Create or resync the seat inventory of a bus.
+
+    Without dates the bus-wide inventory is synced. With dates, every
+    schedule of the bus departing between start_date and end_date
+    (inclusive, YYYY-MM-DD) gets its own inventory. Raises LookupError for
+    an unknown bus.
+    """
+    if isinstance(tiers, str):
+        tiers = parse_tiers(tiers)
+    created = repriced = removed = 0
+    with get_transaction() as conn:
+        bus = conn.execute("SELECT capacity, ticket_price FROM buses WHERE bus_id = ?", (bus_id,)).fetchone()
+        if bus is None:
+            raise LookupError(f"Bus {bus_id} not found.")
+        prices = seat_prices(bus[0], bus[1], layout, tiers)
+
+        if start_date is None and end_date is None:
+            trips = [None]
+        else:
+            trips = [row[0] for row in conn.execute(
+                """
+                SELECT schedule_id FROM schedules
+                WHERE bus_id = ? AND departure_date BETWEEN ? AND ?
+                ORDER BY departure_date, departure_time
+                """,
+                (bus_id, start_date or "0000-00-00", end_date or "9999-12-31"),
+            )]
+        for schedule_id in trips:
+            c, r, d = _sync_trip(conn, bus_id, schedule_id, prices)
+            created, repriced, removed = created + c, repriced + r, removed + d
+    return SeatGenResult(len(trips), created, repriced, removed)
@@ -0,0 +1,420 @@
+"""Bitmap seat inventory per bus and trip.
+
+Each (bus_id, schedule_id) has three bitmaps -- stock, sold and held -- where
+bit n-1 stands for seat n. They are persisted as BLOBs in `seat_maps` and
+mirrored in memory as Python ints, so availability checks and "find N
+adjacent free seats" are a handful of integer operations instead of a scan
+over `tickets`.
+
+Holds belong to a holder (the user the seats are kept for) and lapse after
+HOLD_SECONDS. They live in `seat_holds`, one row per seat with its expiry;
+the held bitmap is derived from the holds that have not expired yet, so an
+abandoned hold frees its seats without any clean-up job.
+
+Every sale goes through sell(): booking.book_seat sells a free seat (or one
+the buyer holds) and confirm() sells seats the holder is keeping. Writes
+(hold/sell/confirm/release) run in one BEGIN IMMEDIATE transaction that
+re-reads the persisted row, so they stay correct across threads and
+processes. Ticket edits made outside this module (admin status changes,
+seat generation) mark the row stale through triggers and it is rebuilt
+from `tickets` on next use.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from connection_pool import get_pool
+from database import get_read_connection, get_transaction
+from timetable import TS_FORMAT
+
+HOLD_SECONDS = 10 * 60
+
+# Why seats are unavailable
+MISSING = "missing"
+SOLD = "sold"
+HELD = "held"
+NOT_HELD = "not_held"
+
+_MESSAGES = {
+    MISSING: "No such seat",
+    SOLD: "Seat already sold",
+    HELD: "Seat is being held for another customer",
+    NOT_HELD: "Seat is not held for you",
+}
+
+
+class SeatUnavailable(Exception):
+    """Raised when requested seats are not free (or not held, on confirm).
+
+    `reason` is one of MISSING, SOLD, HELD and NOT_HELD, or None when no
+    block of adjacent seats was free.
+    """
+
+    def __init__(self, seats, reason=None):
+        label = _MESSAGES.get(reason, "Seats not available")
+        super().__init__(f"{label}: {', '.join(map(str, seats))}" if seats else f"{label}.")
+        self.seats = seats
+        self.reason = reason
+
+
+def _to_blob(bits, capacity):
+    return bits.to_bytes((capacity + 7) // 8 or 1, "little")
+
+def _from_blob(blob):
+    return int.from_bytes(blob, "little")
+
+def _mask(seats):
+    mask = 0
+    for seat in seats:
+        if seat < 1:
+            raise SeatUnavailable([seat], MISSING)
+        mask |= 1 << (seat - 1)
+    return mask
+
+def _seats(mask):
+    seats = []
+    while mask:
+        low = mask & -mask
+        seats.append(low.bit_length())
+        mask ^= low
+    return seats
+
+def _schedule_key(schedule_id):
+    return schedule_id or 0
+
+def _now():
+    return datetime.now().strftime(TS_FORMAT)
+
+
+class SeatMap:
+    """In-memory occupancy of one bus on one trip."""
+
+    def __init__(self, bus_id, schedule_id, capacity, stock=0, sold=0, holds=None, version=0):
+        self.bus_id = bus_id
+        self.schedule_id = schedule_id
+        self.capacity = capacity
+        self.stock = stock
+        self.sold = sold
+        self.holds = holds or {}  # seat -> (holder, expires_at)
+        self.version = version
+        self.checked_at = None  # pool data_version when last verified
+
+    def held_by_others(self, holder):
+        """Seats held, and not yet expired, for anyone but `holder`."""
+        now = _now()
+        return _mask(seat for seat, (owner, expires_at) in self.holds.items()
+                     if expires_at > now and owner != holder)
+
+    def held_by(self, holder):
+        now = _now()
+        return _mask(seat for seat, (owner, expires_at) in self.holds.items()
+                     if expires_at > now and owner == holder)
+
+    @property
+    def held(self):
+        """Seats with a hold that has not expired."""
+        now = _now()
+        return _mask(seat for seat, (_, expires_at) in self.holds.items() if expires_at > now)
+
+    @property
+    def free(self):
+        return self.stock & ~self.sold & ~self.held
+
+    def is_free(self, seat):
+        return 1 <= seat <= self.capacity and bool(self.free >> (seat - 1) & 1)
+
+    def free_seats(self):
+        return _seats(self.free)
+
+    def held_seats(self):
+        return _seats(self.held)
+
+    def find_adjacent(self, count, row_width=None):
+        """Return the first seat of the lowest run of `count` free seats, or None.
+
+        With `row_width`, runs may not wrap from one seat row into the next.
+        """
+        if count < 1 or count > self.capacity:
+            return None
+        free = self.free
+        runs = free
+        for shift in range(1, count):
+            runs &= free >> shift
+        if row_width:
+            starts = 0
+            for first in range(0, self.capacity, row_width):
+                for offset in range(0, row_width - count + 1):
+                    starts |= 1 << (first + offset)
+            runs &= starts
+        if not runs:
+            return None
+        return (runs & -runs).bit_length()
+
+    def counts(self):
+        """Return (stocked, sold, held, free) seat counts."""
+        return (bin(self.stock).count("1"), bin(self.sold).count("1"),
+                bin(self.held).count("1"), bin(self.free).count("1"))
+
+
+class SeatInventory:
+    """Loads, mirrors and atomically updates seat maps."""
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    # Loading
+
+    def _build(self, conn, bus_id, schedule_id):
+        """Rebuild a seat map from the tickets table."""
+        capacity_row = conn.execute(
+            "SELECT capacity FROM buses WHERE bus_id = ?", (bus_id,)
+        ).fetchone()
+        capacity = capacity_row[0] if capacity_row else 0
+        stock = sold = 0
+        for seat_number, status in conn.execute(
+            "SELECT seat_number, status FROM tickets WHERE bus_id = ? AND schedule_id IS ?",
+            (bus_id, schedule_id or None),
+        ):
+            if seat_number < 1:
+                continue
+            capacity = max(capacity, seat_number)
+            bit = 1 << (seat_number - 1)
+            stock |= bit
+            if status == "sold":
+                sold |= bit
+        return SeatMap(bus_id, _schedule_key(schedule_id), capacity, stock, sold)
+
+    def _holds(self, conn, bus_id, key):
+        return {seat: (holder, expires_at) for seat, holder, expires_at in conn.execute(
+            "SELECT seat_number, holder, expires_at FROM seat_holds "
+            "WHERE bus_id = ? AND schedule_id = ? AND expires_at > ?",
+            (bus_id, key, _now()),
+        )}
+
+    def _load(self, conn, bus_id, schedule_id):
+        """Read the persisted seat map, rebuilding it if missing or stale."""
+        key = _schedule_key(schedule_id)
+        row = conn.execute(
+            """
+            SELECT capacity, stock, sold, held, version, stale FROM seat_maps
+            WHERE bus_id = ? AND schedule_id = ?
+            """,
+            (bus_id, key),
+        ).fetchone()
+        if row and not row[5]:
+            capacity, stock, sold, _, version, _ = row
+            return SeatMap(bus_id, key, capacity, _from_blob(stock), _from_blob(sold),
+                           self._holds(conn, bus_id, key), version)
+
+        seat_map = self._build(conn, bus_id, schedule_id)
+        seat_map.holds = self._holds(conn, bus_id, key)
+        if row:
+            seat_map.version = row[4]
+        return seat_map
+
+    def _save(self, conn, seat_map):
+        seat_map.version += 1
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO seat_maps
+                (bus_id, schedule_id, capacity, stock, sold, held, version, stale)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            """,
+            (seat_map.bus_id, seat_map.schedule_id, seat_map.capacity,
+             _to_blob(seat_map.stock, seat_map.capacity),
+             _to_blob(seat_map.sold, seat_map.capacity),
+             _to_blob(seat_map.held, seat_map.capacity),
+             seat_map.version),
+        )
+
+    def _remember(self, seat_map, checked_at):
+        seat_map.checked_at = checked_at
+        with self._lock:
+            self._maps[(seat_map.bus_id, seat_map.schedule_id)] = seat_map
+
+    def get(self, bus_id, schedule_id=None):
+        """Return the seat map, served from memory when nothing has changed.
+
+        When another connection has committed since the mirror was last
+        verified, the persisted version is compared (a primary-key lookup)
+        and the map reloaded only if it moved.
+        """
+        key = (bus_id, _schedule_key(schedule_id))
+        current = get_pool().data_version()
+        with self._lock:
+            seat_map = self._maps.get(key)
+        if seat_map is not None and seat_map.checked_at == current:
+            return seat_map
+
+        with get_read_connection() as conn:
+            if seat_map is not None:
+                row = conn.execute(
+                    "SELECT version, stale FROM seat_maps WHERE bus_id = ? AND schedule_id = ?", key
+                ).fetchone()
+                if row and row[0] == seat_map.version and not row[1]:
+                    seat_map.checked_at = current
+                    return seat_map
+            seat_map = self._load(conn, bus_id, schedule_id)
+        self._remember(seat_map, current)
+        return seat_map
+
+    def invalidate(self, bus_id=None, schedule_id=None):
+        """Drop mirrored maps (all of them when bus_id is None)."""
+        with self._lock:
+            if bus_id is None:
+                self._maps.clear()
+            else:
+                self._maps.pop((bus_id, _schedule_key(schedule_id)), None)
+
+    # Queries
+
+    def is_available(self, bus_id, seat_number, schedule_id=None):
+        return self.get(bus_id, schedule_id).is_free(seat_number)
+
+    def free_seats(self, bus_id, schedule_id=None):
+        return self.get(bus_id, schedule_id).free_seats()
+
+    def find_adjacent(self, bus_id, count, schedule_id=None, row_width=None):
+        """Return the seat numbers of the first block of `count` adjacent free seats."""
+        first = self.get(bus_id, schedule_id).find_adjacent(count, row_width)
+        return None if first is None else list(range(first, first + count))
+
+    # Atomic updates
+
+    def _update(self, bus_id, schedule_id, change):
+        """Apply `change(conn, seat_map)` to a freshly loaded map in one transaction."""
+        with get_transaction() as conn:
+            conn.execute("DELETE FROM seat_holds WHERE bus_id = ? AND schedule_id = ? AND expires_at <= ?",
+                         (bus_id, _schedule_key(schedule_id), _now()))
+            seat_map = self._load(conn, bus_id, schedule_id)
+            result = change(conn, seat_map)
+            self._save(conn, seat_map)
+        self._remember(seat_map, None)
+        return result
+
+    @staticmethod
+    def _check(seat_map, mask, holder):
+        """Raise SeatUnavailable unless every seat in `mask` can go to `holder`."""
+        for reason, blocked in (
+            (MISSING, mask & ~seat_map.stock),
+            (SOLD, mask & seat_map.sold),
+            (HELD, mask & seat_map.held_by_others(holder)),
+        ):
+            if blocked:
+                raise SeatUnavailable(_seats(blocked), reason)
+
+    def _hold(self, conn, seat_map, seats, holder, seconds):
+        expires_at = (datetime.now() + timedelta(seconds=seconds)).strftime(TS_FORMAT)
+        conn.executemany(
+            "INSERT OR REPLACE INTO seat_holds (bus_id, schedule_id, seat_number, holder, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            ((seat_map.bus_id, seat_map.schedule_id, seat, holder, expires_at) for seat in seats),
+        )
+        for seat in seats:
+            seat_map.holds[seat] = (holder, expires_at)
+
+    def hold(self, bus_id, seats, holder, schedule_id=None, seconds=HOLD_SECONDS):
+        """Hold all of `seats` for `holder` for `seconds`, or none of them; raises SeatUnavailable.
+
+        Holding seats the holder already holds extends their hold.
+        """
+        mask = _mask(seats)
+
+        def change(conn, seat_map):
+            self._check(seat_map, mask, holder)
+            self._hold(conn, seat_map, seats, holder, seconds)
+
+        self._update(bus_id, schedule_id, change)
+        return sorted(seats)
+
+    def hold_adjacent(self, bus_id, count, holder, schedule_id=None, row_width=None, seconds=HOLD_SECONDS):
+        """Find and hold `count` adjacent free seats in one transaction."""
+        def change(conn, seat_map):
+            first = seat_map.find_adjacent(count, row_width)
+            if first is None:
+                raise SeatUnavailable([])
+            seats = list(range(first, first + count))
+            self._hold(conn, seat_map, seats, holder, seconds)
+            return seats
+
+        return self._update(bus_id, schedule_id, change)
+
+    def sell(self, bus_id, seats, user_id, schedule_id=None, held_only=False):
+        """Sell `seats` to `user_id` and record one payment; returns their ticket ids by seat.
+
+        Seats must be free or held for the buyer (only held for the buyer
+        with held_only=True); the buyer's holds on them are cleared.
+        """
+        mask = _mask(seats)
+
+        def change(conn, seat_map):
+            self._check(seat_map, mask, user_id)
+            if held_only and mask & ~seat_map.held_by(user_id):
+                raise SeatUnavailable(_seats(mask & ~seat_map.held_by(user_id)), NOT_HELD)
+            wanted = json.dumps(sorted(set(seats)))
+            tickets = conn.execute(
+                """
+                SELECT seat_number, ticket_id, price FROM tickets
+                WHERE bus_id = ? AND schedule_id IS ? AND status = 'unsold'
+                  AND seat_number IN (SELECT value FROM json_each(?))
+                ORDER BY seat_number
+                """,
+                (bus_id, schedule_id or None, wanted),
+            ).fetchall()
+            ticket_ids = [ticket_id for _, ticket_id, _ in tickets]
+            sold = conn.execute(
+                "UPDATE tickets SET status = 'sold', user_id = ? "
+                "WHERE ticket_id IN (SELECT value FROM json_each(?)) AND status = 'unsold'",
+                (user_id, json.dumps(ticket_ids)),
+            ).rowcount
+            if len(tickets) != len(set(seats)) or sold != len(tickets):
+                # tickets disagreed with the map; the rollback leaves both untouched
+                raise SeatUnavailable(sorted(seats), SOLD)
+            conn.execute(
+                "INSERT INTO transactions (user_id, bus_id, total_amount) VALUES (?, ?, ?)",
+                (user_id, bus_id, sum(price for _, _, price in tickets)),
+            )
+            conn.execute(
+                "DELETE FROM seat_holds WHERE bus_id = ? AND schedule_id = ? "
+                "AND seat_number IN (SELECT value FROM json_each(?))",
+                (bus_id, seat_map.schedule_id, wanted),
+            )
+            for seat in seats:
+                seat_map.holds.pop(seat, None)
+            seat_map.sold |= mask
+            return ticket_ids
+
+        return self._update(bus_id, schedule_id, change)
+
+    def confirm(self, bus_id, seats, holder, schedule_id=None):
+        """Sell seats held for `holder` to them; returns their ticket ids."""
+        return self.sell(bus_id, seats, holder, schedule_id, held_only=True)
+
+    def release(self, bus_id, seats, holder, schedule_id=None):
+        """Drop `holder`'s holds on `seats` (seats held by others are left alone)."""
+        def change(conn, seat_map):
+            conn.executemany(
+                "DELETE FROM seat_holds WHERE bus_id = ? AND schedule_id = ? AND seat_number = ? AND holder = ?",
+                ((bus_id, seat_map.schedule_id, seat, holder) for seat in seats),
+            )
+            for seat in seats:
+                if seat_map.holds.get(seat, (None,))[0] == holder:
+                    del seat_map.holds[seat]
+
+        self._update(bus_id, schedule_id, change)
+
+    def rebuild(self, bus_id, schedule_id=None):
+        """Recompute a seat map from tickets, keeping current holds."""
+        with get_transaction() as conn:
+            conn.execute(
+                "UPDATE seat_maps SET stale = 1 WHERE bus_id = ? AND schedule_id = ?",
+                (bus_id, _schedule_key(schedule_id)),
+            )
+            seat_map = self._load(conn, bus_id, schedule_id)
+            self._save(conn, seat_map)
+        self._remember(seat_map, None)
+        return seat_map
+
+
+inventory = SeatInventory()
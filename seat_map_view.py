@@ -0,0 +1,220 @@
+import tkinter as tk
+from tkinter import messagebox
+
+import seat_generator
+from live_list import AUTO_REFRESH_MS
+
+COLOURS = {"unsold": "palegreen", "held": "gold", "sold": "tomato", None: "lightgrey"}  # None: no ticket
+SELECTED_OUTLINE = "blue"
+
+
+class SeatMapView(tk.Frame):
+    """One bus's seats on one trip, drawn on a single Canvas.
+
+    Each seat is a rectangle item (with its number as a text item) placed
+    row by row according to a seat_generator layout, so an 80-seat coach is
+    160 canvas items and no widgets. Click selects a seat, Ctrl-click
+    toggles one, and dragging draws a rubber band that selects every seat it
+    touches (Shift or Ctrl adds to the selection). <<SeatSelect>> is
+    generated whenever the selection changes.
+
+    `fetch(bus_id, schedule_id, data_version)` runs on the DBExecutor and
+    returns (data_version, capacity, rows, held), all but data_version None
+    when nothing changed since `data_version`. Rows are (ticket_id,
+    bus_name, seat_number, price, status); held lists seats on hold. The view polls every `interval_ms`, and
+    only seats whose ticket changed are recoloured, so it keeps up with
+    rapid bookings.
+    """
+
+    def __init__(self, parent, db, fetch, key, layout=seat_generator.DEFAULT_LAYOUT,
+                 seat_size=30, gap=6, interval_ms=AUTO_REFRESH_MS, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.db = db
+        self.fetch = fetch
+        self.key = key
+        self.layout = layout
+        self.seat_size = seat_size
+        self.gap = gap
+        self.interval_ms = interval_ms
+
+        self.bus_id = None
+        self.schedule_id = None
+        self.capacity = 0
+        self.rows = {}          # seat number -> ticket row
+        self.held = set()       # seat numbers on hold
+        self.selected = set()   # seat numbers
+        self._items = {}        # seat number -> rectangle item
+        self._seat_of = {}      # rectangle or text item -> seat number
+        self._data_version = None
+        self._timer = None
+        self._press = None
+        self._band = None
+
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_release)
+        self.canvas.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(-1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.canvas.yview_scroll(1, "units"))
+        self.bind("<Destroy>", self._on_destroy, add="+")
+
+    def show(self, bus_id, schedule_id=None, layout=None):
+        """Switch to a bus (and trip) and load its seats."""
+        self.bus_id, self.schedule_id = bus_id, schedule_id
+        self.layout = layout or self.layout
+        self.capacity = 0  # redraw everything once the seats arrive
+        self.rows = {}
+        self.held = set()
+        if self.selected:
+            self.selected = set()
+            self.event_generate("<<SeatSelect>>")
+        self._data_version = None
+        self.refresh()
+
+    def refresh(self, quiet=False):
+        """Fetch the seats if anything changed and recolour the ones that did."""
+        if self._timer is not None:
+            self.after_cancel(self._timer)
+            self._timer = None
+        if self.bus_id is None:
+            return
+        self.db.submit(self.fetch, self.bus_id, self.schedule_id, self._data_version,
+                       on_done=self._apply, on_error=self._retry, key=self.key, widget=self, quiet=quiet)
+
+    def selected_rows(self):
+        """Ticket rows of the selected seats, by seat number; seats without a ticket are left out."""
+        return [self.rows[seat] for seat in sorted(self.selected) if seat in self.rows]
+
+    # Drawing
+
+    def _position(self, seat):
+        """Top-left corner of seat n; seats go row by row, with an aisle after the left block."""
+        left, right = seat_generator.LAYOUTS[self.layout]
+        row, column = divmod(seat - 1, left + right)
+        step = self.seat_size + self.gap
+        aisle = step if column >= left else 0
+        return self.gap + column * step + aisle, self.gap + row * step
+
+    def _draw(self, capacity):
+        self.canvas.delete("all")
+        self._items.clear()
+        self._seat_of.clear()
+        self._band = None
+        for seat in range(1, capacity + 1):
+            x, y = self._position(seat)
+            item = self.canvas.create_rectangle(x, y, x + self.seat_size, y + self.seat_size, tags=("seat",))
+            label = self.canvas.create_text(x + self.seat_size / 2, y + self.seat_size / 2,
+                                            text=str(seat), font=("Arial", 9), tags=("seat",))
+            self._items[seat] = item
+            self._seat_of[item] = self._seat_of[label] = seat
+            self._colour(seat)
+        self.capacity = capacity
+        self.canvas.configure(scrollregion=self.canvas.bbox("all") or (0, 0, 0, 0))
+
+    def _colour(self, seat):
+        row = self.rows.get(seat)
+        status = row[4] if row else None
+        if status == "unsold" and seat in self.held:
+            status = "held"
+        selected = seat in self.selected
+        self.canvas.itemconfigure(
+            self._items[seat], fill=COLOURS.get(status, COLOURS[None]),
+            outline=SELECTED_OUTLINE if selected else "grey40", width=3 if selected else 1,
+        )
+
+    # Data
+
+    def _apply(self, result):
+        data_version, capacity, rows, held = result
+        self._data_version = data_version
+        if rows is not None:
+            shown = {row[2]: row for row in rows if 1 <= row[2] <= capacity}
+            held = {seat for seat in held if 1 <= seat <= capacity}
+            if capacity != self.capacity:
+                self.rows, self.held = shown, held
+                self.selected &= set(range(1, capacity + 1))
+                self._draw(capacity)
+            else:
+                changed = {seat for seat in shown.keys() | self.rows.keys()
+                           if shown.get(seat) != self.rows.get(seat)} | (held ^ self.held)
+                self.rows, self.held = shown, held
+                for seat in changed:
+                    self._colour(seat)
+        self._schedule()
+
+    def _retry(self, error):
+        if self._data_version is None:
+            messagebox.showerror("Error", str(error))
+            return
+        self._schedule()  # e.g. database busy: try again on the next tick
+
+    def _schedule(self):
+        if self.interval_ms and self.winfo_exists():
+            self._timer = self.after(self.interval_ms, lambda: self.refresh(quiet=True))
+
+    # Selection
+
+    def _select(self, seats, add=False, toggle=False):
+        before = set(self.selected)
+        if toggle:
+            self.selected ^= seats
+        elif add:
+            self.selected |= seats
+        else:
+            self.selected = set(seats)
+        flipped = before ^ self.selected
+        for seat in flipped:
+            self._colour(seat)
+        if flipped:
+            self.event_generate("<<SeatSelect>>")
+
+    def _seat_at(self, x, y):
+        for item in reversed(self.canvas.find_overlapping(x, y, x, y)):
+            if item in self._seat_of:
+                return self._seat_of[item]
+        return None
+
+    def _on_press(self, event):
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        self._press = (x, y, event.state)
+        self._band = self.canvas.create_rectangle(x, y, x, y, outline=SELECTED_OUTLINE, dash=(3, 2))
+
+    def _on_drag(self, event):
+        if self._band is not None:
+            x0, y0, _ = self._press
+            self.canvas.coords(self._band, x0, y0, self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+
+    def _on_release(self, event):
+        if self._press is None:
+            return
+        x0, y0, state = self._press
+        x1, y1 = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        if self._band is not None:
+            self.canvas.delete(self._band)
+        self._press = self._band = None
+        shift, control = bool(state & 0x0001), bool(state & 0x0004)
+
+        if abs(x1 - x0) < 3 and abs(y1 - y0) < 3:
+            seat = self._seat_at(x1, y1)
+            if seat is None:
+                if not (shift or control):
+                    self._select(set())
+            else:
+                self._select({seat}, add=shift, toggle=control)
+            return
+        touched = {self._seat_of[item] for item in self.canvas.find_overlapping(
+            min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)) if item in self._seat_of}
+        self._select(touched, add=shift or control)
+
+    def _on_destroy(self, event):
+        if event.widget is self and self._timer is not None:
+            self.after_cancel(self._timer)
+            self._timer = None
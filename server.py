@@ -0,0 +1,503 @@
+"""Local HTTP/JSON server in front of the service layer.
+
+Counter terminals and kiosks talk to this process instead of opening the
+database file themselves. Requests are handled on a bounded worker pool and
+all of them share the process-wide connection pool. A worker serves one
+keep-alive connection at a time, so connections idle for IDLE_TIMEOUT
+seconds are closed to free it for the next client.
+
+Usage: python server.py [--host 127.0.0.1] [--port 8080] [--workers 16]
+
+Every route except /health, /login and /signup needs the session token
+returned by /login, sent as "Authorization: Bearer <token>". Routes that
+change buses, routes, drivers, tickets, timetables, shifts or prices, the
+driver, shift and ticket listings and both reports need an admin session. Bookings and prebookings are made
+for the logged-in passenger; only admins (counter staff) may pass another
+"user_id".
+
+Routes (JSON bodies in and out):
+    GET    /health
+    POST   /login                 {"email", "password"} -> user with "token"
+    POST   /logout
+    POST   /signup                {"name", "email", "phone", "password"}
+    GET    /buses?q=&limit=       POST /buses {bus fields}
+    GET    /buses/<id>            PUT /buses/<id>, DELETE /buses/<id>
+    GET    /buses/search?origin=&destination=
+    GET    /reports/details?after=<bus_id>&limit=
+    GET    /reports/sales?from=&to=
+    GET    /routes                POST /routes {"route_name", "stops"}
+    PUT    /routes/<id>           DELETE /routes/<id>
+    GET    /drivers               POST /drivers {"name", "license_number", "phone", "address"}
+    GET    /drivers/<id>          PUT /drivers/<id>, DELETE /drivers/<id>
+    GET    /tickets               POST /tickets {"bus_id", "seat_number", "price"}
+    PUT    /tickets/<id>          {"status", "expected_status"}
+    DELETE /tickets/<id>
+    POST   /buses/<id>/seats      {"start_date", "end_date", "layout", "tiers"}
+    POST   /tickets/book          {"bus_id", "seat_number", "user_id", "schedule_id"}
+    POST   /holds                 {"bus_id", "schedule_id", "seats" or "count", "user_id"}
+    POST   /holds/confirm         {"bus_id", "schedule_id", "seats", "user_id"}
+    POST   /holds/release         {"bus_id", "schedule_id", "seats", "user_id"}
+    GET    /schedules?bus_name=&route_name=
+    POST   /prebookings           {"user_id", "bus_id", "schedule_id"}
+    GET    /routes/<id>/departures?after=&days=&limit=
+    GET    /board?stop=&from=&hours=&limit=
+    GET    /trips?from=&to=&bus_id=&route_id=&limit=
+    GET    /patterns?bus_id=&route_id=
+    POST   /patterns              {"bus_id", "departure_time", "arrival_time", "weekdays",
+                                   "interval_weeks", "valid_from", "valid_until"}
+    DELETE /patterns/<id>
+    POST   /patterns/<id>/exceptions {"service_date"}
+    POST   /trips/book            {"pattern_id", "service_date", "seat_number", "user_id"}
+    POST   /trips/prebook         {"pattern_id", "service_date", "user_id"}
+    GET    /drivers/<id>/shifts?from=&to=
+    POST   /shifts                {"driver_id", "bus_id", "departure", "role"}
+    DELETE /shifts/<id>
+    POST   /roster/auto           {"from", "to"}
+    POST   /pricing/reprice       {"days", "dry_run"}
+"""
+import argparse
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import archive
+import auth
+import booking
+import pricing
+import ref_cache
+import recurrence
+import reports
+import search
+import services
+import timetable
+from connection_pool import get_pool
+from database import init_db, pool_stats
+from services import NotFound, ServiceError
+
+MAX_BODY = 1024 * 1024
+IDLE_TIMEOUT = 5  # seconds a keep-alive connection may wait for its next request
+
+# HTTP status for each booking outcome
+BOOKING_STATUS = {
+    booking.BOOKED: 201,
+    booking.UPDATED: 200,
+    booking.CONFLICT: 409,
+    booking.NOT_FOUND: 404,
+    booking.BUSY: 503,
+}
+
+
+def _rows(rows, columns):
+    return [dict(zip(columns, row)) for row in rows]
+
+def _booking(result):
+    return BOOKING_STATUS[result.status], result._asdict()
+
+def _user_id(body, user):
+    """Who a booking is for: the session's user, or anyone an admin names."""
+    if user["role"] == "admin" and body.get("user_id") is not None:
+        return body["user_id"]
+    return user["user_id"]
+
+
+# Handlers take (params, body, *path_ids) and return (status, payload)
+
+def health(params, body):
+    report = pool_stats()
+    report["ref_cache"] = ref_cache.cache.stats()
+    return (200 if report["ok"] else 503), report
+
+def login(params, body):
+    user = services.login(body.get("email"), body.get("password"))
+    if user is None:
+        return 401, {"error": "Invalid email or password."}
+    return 200, user
+
+def logout(params, body, token=None):
+    services.logout(token)
+    return 200, {}
+
+def signup(params, body):
+    user_id = services.signup(body.get("name"), body.get("email"), body.get("phone"), body.get("password"))
+    return 201, {"user_id": user_id}
+
+def list_buses(params, body):
+    columns = ("bus_id", "name", "number", "ticket_price", "capacity", "route_name", "stops")
+    if params.get("q"):
+        # Full-text search, best matches first
+        limit = min(int(params.get("limit") or search.SEARCH_LIMIT), 500)
+        buses = _rows(services.search_buses(params["q"], limit), columns)
+    else:
+        buses = _rows(services.list_buses(), columns)
+    seats_left = services.seats_left()
+    for bus in buses:
+        bus["seats_left"] = seats_left.get(bus["bus_id"], 0)
+    return 200, buses
+
+def add_bus(params, body):
+    return 201, {"bus_id": services.add_bus(body)}
+
+def get_bus(params, body, bus_id):
+    return 200, services.get_bus(bus_id)
+
+def update_bus(params, body, bus_id):
+    services.update_bus(bus_id, body)
+    return 200, {"bus_id": bus_id}
+
+def delete_bus(params, body, bus_id):
+    services.delete_bus(bus_id)
+    return 200, {"bus_id": bus_id}
+
+def search_buses(params, body):
+    columns = ("bus_id", "name", "number", "route_name")
+    return 200, _rows(services.find_buses(params.get("origin"), params.get("destination")), columns)
+
+def details_report(params, body):
+    after = int(params.get("after") or 0)
+    limit = min(int(params.get("limit") or reports.DETAILS_PAGE_SIZE), 1000)
+    rows = services.details_page(after, limit)
+    return 200, {
+        "rows": [dict(zip(reports.DETAILS_HEADERS, row)) for row in rows],
+        "next": rows[-1][0] if len(rows) == limit else None,
+    }
+
+def sales_report(params, body):
+    rows = services.sales_report(params.get("from"), params.get("to"))
+    return 200, [dict(zip(reports.SALES_HEADERS, row)) for row in rows]
+
+def list_routes(params, body):
+    return 200, _rows(services.list_routes(), ("route_id", "route_name", "stops"))
+
+def add_route(params, body):
+    return 201, {"route_id": services.add_route(body.get("route_name"), body.get("stops"))}
+
+def update_route(params, body, route_id):
+    services.update_route(route_id, body.get("route_name"), body.get("stops"))
+    return 200, {"route_id": route_id}
+
+def delete_route(params, body, route_id):
+    services.delete_route(route_id)
+    return 200, {"route_id": route_id}
+
+def list_drivers(params, body):
+    return 200, _rows(services.list_drivers(), ("driver_id", "name", "license_number"))
+
+def get_driver(params, body, driver_id):
+    columns = ("driver_id", "name", "license_number", "phone", "address")
+    return 200, dict(zip(columns, services.get_driver(driver_id)))
+
+def add_driver(params, body):
+    driver_id = services.add_driver(body.get("name"), body.get("license_number"),
+                                    body.get("phone"), body.get("address"))
+    return 201, {"driver_id": driver_id}
+
+def update_driver(params, body, driver_id):
+    services.update_driver(driver_id, body.get("name"), body.get("license_number"),
+                           body.get("phone"), body.get("address"))
+    return 200, {"driver_id": driver_id}
+
+def delete_driver(params, body, driver_id):
+    services.delete_driver(driver_id)
+    return 200, {"driver_id": driver_id}
+
+def list_tickets(params, body):
+    columns = ("ticket_id", "bus_name", "seat_number", "price", "status")
+    return 200, _rows(services.list_tickets(), columns)
+
+def add_ticket(params, body):
+    ticket_id = services.add_ticket(body.get("bus_id"), body.get("seat_number"), body.get("price"))
+    return 201, {"ticket_id": ticket_id}
+
+def update_ticket(params, body, ticket_id):
+    return _booking(services.set_ticket_status(ticket_id, body.get("status"), body.get("expected_status")))
+
+def delete_ticket(params, body, ticket_id):
+    services.delete_ticket(ticket_id)
+    return 200, {"ticket_id": ticket_id}
+
+def generate_seats(params, body, bus_id):
+    result = services.generate_seats(bus_id, body.get("start_date"), body.get("end_date"),
+                                     body.get("layout"), body.get("tiers"))
+    return 200, result._asdict()
+
+def book_seat(params, body, user):
+    return _booking(services.book_seat(body.get("bus_id"), body.get("seat_number"),
+                                       _user_id(body, user), body.get("schedule_id")))
+
+def hold_seats(params, body, user):
+    seats = services.hold_seats(body.get("bus_id"), _user_id(body, user), body.get("seats"), body.get("count"),
+                                body.get("schedule_id"))
+    return 201, {"seats": seats}
+
+def confirm_seats(params, body, user):
+    ticket_ids = services.confirm_seats(body.get("bus_id"), _user_id(body, user), body.get("seats"),
+                                        body.get("schedule_id"))
+    return 201, {"ticket_ids": ticket_ids}
+
+def release_seats(params, body, user):
+    services.release_seats(body.get("bus_id"), _user_id(body, user), body.get("seats"), body.get("schedule_id"))
+    return 200, {"seats": body.get("seats")}
+
+def find_schedules(params, body):
+    columns = ("bus_id", "schedule_id", "departure_date", "departure_time", "pattern_id", "service_date")
+    return 200, _rows(services.find_schedules(params.get("bus_name"), params.get("route_name")), columns)
+
+DEPARTURE_COLUMNS = ("schedule_id", "bus_id", "bus_name", "route_name", "departure", "arrival",
+                     "pattern_id", "service_date")
+
+def next_departures(params, body, route_id):
+    rows = services.next_departures(route_id, params.get("after"), params.get("days") or timetable.WINDOW_DAYS,
+                                    params.get("limit") or timetable.DEPARTURES_LIMIT)
+    return 200, _rows(rows, DEPARTURE_COLUMNS)
+
+def stop_board(params, body):
+    rows = services.stop_board(params.get("stop"), params.get("from"), params.get("hours") or timetable.BOARD_HOURS,
+                               params.get("limit") or timetable.DEPARTURES_LIMIT)
+    return 200, _rows(rows, DEPARTURE_COLUMNS + ("stop_seq",))
+
+def prebook(params, body, user):
+    return _booking(services.prebook(_user_id(body, user), body.get("bus_id"), body.get("schedule_id")))
+
+def trips_between(params, body):
+    trips = services.trips_between(params.get("from"), params.get("to"), params.get("bus_id"),
+                                   params.get("route_id"), params.get("limit"))
+    return 200, [trip._asdict() for trip in trips]
+
+def list_patterns(params, body):
+    patterns = services.list_schedule_patterns(params.get("bus_id"), params.get("route_id"))
+    return 200, [dict(p._asdict(), weekdays=recurrence.format_weekdays(p.weekdays),
+                      valid_from=p.valid_from.isoformat(),
+                      valid_until=p.valid_until and p.valid_until.isoformat()) for p in patterns]
+
+def add_pattern(params, body):
+    pattern_id = services.add_schedule_pattern(
+        body.get("bus_id"), body.get("departure_time"), body.get("arrival_time"), body.get("weekdays"),
+        body.get("interval_weeks"), body.get("valid_from"), body.get("valid_until"))
+    return 201, {"pattern_id": pattern_id}
+
+def delete_pattern(params, body, pattern_id):
+    services.delete_schedule_pattern(pattern_id)
+    return 200, {"pattern_id": pattern_id}
+
+def cancel_trip(params, body, pattern_id):
+    services.cancel_trip(pattern_id, body.get("service_date"))
+    return 201, {"pattern_id": pattern_id, "service_date": body.get("service_date")}
+
+def book_trip_seat(params, body, user):
+    return _booking(services.book_trip_seat(body.get("pattern_id"), body.get("service_date"),
+                                            body.get("seat_number"), _user_id(body, user)))
+
+def prebook_trip(params, body, user):
+    return _booking(services.prebook_trip(_user_id(body, user), body.get("pattern_id"), body.get("service_date")))
+
+def driver_shifts(params, body, driver_id):
+    return 200, [shift._asdict() for shift in services.driver_shifts(driver_id, params.get("from"), params.get("to"))]
+
+def assign_driver(params, body):
+    shift_id = services.assign_driver(body.get("driver_id"), body.get("bus_id"), body.get("departure"),
+                                      body.get("role"))
+    return 201, {"shift_id": shift_id}
+
+def unassign_shift(params, body, shift_id):
+    services.unassign_shift(shift_id)
+    return 200, {"shift_id": shift_id}
+
+def auto_roster(params, body):
+    result = services.auto_roster(body.get("from"), body.get("to"))
+    return 200, dict(result._asdict(), unassigned=[
+        {"bus_id": bus_id, "departure": departure} for bus_id, departure in result.unassigned])
+
+def reprice(params, body):
+    result = services.reprice(body.get("days", pricing.HORIZON_DAYS), bool(body.get("dry_run")))
+    return 200, dict(result._asdict(), changes=[change._asdict() for change in result.changes])
+
+
+ROUTES = [
+    ("GET", r"/health", health),
+    ("POST", r"/login", login),
+    ("POST", r"/logout", logout),
+    ("POST", r"/signup", signup),
+    ("GET", r"/buses", list_buses),
+    ("POST", r"/buses", add_bus),
+    ("GET", r"/buses/search", search_buses),
+    ("GET", r"/buses/(\d+)", get_bus),
+    ("PUT", r"/buses/(\d+)", update_bus),
+    ("DELETE", r"/buses/(\d+)", delete_bus),
+    ("POST", r"/buses/(\d+)/seats", generate_seats),
+    ("GET", r"/reports/details", details_report),
+    ("GET", r"/reports/sales", sales_report),
+    ("GET", r"/routes", list_routes),
+    ("POST", r"/routes", add_route),
+    ("PUT", r"/routes/(\d+)", update_route),
+    ("DELETE", r"/routes/(\d+)", delete_route),
+    ("GET", r"/drivers", list_drivers),
+    ("POST", r"/drivers", add_driver),
+    ("GET", r"/drivers/(\d+)", get_driver),
+    ("PUT", r"/drivers/(\d+)", update_driver),
+    ("DELETE", r"/drivers/(\d+)", delete_driver),
+    ("GET", r"/tickets", list_tickets),
+    ("POST", r"/tickets", add_ticket),
+    ("POST", r"/tickets/book", book_seat),
+    ("POST", r"/holds", hold_seats),
+    ("POST", r"/holds/confirm", confirm_seats),
+    ("POST", r"/holds/release", release_seats),
+    ("PUT", r"/tickets/(\d+)", update_ticket),
+    ("DELETE", r"/tickets/(\d+)", delete_ticket),
+    ("GET", r"/schedules", find_schedules),
+    ("POST", r"/prebookings", prebook),
+    ("GET", r"/routes/(\d+)/departures", next_departures),
+    ("GET", r"/board", stop_board),
+    ("GET", r"/trips", trips_between),
+    ("POST", r"/trips/book", book_trip_seat),
+    ("POST", r"/trips/prebook", prebook_trip),
+    ("GET", r"/patterns", list_patterns),
+    ("POST", r"/patterns", add_pattern),
+    ("DELETE", r"/patterns/(\d+)", delete_pattern),
+    ("POST", r"/patterns/(\d+)/exceptions", cancel_trip),
+    ("GET", r"/drivers/(\d+)/shifts", driver_shifts),
+    ("POST", r"/shifts", assign_driver),
+    ("DELETE", r"/shifts/(\d+)", unassign_shift),
+    ("POST", r"/roster/auto", auto_roster),
+    ("POST", r"/pricing/reprice", reprice),
+]
+ROUTES = [(method, re.compile(pattern + r"/?"), handler) for method, pattern, handler in ROUTES]
+PUBLIC = {health, login, signup}
+ADMIN_ONLY = {
+    add_bus, update_bus, delete_bus, generate_seats, details_report, sales_report,
+    add_route, update_route, delete_route,
+    list_drivers, get_driver, add_driver, update_driver, delete_driver, driver_shifts,
+    list_tickets, add_ticket, update_ticket, delete_ticket,
+    add_pattern, delete_pattern, cancel_trip,
+    assign_driver, unassign_shift, auto_roster, reprice,
+}
+# Handlers called with the session user, for bookings made on someone's behalf
+FOR_USER = {book_seat, prebook, book_trip_seat, prebook_trip, hold_seats, confirm_seats, release_seats}
+
+
+def dispatch(method, path, params, body, token=None):
+    """Run the matching handler and map service errors to HTTP statuses."""
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.fullmatch(path)
+        if not match:
+            continue
+        if route_method != method:
+            allowed = True
+            continue
+        user = None if handler in PUBLIC else auth.current_user(token)
+        if handler not in PUBLIC and user is None:
+            return 401, {"error": "Log in first."}
+        if handler in ADMIN_ONLY and user["role"] != "admin":
+            return 403, {"error": "Only administrators may do that."}
+        ids = [int(group) for group in match.groups()]
+        try:
+            if handler is logout:
+                return handler(params, body, token)
+            if handler in FOR_USER:
+                return handler(params, body, *ids, user)
+            return handler(params, body, *ids)
+        except NotFound as e:
+            return 404, {"error": str(e)}
+        except (ServiceError, ValueError, TypeError) as e:
+            return 400, {"error": str(e)}
+        except sqlite3.OperationalError as e:
+            if booking._is_busy(e):
+                return 503, {"error": "Database is busy, please try again."}
+            raise
+    if allowed:
+        return 405, {"error": f"{method} is not allowed on {path}."}
+    return 404, {"error": f"No route for {path}."}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "BusService/1.0"
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_TIMEOUT
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Where the body ends is unknown, so the connection cannot carry another request
+            self.close_connection = True
+            return self._send(400, {"error": "Content-Length must be a whole number of bytes."})
+        if length > MAX_BODY:
+            # The body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            return self._send(413, {"error": "Request body too large."})
+        body = {}
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                return self._send(400, {"error": "Request body must be JSON."})
+            if not isinstance(body, dict):
+                return self._send(400, {"error": "Request body must be a JSON object."})
+        try:
+            status, payload = dispatch(self.command, url.path, params, body, self._token())
+        except Exception as e:
+            self.log_error("Unhandled error on %s %s: %r", self.command, self.path, e)
+            status, payload = 500, {"error": "Internal server error."}
+        self._send(status, payload)
+
+    def _token(self):
+        header = self.headers.get("Authorization") or ""
+        scheme, _, token = header.partition(" ")
+        return token.strip() if scheme.lower() == "bearer" else None
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """HTTP server that handles connections on a bounded worker pool."""
+
+    def __init__(self, address, handler=RequestHandler, workers=16):
+        super().__init__(address, handler)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bus service HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    archive.install(get_pool())  # every pooled connection sees the archived history
+    init_db()
+    server = PooledHTTPServer((args.host, args.port), workers=args.workers)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
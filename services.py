@@ -0,0 +1,710 @@
+"""GUI-free service layer: every business operation the application offers.
+
+Used by the Tk client (app.py) and the HTTP/JSON server (server.py). Input
+problems raise ServiceError, missing rows raise NotFound; booking operations
+return booking.BookingResult values.
+"""
+import heapq
+import itertools
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import auth
+import availability
+import booking
+import changes
+import pricing
+import recurrence
+import roster
+import timetable
+from connection_pool import get_pool
+from database import get_connection, get_read_connection, get_transaction
+from ref_cache import cached, invalidates
+from seat_inventory import SeatUnavailable, inventory
+from route_stops import buses_between, set_route_stops
+
+
+class ServiceError(ValueError):
+    """Invalid input or a request that cannot be carried out."""
+
+
+class NotFound(ServiceError):
+    """The requested row does not exist."""
+
+
+BUS_FIELDS = [
+    "name", "number", "ticket_price", "capacity", "route_name", "stops",
+    "driver_id", "co_driver_id", "departure_date", "departure_time", "arrival_time",
+]
+# Optional add_bus fields: repeat the first trip on these weekdays until a date
+REPEAT_FIELDS = ["repeats", "repeat_until"]
+# How far ahead find_schedules() lists trips to prebook
+PREBOOK_DAYS = 30
+
+
+def _required(value, label):
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        raise ServiceError(f"{label} is required.")
+    return value
+
+def _number(value, label, cast=float):
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ServiceError(f"{label} must be a number.")
+    if number <= 0:
+        raise ServiceError(f"{label} must be positive.")
+    return number
+
+def _date(value, label):
+    try:
+        return timetable.parse_date(_required(value, label))
+    except ValueError:
+        raise ServiceError(f"{label} must be a date (YYYY-MM-DD).")
+
+def _time(value, label):
+    try:
+        return timetable.parse_time(_required(value, label))
+    except ValueError:
+        raise ServiceError(f"{label} must be a time (HH:MM).")
+
+def _timestamp(value, label):
+    try:
+        return datetime.fromisoformat(_required(value, label)).strftime(timetable.TS_FORMAT)
+    except ValueError:
+        raise ServiceError(f"{label} must be a date and time (YYYY-MM-DD HH:MM).")
+
+def _optional_int(value, label):
+    if value is None or str(value).strip() == "":
+        return None
+    return _number(value, label, int)
+
+
+# Users
+
+def login(email, password):
+    """Return {"user_id", "name", "role", "token"} for valid credentials, else None."""
+    email, password = (email or "").strip(), password or ""
+    if not email or not password:
+        return None
+    return auth.login(email, password)
+
+def logout(token):
+    auth.logout(token)
+
+def signup(name, email, phone, password):
+    """Create a passenger account and return its user_id."""
+    name, email = _required(name, "Name"), _required(email, "Email")
+    phone, password = _required(phone, "Phone"), _required(password, "Password")
+    # Hash first: PBKDF2 takes a while and must not hold up other writers
+    password_hash = auth.hash_password(password)
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO users (name, email, phone, password) VALUES (?, ?, ?, ?)",
+                        (name, email, phone, password_hash))
+            return cur.lastrowid
+    except sqlite3.IntegrityError:
+        raise ServiceError("Email already exists. Please choose another one.")
+
+
+# Buses
+
+@cached("buses", "routes")
+def list_buses():
+    """Return every bus with its route: (bus_id, name, number, ticket_price, capacity, route_name, stops)."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT buses.bus_id, buses.name, buses.number, buses.ticket_price, buses.capacity,
+                routes.route_name, routes.stops
+            FROM buses
+            JOIN routes ON buses.route_id = routes.route_id
+        """)
+        return cur.fetchall()
+
+def search_buses(text, limit=None):
+    """Best full-text matches for `text` over bus name/number, route and stops."""
+    import search  # loaded by the first search, not at startup
+
+    limit = search.SEARCH_LIMIT if limit is None else limit
+    return search.search_buses(text, _number(limit, "Limit", int))
+
+def seats_left(bus_ids=None):
+    """Return {bus_id: unsold tickets}, read from the bus_availability summary."""
+    return availability.seats_left(bus_ids)
+
+@cached("buses")
+def list_bus_names():
+    """Return (bus_id, name) for every bus."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT bus_id, name FROM buses")
+        return cur.fetchall()
+
+# bus_id; the editable fields in BUS_FIELDS order, with the hand-entered trip
+BUS_DETAILS_QUERY = """
+    SELECT b.name, b.number, b.ticket_price, b.capacity,
+        r.route_name, r.stops, b.driver_id1, b.driver_id2,
+        s.departure_date, s.departure_time, s.arrival_time
+    FROM buses b
+    JOIN routes r ON b.route_id = r.route_id
+    JOIN schedules s ON b.bus_id = s.bus_id AND s.pattern_id IS NULL
+    WHERE b.bus_id = ?
+"""
+
+def get_bus(bus_id):
+    """Return a bus's editable fields as a dict keyed by BUS_FIELDS."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(BUS_DETAILS_QUERY, (bus_id,))
+        details = cur.fetchone()
+    if details is None:
+        raise NotFound(f"Bus {bus_id} not found.")
+    return dict(zip(BUS_FIELDS, details))
+
+def validate_bus(fields):
+    """Validate and convert the add/update bus form fields."""
+    return {
+        "name": _required(fields.get("name"), "Bus name"),
+        "number": _required(fields.get("number"), "Bus number"),
+        "ticket_price": _number(fields.get("ticket_price"), "Ticket price"),
+        "capacity": _number(fields.get("capacity"), "Capacity", int),
+        "route_name": _required(fields.get("route_name"), "Route name"),
+        "stops": _required(fields.get("stops"), "Stops"),
+        "driver_id": _number(fields.get("driver_id"), "Driver ID", int),
+        "co_driver_id": _optional_int(fields.get("co_driver_id"), "Co-driver ID"),
+        "departure_date": _date(fields.get("departure_date"), "Departure date"),
+        "departure_time": _time(fields.get("departure_time"), "Departure time"),
+        "arrival_time": _time(fields.get("arrival_time"), "Arrival time"),
+    }
+
+@invalidates("buses", "routes")
+def add_bus(fields):
+    """Create a bus with its route, schedule and driver assignments; return bus_id."""
+    v = validate_bus(fields)
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        # Insert route
+        cur.execute("INSERT INTO routes (route_name, stops) VALUES (?, ?)", (v["route_name"], v["stops"]))
+        route_id = cur.lastrowid
+        set_route_stops(conn, route_id, v["stops"])
+
+        # Insert bus
+        cur.execute(
+            """
+            INSERT INTO buses (name, number, route_id, ticket_price, capacity, driver_id1, driver_id2)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (v["name"], v["number"], route_id, v["ticket_price"], v["capacity"],
+             v["driver_id"], v["co_driver_id"])
+        )
+        bus_id = cur.lastrowid
+
+        # Insert schedule
+        cur.execute(
+            """
+            INSERT INTO schedules (bus_id, route_id, departure_date, departure_time, arrival_time)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (bus_id, route_id, v["departure_date"], v["departure_time"], v["arrival_time"])
+        )
+        if str(fields.get("repeats") or "").strip():
+            _add_pattern(conn, bus_id, v["departure_time"], v["arrival_time"], fields["repeats"], 1,
+                         v["departure_date"], fields.get("repeat_until"))
+
+        # Assign drivers
+        cur.execute("INSERT INTO driver_assignments (bus_id, driver_id) VALUES (?, ?)", (bus_id, v["driver_id"]))
+        if v["co_driver_id"]:
+            cur.execute("INSERT INTO driver_assignments (bus_id, driver_id) VALUES (?, ?)", (bus_id, v["co_driver_id"]))
+        return bus_id
+
+# route_name, stops, route_id
+UPDATE_ROUTE_QUERY = "UPDATE routes SET route_name = ?, stops = ? WHERE route_id = ?"
+
+# departure_date, departure_time, arrival_time, bus_id; booked recurring trips keep their times
+UPDATE_SCHEDULE_QUERY = """
+    UPDATE schedules SET departure_date = ?, departure_time = ?, arrival_time = ?
+    WHERE bus_id = ? AND pattern_id IS NULL
+"""
+
+@invalidates("buses", "routes")
+def update_bus(bus_id, fields):
+    """Update a bus together with its route and schedule."""
+    v = validate_bus(fields)
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT route_id FROM buses WHERE bus_id = ?", (bus_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise NotFound(f"Bus {bus_id} not found.")
+        route_id = row[0]
+
+        # Update bus details
+        cur.execute(
+            """
+            UPDATE buses
+            SET name = ?, number = ?, ticket_price = ?, capacity = ?,
+                driver_id1 = ?, driver_id2 = ?
+            WHERE bus_id = ?
+            """,
+            (v["name"], v["number"], v["ticket_price"], v["capacity"],
+             v["driver_id"], v["co_driver_id"], bus_id)
+        )
+
+        # Update route
+        cur.execute(UPDATE_ROUTE_QUERY, (v["route_name"], v["stops"], route_id))
+        set_route_stops(conn, route_id, v["stops"])
+
+        # Update the hand-entered schedule; booked recurring trips keep their times
+        cur.execute(UPDATE_SCHEDULE_QUERY, (v["departure_date"], v["departure_time"], v["arrival_time"], bus_id))
+        # The trips' shifts moved with them and must still fit their drivers' rosters
+        for (departure_ts,) in cur.execute(
+            "SELECT departure_ts FROM schedules WHERE bus_id = ? AND pattern_id IS NULL", (bus_id,)
+        ).fetchall():
+            try:
+                roster.check_trip(conn, bus_id, departure_ts)
+            except roster.RosterConflict as e:
+                raise ServiceError(f"The new times clash with the driver roster. {e}")
+
+# Tables created by older versions of schema.sql that point at buses without
+# ON DELETE CASCADE; CREATE TABLE IF NOT EXISTS never rebuilds them, so their
+# rows are removed by hand. Newer tables cascade by themselves.
+BUS_CHILD_TABLES = ("tickets", "schedules", "driver_assignments", "transactions", "prebooked_buses", "reviews")
+# JSON list of bus ids; formatted with each child table, then "buses"
+DELETE_BUSES_QUERY = "DELETE FROM {} WHERE bus_id IN (SELECT value FROM json_each(?))"
+
+def _delete_buses(conn, bus_ids):
+    """Delete buses and every row that belongs to them; returns how many buses went."""
+    ids = json.dumps(list(bus_ids))
+    # Children first so the delete passes with foreign keys enforced
+    for table in BUS_CHILD_TABLES:
+        conn.execute(DELETE_BUSES_QUERY.format(table), (ids,))
+    return conn.execute(DELETE_BUSES_QUERY.format("buses"), (ids,)).rowcount
+
+@invalidates("buses")
+def delete_bus(bus_id):
+    """Delete a bus and the rows that belong to it."""
+    with get_connection() as conn:
+        if _delete_buses(conn, [bus_id]) == 0:
+            raise NotFound(f"Bus {bus_id} not found.")
+
+def details_page(after_bus_id=0, limit=None):
+    """One keyset page of the admin details report."""
+    import reports  # pulls in archive; neither is needed at startup
+
+    return reports.fetch_details_page(after_bus_id, reports.DETAILS_PAGE_SIZE if limit is None else limit)
+
+def sales_report(start, end):
+    """Payments per bus on dates start..end (inclusive), archived ones included."""
+    import reports
+
+    start, end = _date(start, "From"), _date(end, "To")
+    next_day = (datetime.fromisoformat(end) + timedelta(days=1)).date().isoformat()
+    return reports.fetch_sales(start, next_day)
+
+
+# Routes and stops
+
+ROUTE_LIST_QUERY = "SELECT route_id, route_name, stops FROM routes"
+
+@cached("routes")
+def list_routes():
+    """Return (route_id, route_name, stops) for every route."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(ROUTE_LIST_QUERY + " ORDER BY route_id")
+        return cur.fetchall()
+
+def route_changes(since=None, data_version=None):
+    """list_routes() rows changed since change version `since`; see changes.poll."""
+    return changes.poll(since, data_version, ROUTE_LIST_QUERY, "route_id", "routes")
+
+@invalidates("routes")
+def add_route(route_name, stops):
+    """Create a route and return its route_id."""
+    route_name, stops = _required(route_name, "Route name"), _required(stops, "Stops")
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO routes (route_name, stops) VALUES (?, ?)", (route_name, stops))
+        route_id = cur.lastrowid
+        set_route_stops(conn, route_id, stops)
+        return route_id
+
+@invalidates("routes")
+def update_route(route_id, route_name, stops):
+    route_name, stops = _required(route_name, "Route name"), _required(stops, "Stops")
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE routes SET route_name = ?, stops = ? WHERE route_id = ?",
+            (route_name, stops, route_id),
+        )
+        if cur.rowcount == 0:
+            raise NotFound(f"Route {route_id} not found.")
+        set_route_stops(conn, route_id, stops)
+
+@invalidates("routes", "buses")
+def delete_route(route_id):
+    """Delete a route with the buses and trips on it."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        _delete_buses(conn, [row[0] for row in cur.execute(
+            "SELECT bus_id FROM buses WHERE route_id = ?", (route_id,)).fetchall()])
+        cur.execute("DELETE FROM schedules WHERE route_id = ?", (route_id,))
+        cur.execute("DELETE FROM routes WHERE route_id = ?", (route_id,))
+        if cur.rowcount == 0:
+            raise NotFound(f"Route {route_id} not found.")
+
+def find_buses(origin, destination):
+    """Buses whose route calls at `origin` and later at `destination`."""
+    return buses_between(_required(origin, "Origin"), _required(destination, "Destination"))
+
+
+# Drivers
+
+DRIVER_LIST_QUERY = "SELECT driver_id, name, license_number FROM drivers"
+
+@cached("drivers")
+def list_drivers():
+    """Return (driver_id, name, license_number) for every driver."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DRIVER_LIST_QUERY + " ORDER BY driver_id")
+        return cur.fetchall()
+
+def driver_changes(since=None, data_version=None):
+    """list_drivers() rows changed since change version `since`; see changes.poll."""
+    return changes.poll(since, data_version, DRIVER_LIST_QUERY, "driver_id", "drivers")
+
+def get_driver(driver_id):
+    """Return (driver_id, name, license_number, phone, address)."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT driver_id, name, license_number, phone, address FROM drivers WHERE driver_id = ?",
+                    (driver_id,))
+        driver = cur.fetchone()
+    if driver is None:
+        raise NotFound(f"Driver {driver_id} not found.")
+    return driver
+
+@invalidates("drivers")
+def add_driver(name, license_number, phone, address):
+    """Create a driver and return its driver_id."""
+    name = _required(name, "Name")
+    license_number = _required(license_number, "License number")
+    phone = _required(phone, "Phone")
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO drivers (name, license_number, phone, address)
+                VALUES (?, ?, ?, ?)
+            """, (name, license_number, phone, address))
+            return cur.lastrowid
+    except sqlite3.IntegrityError:
+        raise ServiceError("A driver with that license number already exists.")
+
+@invalidates("drivers")
+def update_driver(driver_id, name, license_number, phone, address):
+    name = _required(name, "Name")
+    license_number = _required(license_number, "License number")
+    phone = _required(phone, "Phone")
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE drivers
+            SET name = ?, license_number = ?, phone = ?, address = ?
+            WHERE driver_id = ?
+        """, (name, license_number, phone, address, driver_id))
+        if cur.rowcount == 0:
+            raise NotFound(f"Driver {driver_id} not found.")
+
+@invalidates("drivers", "buses")
+def delete_driver(driver_id):
+    """Delete a driver, taking them off their buses and assignments."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        # By hand for tables from older schemas without ON DELETE actions
+        cur.execute("UPDATE buses SET driver_id1 = NULL WHERE driver_id1 = ?", (driver_id,))
+        cur.execute("UPDATE buses SET driver_id2 = NULL WHERE driver_id2 = ?", (driver_id,))
+        cur.execute("DELETE FROM driver_assignments WHERE driver_id = ?", (driver_id,))
+        cur.execute("DELETE FROM drivers WHERE driver_id = ?", (driver_id,))
+        if cur.rowcount == 0:
+            raise NotFound(f"Driver {driver_id} not found.")
+
+
+# Tickets and bookings
+
+TICKET_LIST_QUERY = """
+    SELECT tickets.ticket_id, buses.name, tickets.seat_number, tickets.price, tickets.status
+    FROM tickets
+    JOIN buses ON tickets.bus_id = buses.bus_id
+"""
+
+def list_tickets():
+    """Return (ticket_id, bus_name, seat_number, price, status) for every ticket."""
+    with get_read_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(TICKET_LIST_QUERY + " ORDER BY tickets.ticket_id")
+        return cur.fetchall()
+
+def ticket_changes(since=None, data_version=None):
+    """list_tickets() rows changed since change version `since`; see changes.poll.
+
+    A bus rename changes the bus name on its tickets, so it forces a reload.
+    """
+    return changes.poll(since, data_version, TICKET_LIST_QUERY, "tickets.ticket_id", "tickets",
+                        reload_on=("buses",))
+
+SEAT_MAP_QUERY = TICKET_LIST_QUERY + """
+    WHERE tickets.bus_id = ? AND tickets.schedule_id IS ?
+    ORDER BY tickets.seat_number
+"""
+
+def trip_seats(bus_id, schedule_id=None, data_version=None):
+    """(data_version, capacity, rows, held) for a bus's seat map on a trip (or its per-bus seats).
+
+    Rows are list_tickets() rows and held the seat numbers on hold. All but
+    data_version are None when nothing has been committed since
+    `data_version`, a previous call's first item.
+    """
+    seen = get_pool().data_version()
+    if data_version is not None and seen == data_version:
+        return seen, None, None, None
+    bus_id = _number(bus_id, "Bus ID", int)
+    schedule_id = _optional_int(schedule_id, "Schedule ID")
+    with get_read_connection() as conn:
+        conn.execute("BEGIN")  # capacity and seats from one snapshot
+        bus = conn.execute("SELECT capacity FROM buses WHERE bus_id = ?", (bus_id,)).fetchone()
+        if bus is None:
+            raise NotFound(f"Bus {bus_id} not found.")
+        rows = conn.execute(SEAT_MAP_QUERY, (bus_id, schedule_id)).fetchall()
+    return seen, bus[0], rows, inventory.get(bus_id, schedule_id).held_seats()
+
+def add_ticket(bus_id, seat_number, price):
+    """Create an unsold ticket and return its ticket_id."""
+    bus_id = _number(bus_id, "Bus ID", int)
+    seat_number = _number(seat_number, "Seat number", int)
+    price = _number(price, "Price")
+    seat_id = f"{bus_id}-{seat_number}"  # Combine bus ID and seat number to generate a unique seat ID
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO tickets (bus_id, seat_number, seat_id, price, base_price, status)
+                VALUES (?, ?, ?, ?, ?, 'unsold')
+            """, (bus_id, seat_number, seat_id, price, price))
+            return cur.lastrowid
+    except sqlite3.IntegrityError:
+        raise ServiceError("That seat already has a ticket, or the bus does not exist.")
+
+def generate_seats(bus_id, start_date=None, end_date=None, layout=None, tiers=""):
+    """Create or resync a bus's seat inventory; returns seat_generator.SeatGenResult."""
+    import seat_generator
+
+    bus_id = _number(bus_id, "Bus ID", int)
+    start_date = (start_date or "").strip() or None
+    end_date = (end_date or "").strip() or None
+    try:
+        return seat_generator.generate_seats(bus_id, start_date, end_date, layout or seat_generator.DEFAULT_LAYOUT,
+                                             seat_generator.parse_tiers(tiers))
+    except LookupError as e:
+        raise NotFound(str(e))
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+def set_ticket_status(ticket_id, new_status, expected_status):
+    if new_status not in ("sold", "unsold"):
+        raise ServiceError("Status must be 'sold' or 'unsold'.")
+    return booking.set_ticket_status(ticket_id, new_status, expected_status)
+
+def set_ticket_statuses(changes, new_status):
+    """Set the status of [(ticket_id, expected_status)] in one transaction; a BookingResult each."""
+    if new_status not in ("sold", "unsold"):
+        raise ServiceError("Status must be 'sold' or 'unsold'.")
+    return booking.set_ticket_statuses(changes, new_status)
+
+def delete_ticket(ticket_id):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM tickets WHERE ticket_id = ?", (ticket_id,))
+        if cur.rowcount == 0:
+            raise NotFound(f"Ticket {ticket_id} not found.")
+
+def delete_tickets(ticket_ids):
+    """Delete several tickets in one transaction; returns how many were still there."""
+    with get_transaction() as conn:
+        return conn.execute("DELETE FROM tickets WHERE ticket_id IN (SELECT value FROM json_each(?))",
+                            (json.dumps(list(ticket_ids)),)).rowcount
+
+def book_seat(bus_id, seat_number, user_id, schedule_id=None):
+    return booking.book_seat(bus_id, seat_number, user_id, schedule_id)
+
+def _seat_numbers(seats):
+    if not isinstance(seats, (list, tuple)) or not seats:
+        raise ServiceError("Seats must be a list of seat numbers.")
+    return [_number(seat, "Seat number", int) for seat in seats]
+
+def hold_seats(bus_id, user_id, seats=None, count=None, schedule_id=None):
+    """Hold `seats`, or the first `count` adjacent free seats, for a user; returns the seats held.
+
+    Holds lapse after seat_inventory.HOLD_SECONDS unless confirmed.
+    """
+    bus_id = _number(bus_id, "Bus ID", int)
+    schedule_id = _optional_int(schedule_id, "Schedule ID")
+    try:
+        if count is not None:
+            return inventory.hold_adjacent(bus_id, _number(count, "Count", int), user_id, schedule_id)
+        return inventory.hold(bus_id, _seat_numbers(seats), user_id, schedule_id)
+    except SeatUnavailable as e:
+        raise ServiceError(str(e))
+
+def confirm_seats(bus_id, user_id, seats, schedule_id=None):
+    """Buy seats held for the user; returns their ticket ids."""
+    try:
+        return inventory.confirm(_number(bus_id, "Bus ID", int), _seat_numbers(seats), user_id,
+                                 _optional_int(schedule_id, "Schedule ID"))
+    except SeatUnavailable as e:
+        raise ServiceError(str(e))
+
+def release_seats(bus_id, user_id, seats, schedule_id=None):
+    inventory.release(_number(bus_id, "Bus ID", int), _seat_numbers(seats), user_id,
+                      _optional_int(schedule_id, "Schedule ID"))
+
+def find_schedules(bus_name, route_name, days=PREBOOK_DAYS):
+    """Upcoming trips of a bus on a route over the next `days` days, booked or not.
+
+    Rows are (bus_id, schedule_id, departure_date, departure_time, pattern_id,
+    service_date). schedule_id is None for a recurring trip nobody has booked
+    yet; prebook_trip() books it by (pattern_id, service_date).
+    """
+    with get_read_connection() as conn:
+        bus_ids = [row[0] for row in conn.execute("""
+            SELECT buses.bus_id FROM buses
+            WHERE buses.name = ? AND buses.route_id = (SELECT route_id FROM routes WHERE route_name = ?)
+        """, (bus_name, route_name))]
+    now = datetime.now()
+    trips = heapq.merge(*(recurrence.trips_between(now.date(), now.date() + timedelta(days=days), bus_id=bus_id)
+                          for bus_id in bus_ids), key=lambda trip: trip.departure_ts)
+    now = now.strftime(timetable.TS_FORMAT)
+    return [(trip.bus_id, trip.schedule_id, trip.departure_ts[:10], trip.departure_ts[11:16],
+             trip.pattern_id, trip.service_date) for trip in trips if trip.departure_ts >= now]
+
+def prebook(user_id, bus_id, schedule_id):
+    return booking.prebook(user_id, bus_id, schedule_id)
+
+
+# Timetable
+
+def next_departures(route_id, after=None, days=timetable.WINDOW_DAYS, limit=timetable.DEPARTURES_LIMIT):
+    """Next trips on a route after `after` (default now); see timetable.next_departures."""
+    route_id = _number(route_id, "Route ID", int)
+    try:
+        return timetable.next_departures(route_id, after or None, _number(days, "Days"),
+                                         _number(limit, "Limit", int))
+    except ValueError:
+        raise ServiceError("After must be a date or timestamp (YYYY-MM-DD HH:MM).")
+
+def stop_board(stop_name, start=None, hours=timetable.BOARD_HOURS, limit=timetable.DEPARTURES_LIMIT):
+    """Departures from every route calling at a stop; see timetable.stop_board."""
+    stop_name = _required(stop_name, "Stop")
+    try:
+        return timetable.stop_board(stop_name, start or None, _number(hours, "Hours"),
+                                    _number(limit, "Limit", int))
+    except ValueError:
+        raise ServiceError("From must be a date or timestamp (YYYY-MM-DD HH:MM).")
+
+
+# Recurring schedules
+
+def _add_pattern(conn, bus_id, departure_time, arrival_time, weekdays, interval_weeks, valid_from, valid_until):
+    try:
+        return recurrence.add_pattern(bus_id, departure_time, arrival_time, weekdays,
+                                      _number(interval_weeks, "Interval (weeks)", int),
+                                      valid_from, str(valid_until or "").strip() or None, conn=conn)
+    except LookupError as e:
+        raise NotFound(str(e))
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+def add_schedule_pattern(bus_id, departure_time, arrival_time, weekdays="daily", interval_weeks=1,
+                         valid_from=None, valid_until=None):
+    """Store a recurring trip for a bus; returns pattern_id. See recurrence.add_pattern."""
+    bus_id = _number(bus_id, "Bus ID", int)
+    with get_connection() as conn:
+        return _add_pattern(conn, bus_id, _time(departure_time, "Departure time"),
+                            _time(arrival_time, "Arrival time"), weekdays or "daily", interval_weeks or 1,
+                            _date(valid_from, "Valid from") if valid_from else None, valid_until)
+
+def list_schedule_patterns(bus_id=None, route_id=None):
+    return recurrence.list_patterns(_optional_int(bus_id, "Bus ID"), _optional_int(route_id, "Route ID"))
+
+def delete_schedule_pattern(pattern_id):
+    if not recurrence.delete_pattern(pattern_id):
+        raise NotFound(f"Schedule pattern {pattern_id} not found.")
+
+def cancel_trip(pattern_id, service_date):
+    """Stop a pattern from running on one date."""
+    try:
+        recurrence.cancel_trip(pattern_id, _date(service_date, "Service date"))
+    except LookupError as e:
+        raise NotFound(str(e))
+
+def trips_between(start, end, bus_id=None, route_id=None, limit=None):
+    """Trips (booked or not) departing on dates start..end; see recurrence.trips_between."""
+    start, end = _date(start, "From"), _date(end, "To")
+    try:
+        trips = recurrence.trips_between(start, end, _optional_int(bus_id, "Bus ID"),
+                                         _optional_int(route_id, "Route ID"))
+    except ValueError as e:
+        raise ServiceError(str(e))
+    return list(itertools.islice(trips, _optional_int(limit, "Limit")))
+
+def book_trip_seat(pattern_id, service_date, seat_number, user_id):
+    return recurrence.book_seat(_number(pattern_id, "Pattern ID", int), _date(service_date, "Service date"),
+                                _number(seat_number, "Seat number", int), user_id)
+
+def prebook_trip(user_id, pattern_id, service_date):
+    return recurrence.prebook(user_id, _number(pattern_id, "Pattern ID", int), _date(service_date, "Service date"))
+
+
+# Driver rostering
+
+def assign_driver(driver_id, bus_id, departure, role="driver"):
+    """Put a driver on a bus's trip departing at `departure`; returns shift_id."""
+    driver_id = _number(driver_id, "Driver ID", int)
+    bus_id = _number(bus_id, "Bus ID", int)
+    try:
+        return roster.assign(driver_id, bus_id, _timestamp(departure, "Departure"), role or "driver")
+    except LookupError as e:
+        raise NotFound(str(e))
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+def unassign_shift(shift_id):
+    if not roster.unassign(shift_id):
+        raise NotFound(f"Shift {shift_id} not found.")
+
+def driver_shifts(driver_id, start, end):
+    return roster.shifts_for(_number(driver_id, "Driver ID", int), _date(start, "From"), _date(end, "To"))
+
+def auto_roster(start, end):
+    """Assign drivers to every uncovered trip on dates start..end; returns roster.AutoRosterResult."""
+    start, end = _date(start, "From"), _date(end, "To")
+    if end < start:
+        raise ServiceError("To must not be before From.")
+    return roster.auto_assign(start, end)
+
+
+# Dynamic pricing
+
+def reprice(days=pricing.HORIZON_DAYS, dry_run=False):
+    """Reprice unsold seats on trips departing in the next `days`; returns pricing.RepriceResult."""
+    try:
+        return pricing.reprice(_number(days, "Days", int), dry_run)
+    except ImportError:
+        raise ServiceError("Dynamic pricing needs NumPy (pip install numpy).")
@@ -0,0 +1,64 @@
+"""Startup helpers: a timeline for --profile-startup and a cached background.
+
+The login background is resized from bus_service_image.jpg once and saved as
+a PNG under .cache/, named after the source's mtime and target size. Later
+launches load that PNG with Tk's own PhotoImage, so PIL is only imported
+when the cache has to be (re)built.
+"""
+import os
+import sys
+import time
+
+CACHE_DIR = ".cache"
+
+_started = time.perf_counter()
+_marks = []
+
+
+def mark(label):
+    """Record a point on the startup timeline."""
+    _marks.append((label, time.perf_counter()))
+
+def report(stream=None):
+    """Print each mark with its time since start and since the previous mark."""
+    stream = stream or sys.stderr
+    previous = _started
+    print(f"{'step':<28}{'at (ms)':>10}{'took (ms)':>11}", file=stream)
+    for label, at in _marks:
+        print(f"{label:<28}{(at - _started) * 1000:>10.1f}{(at - previous) * 1000:>11.1f}", file=stream)
+        previous = at
+
+
+def _cache_path(source, size):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{size[0]}x{size[1]}-{os.stat(source).st_mtime_ns}.png")
+
+def _render(source, size, target):
+    """Resize `source` into the PNG `target` and remove older renders of it."""
+    from PIL import Image  # only needed when the cache is cold
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(source) as image:
+        image = image.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+        partial = target + ".tmp"
+        image.save(partial, "PNG")
+    os.replace(partial, target)
+
+    prefix = os.path.basename(target).rsplit("-", 1)[0] + "-"
+    for name in os.listdir(os.path.dirname(target)):
+        if name.startswith(prefix) and name != os.path.basename(target):
+            os.remove(os.path.join(os.path.dirname(target), name))
+
+def background_image(master, source, size):
+    """Return a tk.PhotoImage of `source` scaled to `size`, or None if unavailable."""
+    import tkinter as tk
+
+    try:
+        target = _cache_path(source, size)
+        if not os.path.exists(target):
+            _render(source, size, target)
+            mark("background rendered")
+        return tk.PhotoImage(master=master, file=target)
+    except (OSError, ImportError, tk.TclError) as e:
+        print(f"Background image unavailable: {e}", file=sys.stderr)
+        return None
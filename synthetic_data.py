@@ -0,0 +1,200 @@
+"""Deterministic synthetic data for schema.sql databases.
+
+Fills every table the application reads with plausible rows at a chosen
+scale, using executemany over generators. Secondary indexes and all
+triggers are dropped while loading and recreated from schema.sql afterwards;
+the trigger-maintained summaries are then rebuilt in one pass. The same
+seed and sizes always produce the same database.
+
+Usage: python synthetic_data.py PATH [--scale small|medium|large] [--buses N]
+                                [--seats N] [--trips N] [--seed N]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from availability import rebuild as rebuild_availability
+from route_stops import migrate_route_stops
+from search import rebuild as rebuild_search
+from seat_generator import seat_id
+from timetable import TS_FORMAT
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+# buses per scale; seats and trips per bus multiply into the ticket count
+SCALES = {"small": 100, "medium": 10000, "large": 100000}
+
+CITIES = [
+    "Kathmandu", "Pokhara", "Chitwan", "Butwal", "Biratnagar", "Dharan", "Janakpur",
+    "Nepalgunj", "Dhangadhi", "Hetauda", "Birgunj", "Bhairahawa", "Itahari", "Damak",
+    "Lumbini", "Gorkha", "Besisahar", "Baglung", "Tansen", "Ilam",
+]
+FIRST_DEPARTURE = date(2024, 11, 1)
+CREATED_AT = "2024-10-01 09:00:00"  # fixed, so timestamps do not depend on the clock
+
+
+def _drop_for_load(conn):
+    """Drop secondary indexes and triggers; schema.sql puts them back."""
+    objects = conn.execute(
+        "SELECT type, name FROM sqlite_master "
+        "WHERE (type = 'index' AND sql IS NOT NULL) OR type = 'trigger'"
+    ).fetchall()
+    for kind, name in objects:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+
+
+def _route_stops(rng, route):
+    count = 2 + route % 4
+    return ", ".join(rng.sample(CITIES, count))
+
+
+def generate(path, buses=SCALES["small"], seats_per_bus=40, trips_per_bus=1,
+             drivers=None, users=None, seed=1):
+    """Create and fill a database at `path`; returns {table: rows inserted}."""
+    drivers = drivers or max(10, buses // 10)
+    users = users or max(20, buses * 2)
+    rng = random.Random(seed)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    with open(SCHEMA) as schema_file:
+        schema = schema_file.read()
+    conn.executescript(schema)
+
+    counts = {}
+    with conn:
+        _drop_for_load(conn)
+        conn.executemany(
+            """
+            INSERT INTO users (user_id, name, email, phone, password, role, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            ((i, f"User {i}", f"user{i}@example.com", f"98{i:08d}", "x",
+              "admin" if i == 1 else "passenger", CREATED_AT) for i in range(1, users + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO drivers (driver_id, name, license_number, phone, address) VALUES (?, ?, ?, ?, ?)",
+            ((i, f"Driver {i}", f"L{i}", f"97{i:08d}", rng.choice(CITIES))
+             for i in range(1, drivers + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO routes (route_id, route_name, stops) VALUES (?, ?, ?)",
+            ((i, f"Route {i}", _route_stops(rng, i)) for i in range(1, buses + 1)),
+        )
+        conn.executemany(
+            """
+            INSERT INTO buses (bus_id, name, number, route_id, ticket_price, capacity,
+                driver_id1, driver_id2)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            ((i, f"Bus {i}", f"N{i}", i, float(rng.randrange(300, 2000, 50)), seats_per_bus,
+              i % drivers + 1, (i + 1) % drivers + 1) for i in range(1, buses + 1)),
+        )
+        def schedules():
+            for bus in range(1, buses + 1):
+                # Departures spread over the day; late ones arrive after midnight
+                first = datetime.combine(FIRST_DEPARTURE, datetime.min.time()) + timedelta(
+                    hours=5 + bus % 18, minutes=bus % 4 * 15)
+                duration = timedelta(hours=3 + bus % 9)
+                for trip in range(trips_per_bus):
+                    departure = first + timedelta(days=trip)
+                    arrival = departure + duration
+                    yield ((bus - 1) * trips_per_bus + trip + 1, bus, bus,
+                           departure.date().isoformat(), departure.strftime("%H:%M"),
+                           arrival.strftime("%H:%M"), departure.strftime(TS_FORMAT),
+                           arrival.strftime(TS_FORMAT))
+
+        conn.executemany(
+            """
+            INSERT INTO schedules (schedule_id, bus_id, route_id, departure_date,
+                departure_time, arrival_time, departure_ts, arrival_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            schedules(),
+        )
+        # A recurring Mon-Fri service per bus, every week or every other week;
+        # every seventh pattern has one cancelled date
+        conn.executemany(
+            """
+            INSERT INTO schedule_patterns (pattern_id, bus_id, route_id, departure_time, arrival_time,
+                weekdays, interval_weeks, valid_from, valid_until)
+            VALUES (?, ?, ?, ?, ?, 31, ?, ?, ?)
+            """,
+            ((i, i, i, f"{(6 + i % 16):02d}:{i % 4 * 15:02d}", f"{(9 + i % 16) % 24:02d}:{i % 4 * 15:02d}",
+              1 + i % 2, FIRST_DEPARTURE.isoformat(), (FIRST_DEPARTURE + timedelta(days=180)).isoformat())
+             for i in range(1, buses + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO pattern_exceptions (pattern_id, service_date) VALUES (?, ?)",
+            ((i, (FIRST_DEPARTURE + timedelta(days=i % 28)).isoformat()) for i in range(1, buses + 1, 7)),
+        )
+        conn.executemany(
+            "INSERT INTO driver_assignments (bus_id, driver_id) VALUES (?, ?)",
+            ((i, i % drivers + 1) for i in range(1, buses + 1)),
+        )
+
+        def tickets():
+            for bus in range(1, buses + 1):
+                price = 300.0 + bus % 35 * 50
+                for trip in range(trips_per_bus):
+                    schedule = (bus - 1) * trips_per_bus + trip + 1
+                    for seat in range(1, seats_per_bus + 1):
+                        sold = rng.random() < 0.35
+                        yield (bus, seat, seat_id(bus, seat, schedule), schedule,
+                               "sold" if sold else "unsold", price,
+                               rng.randint(1, users) if sold else None)
+
+        conn.executemany(
+            """
+            INSERT INTO tickets (bus_id, seat_number, seat_id, schedule_id, status, price, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            tickets(),
+        )
+        conn.executemany(
+            "INSERT INTO prebooked_buses (user_id, bus_id, prebook_date) VALUES (?, ?, ?)",
+            ((i % users + 1, i, CREATED_AT) for i in range(1, buses + 1, 3)),
+        )
+        for table in ("users", "drivers", "routes", "buses", "schedules", "tickets",
+                      "driver_assignments", "prebooked_buses", "schedule_patterns", "pattern_exceptions"):
+            counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    conn.executescript(schema)  # recreate the indexes and triggers dropped above
+    with conn:
+        migrate_route_stops(conn)
+        counts["bus_availability"] = rebuild_availability(conn)
+        counts["bus_search"] = rebuild_search(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--buses", type=int, help="overrides --scale")
+    parser.add_argument("--seats", type=int, default=40, help="seats per bus")
+    parser.add_argument("--trips", type=int, default=1, help="scheduled trips per bus")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        print(f"{args.path} already exists; refusing to overwrite it.")
+        return 1
+    started = time.perf_counter()
+    counts = generate(args.path, buses=args.buses or SCALES[args.scale],
+                      seats_per_bus=args.seats, trips_per_bus=args.trips, seed=args.seed)
+    for table, count in counts.items():
+        print(f"{table:>20}: {count}")
+    print(f"Generated {args.path} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Timetable queries over indexed departure/arrival timestamps.
+
+Each schedule row keeps its original departure_date / departure_time /
+arrival_time text and, next to it, full timestamps departure_ts and
+arrival_ts ('YYYY-MM-DD HH:MM:SS', local time). An arrival earlier in the
+day than the departure is taken to be the next morning, so overnight trips
+get an arrival_ts after their departure_ts. Triggers in schema.sql fill the
+timestamps for rows written with well-formed text; migrate_timestamps()
+converts older rows (including "7:30pm" style times) at startup.
+
+Departure lists come from recurrence.trips_between(), so recurring trips
+nobody has booked yet are listed next to the scheduled ones; its schedules
+lookup is a range scan on idx_schedules_route_departure (route_id,
+departure_ts), reached from a stop through route_stops.
+
+Usage: python timetable.py next ROUTE_ID [AFTER] | board STOP [FROM] | migrate
+"""
+import heapq
+import itertools
+import json
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+from database import get_connection, get_read_connection
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+WINDOW_DAYS = 7
+BOARD_HOURS = 24
+DEPARTURES_LIMIT = 20
+
+_TIME = re.compile(r"^\s*(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?\s*$", re.IGNORECASE)
+
+# stop name; the routes calling at a stop and its position along each
+STOP_ROUTES_QUERY = """
+    SELECT route_stops.route_id, route_stops.seq
+    FROM stops
+    JOIN route_stops ON route_stops.stop_id = stops.stop_id
+    WHERE stops.name = ?
+"""
+
+# JSON list of bus ids, JSON list of route ids
+NAMES_QUERY = """
+    SELECT 'bus', bus_id, name FROM buses WHERE bus_id IN (SELECT value FROM json_each(?))
+    UNION ALL
+    SELECT 'route', route_id, route_name FROM routes WHERE route_id IN (SELECT value FROM json_each(?))
+"""
+
+
+def parse_time(text):
+    """Normalize "8:00", "08:00", "7:30pm" or "7 PM" to "HH:MM"; ValueError otherwise."""
+    match = _TIME.match(text or "")
+    if not match:
+        raise ValueError(f"Not a time of day: {text!r}")
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Not a time of day: {text!r}")
+        hour = hour % 12 + (12 if meridiem[0].lower() == "p" else 0)
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Not a time of day: {text!r}")
+    return f"{hour:02d}:{minute:02d}"
+
+def parse_date(text):
+    """Normalize an ISO date (YYYY-MM-DD); ValueError otherwise."""
+    return date.fromisoformat((text or "").strip()).isoformat()
+
+def timestamps(departure_date, departure_time, arrival_time):
+    """(departure_ts, arrival_ts) for a trip, rolling an earlier arrival over to the next day."""
+    departure = datetime.fromisoformat(f"{parse_date(departure_date)} {parse_time(departure_time)}")
+    arrival = datetime.fromisoformat(f"{departure.date().isoformat()} {parse_time(arrival_time)}")
+    if arrival < departure:
+        arrival += timedelta(days=1)
+    return departure.strftime(TS_FORMAT), arrival.strftime(TS_FORMAT)
+
+def _ts(value):
+    """A datetime, date or timestamp string as a TS_FORMAT string."""
+    if value is None:
+        value = datetime.now().replace(microsecond=0)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    elif not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return value.strftime(TS_FORMAT)
+
+
+def _window(start, end, route_id):
+    """Trips on a route departing in [start, end), earliest first."""
+    from recurrence import trips_between
+    start_ts, end_ts = _ts(start), _ts(end)
+    last_day = (datetime.fromisoformat(end_ts) - timedelta(seconds=1)).date()
+    return (trip for trip in trips_between(start_ts[:10], max(last_day.isoformat(), start_ts[:10]),
+                                           route_id=route_id)
+            if start_ts <= trip.departure_ts < end_ts)
+
+def _rows(conn, trips):
+    """Departure rows for Trip tuples, with the bus and route names looked up."""
+    names = {(kind, key): name for kind, key, name in conn.execute(
+        NAMES_QUERY, (json.dumps(sorted({trip.bus_id for trip in trips})),
+                      json.dumps(sorted({trip.route_id for trip in trips}))))}
+    return [(trip.schedule_id, trip.bus_id, names.get(("bus", trip.bus_id)), names.get(("route", trip.route_id)),
+             trip.departure_ts, trip.arrival_ts, trip.pattern_id, trip.service_date) for trip in trips]
+
+def departures_between(route_id, start, end, limit=None):
+    """Trips on a route departing in [start, end), earliest first, booked or not.
+
+    Rows are (schedule_id, bus_id, bus_name, route_name, departure_ts,
+    arrival_ts, pattern_id, service_date); schedule_id is None for a
+    recurring trip nobody has booked yet, which is booked by (pattern_id,
+    service_date).
+    """
+    trips = list(itertools.islice(_window(start, end, route_id), limit))
+    with get_read_connection() as conn:
+        return _rows(conn, trips)
+
+def next_departures(route_id, after=None, days=WINDOW_DAYS, limit=DEPARTURES_LIMIT):
+    """The next `limit` trips on a route departing after `after` (default now), within `days`."""
+    start = datetime.fromisoformat(_ts(after))
+    return departures_between(route_id, start, start + timedelta(days=days), limit)
+
+def stop_board(stop_name, start=None, hours=BOARD_HOURS, limit=DEPARTURES_LIMIT):
+    """Departures board for a stop: trips on every route calling there, earliest first.
+
+    Rows are departures_between() rows followed by stop_seq, the stop's
+    position along the route. Times are the trip's departure from the first
+    stop: per-stop offsets are not recorded.
+    """
+    start = datetime.fromisoformat(_ts(start))
+    end = start + timedelta(hours=hours)
+    with get_read_connection() as conn:
+        stops = conn.execute(STOP_ROUTES_QUERY, (stop_name.strip(),)).fetchall()
+    streams = [((trip, seq) for trip in _window(start, end, route_id)) for route_id, seq in stops]
+    board = list(itertools.islice(heapq.merge(*streams, key=lambda entry: entry[0].departure_ts), limit))
+    with get_read_connection() as conn:
+        rows = _rows(conn, [trip for trip, _ in board])
+    return [row + (seq,) for row, (_, seq) in zip(rows, board)]
+
+
+def migrate_timestamps(conn):
+    """Fill departure_ts/arrival_ts for rows the triggers could not parse.
+
+    Returns (converted, unparseable); unparseable rows keep NULL timestamps
+    and stay out of timetable queries until their times are fixed.
+    """
+    rows = conn.execute("""
+        SELECT schedule_id, departure_date, departure_time, arrival_time
+        FROM schedules WHERE departure_ts IS NULL OR arrival_ts IS NULL
+    """).fetchall()
+    updates, unparseable = [], 0
+    for schedule_id, departure_date, departure_time, arrival_time in rows:
+        try:
+            updates.append(timestamps(departure_date, departure_time, arrival_time) + (schedule_id,))
+        except ValueError:
+            unparseable += 1
+    conn.executemany("UPDATE schedules SET departure_ts = ?, arrival_ts = ? WHERE schedule_id = ?", updates)
+    return len(updates), unparseable
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["migrate"]:
+        with get_connection() as conn:
+            converted, unparseable = migrate_timestamps(conn)
+        print(f"Converted {converted} schedules; {unparseable} have unreadable times.")
+        return 0
+    if argv[:1] == ["next"] and len(argv) in (2, 3):
+        rows = next_departures(int(argv[1]), argv[2] if len(argv) == 3 else None)
+    elif argv[:1] == ["board"] and len(argv) in (2, 3):
+        rows = stop_board(argv[1], argv[2] if len(argv) == 3 else None)
+    else:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    for row in rows:
+        booked = f"trip {row[0]}" if row[0] else "not booked"
+        print(f"{row[4]} -> {row[5]}  {row[2]} ({row[3]}, {booked})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import bisect
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import messagebox
+
+
+class VirtualGrid(tk.Frame):
+    """A read-only table that only draws the rows currently on screen.
+
+    Rows are pulled a page at a time through `fetch_page(after_key)`, which
+    must return rows ordered by `key_of(row)` and starting strictly after
+    `after_key` (keyset pagination). Pages are fetched on the `db` executor,
+    one at a time, and drawn when they arrive; rows not loaded yet show blank
+    and the grid shows the busy cursor meanwhile. Only a bounded number of
+    pages is kept in memory; evicted pages are re-fetched from their
+    remembered start key when scrolled back into view. The canvas holds one
+    fixed set of text items per visible row slot, so widget count does not
+    grow with the data.
+    """
+
+    def __init__(self, parent, headers, fetch_page, db, key_of=lambda row: row[0],
+                 first_key=0, col_width=120, row_height=24, max_pages=8, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.headers = headers
+        self.fetch_page = fetch_page
+        self.db = db
+        self.key_of = key_of
+        self.col_width = col_width
+        self.row_height = row_height
+        self.max_pages = max_pages
+
+        # Keyset bookkeeping: page p starts after _anchors[p] and holds
+        # _offsets[p + 1] - _offsets[p] rows.
+        self._anchors = [first_key]
+        self._offsets = [0]
+        self._pages = OrderedDict()
+        self._exhausted = False
+        self._loading = None  # page being fetched, if any
+        self._job_key = ("virtual_grid", id(self))
+
+        self._top = 0
+        self._slots = []
+
+        width = col_width * len(headers)
+        self.header = tk.Canvas(self, height=row_height + 4, width=width, bg="lightblue",
+                                highlightthickness=0)
+        self.header.grid(row=0, column=0, sticky="ew")
+        self.body = tk.Canvas(self, width=width, bg="white", highlightthickness=0)
+        self.body.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        for col_num, header in enumerate(headers):
+            x = col_num * col_width
+            self.header.create_rectangle(x, 0, x + col_width, row_height + 4, outline="black")
+            self.header.create_text(x + col_width / 2, (row_height + 4) / 2, text=header,
+                                    font=("Arial", 12, "bold"))
+
+        self.body.bind("<Configure>", self._on_resize)
+        for widget in (self.body, self.header):
+            widget.bind("<MouseWheel>", self._on_wheel)
+            widget.bind("<Button-4>", lambda e: self.yview("scroll", -3, "units"))
+            widget.bind("<Button-5>", lambda e: self.yview("scroll", 3, "units"))
+
+        self._request(0)
+
+    # Data access
+
+    def _known_rows(self):
+        return self._offsets[-1]
+
+    def _request(self, page_no):
+        """Start fetching a page unless another page is already on its way."""
+        if self._loading is not None:
+            return
+        self._loading = page_no
+        self.configure(cursor="watch")
+        self.db.submit(
+            self.fetch_page, self._anchors[page_no], key=self._job_key, widget=self,
+            on_done=lambda rows: self._page_loaded(page_no, rows), on_error=self._page_failed,
+        )
+
+    def _page_loaded(self, page_no, rows):
+        self._loading = None
+        self.configure(cursor="")
+        if page_no == len(self._offsets) - 1:
+            # First time we reach this page: record where it ends.
+            if not rows:
+                self._exhausted = True
+                self._render()
+                return
+            self._offsets.append(self._offsets[-1] + len(rows))
+            self._anchors.append(self.key_of(rows[-1]))
+
+        self._pages[page_no] = rows
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        self._render()
+
+    def _page_failed(self, error):
+        self._loading = None
+        self.configure(cursor="")
+        messagebox.showerror("Error", f"Failed to load rows: {error}", parent=self)
+
+    def _ensure_rows(self, count):
+        """Page forward when fewer than `count` rows are known and more exist."""
+        if self._known_rows() < count and not self._exhausted:
+            self._request(len(self._offsets) - 1)
+
+    def row(self, index):
+        """Return the row at `index`, or None if it is past the end or still loading."""
+        if index >= self._known_rows():
+            return None
+        page_no = bisect.bisect_right(self._offsets, index) - 1
+        if page_no not in self._pages:
+            self._request(page_no)
+            return None
+        self._pages.move_to_end(page_no)
+        rows = self._pages[page_no]
+        offset = index - self._offsets[page_no]
+        return rows[offset] if offset < len(rows) else None
+
+    def reload(self):
+        """Drop every cached page and start again from the first one."""
+        first_key = self._anchors[0]
+        self._anchors = [first_key]
+        self._offsets = [0]
+        self._pages.clear()
+        self._exhausted = False
+        self._top = 0
+        # Any page still in flight belongs to the old data; the new request supersedes it
+        self._loading = None
+        self._request(0)
+        self._render()
+
+    # Rendering
+
+    def _visible_count(self):
+        return max(1, self.body.winfo_height() // self.row_height + 1)
+
+    def _on_resize(self, event):
+        needed = event.height // self.row_height + 1
+        while len(self._slots) < needed:
+            y = len(self._slots) * self.row_height
+            items = []
+            for col_num in range(len(self.headers)):
+                x = col_num * self.col_width
+                self.body.create_rectangle(x, y, x + self.col_width, y + self.row_height,
+                                           outline="gray")
+                items.append(self.body.create_text(x + self.col_width / 2, y + self.row_height / 2,
+                                                   text="", font=("Arial", 10)))
+            self._slots.append(items)
+        self._render()
+
+    def _render(self):
+        visible = self._visible_count()
+        self._ensure_rows(self._top + visible)
+        for slot_num, items in enumerate(self._slots):
+            row = self.row(self._top + slot_num) if slot_num < visible else None
+            for col_num, item in enumerate(items):
+                if row is None:
+                    text = ""
+                else:
+                    cell = row[col_num]
+                    text = cell if cell is not None else "N/A"
+                self.body.itemconfigure(item, text=text)
+        self._update_scrollbar(visible)
+
+    def _update_scrollbar(self, visible):
+        # While more pages exist, leave room past the known rows so the user
+        # can keep scrolling to pull them in.
+        total = self._known_rows() + (0 if self._exhausted else visible)
+        if total <= 0:
+            self.scrollbar.set(0, 1)
+            return
+        first = self._top / total
+        last = min(1.0, (self._top + visible) / total)
+        self.scrollbar.set(first, last)
+
+    def _max_top(self, visible):
+        return max(0, self._known_rows() - visible + 1)
+
+    def yview(self, *args):
+        """Scrollbar protocol: ("moveto", fraction) or ("scroll", n, what)."""
+        visible = self._visible_count()
+        if args[0] == "moveto":
+            total = self._known_rows() + (0 if self._exhausted else visible)
+            top = int(float(args[1]) * total)
+        else:
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= max(1, visible - 1)
+            top = self._top + step
+        self._ensure_rows(top + visible)
+        self._top = max(0, min(top, self._max_top(visible)))
+        self._render()
+
+    def _on_wheel(self, event):
+        self.yview("scroll", -3 if event.delta > 0 else 3, "units")